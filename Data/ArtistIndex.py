@@ -0,0 +1,267 @@
+import sys
+from itertools import chain
+from typing import Iterable, Iterator, Mapping, Sequence
+
+import numpy as np
+import pandas as pd
+from numpy.typing import NDArray
+
+from Data.SongSnapshot import StringColumn
+
+
+class ArtistIndex:
+    """A dictionary encoding of the artists credited on every song, with
+    an inverted index from each artist to the rows of their songs.
+
+    Each distinct artist name is stored once and identified by an
+    integer code. Both directions are stored in CSR form: the artist
+    codes of song row r are song_artist_codes[song_offsets[r]:song_offsets[r + 1]],
+    and the song rows of artist code a are artist_song_rows[artist_offsets[a]:artist_offsets[a + 1]].
+    """
+
+    # The name of each artist code.
+    artist_names: NDArray[np.object_]
+
+    # The code of each artist name.
+    artist_codes: dict[str, int]
+
+    # The CSR song -> artist codes mapping.
+    song_offsets: NDArray[np.int64]
+    song_artist_codes: NDArray[np.int32]
+
+    # The CSR artist code -> song rows mapping. Rows are ascending for
+    # every artist.
+    artist_offsets: NDArray[np.int64]
+    artist_song_rows: NDArray[np.int32]
+
+    def __init__(
+            self: "ArtistIndex",
+            artist_lists: Sequence[list[str]],
+    ) -> None:
+        """Build the index from the artists credited on each song.
+
+        Parameters:
+            artist_lists (Sequence[list[str]]): The artist names of each song, in row order.
+        """
+
+        song_count: int = len(artist_lists)
+        artist_counts: NDArray[np.int64] = np.fromiter(
+            (len(artists) for artists in artist_lists), dtype=np.int64, count=song_count
+        )
+        self.song_offsets = np.zeros(song_count + 1, dtype=np.int64)
+        np.cumsum(artist_counts, out=self.song_offsets[1:])
+
+        codes: NDArray[np.intp]
+        names: NDArray
+        codes, names = pd.factorize(
+            np.fromiter(chain.from_iterable(artist_lists), dtype=object, count=int(self.song_offsets[-1]))
+        )
+        self.artist_names = np.asarray(names, dtype=object)
+        self.artist_codes = {name: code for code, name in enumerate(self.artist_names)}
+        self.song_artist_codes = codes.astype(np.int32)
+        self._index_artists()
+
+    def _index_artists(self: "ArtistIndex") -> None:
+        """Build the artist -> song rows mapping from the song -> artist
+        codes mapping.
+        """
+
+        # Sorting the (artist, song) pairs by artist groups each artist's
+        # songs together, in ascending row order.
+        song_count: int = len(self.song_offsets) - 1
+        artist_counts: NDArray[np.int64] = np.diff(self.song_offsets)
+        song_rows: NDArray[np.int32] = np.repeat(np.arange(song_count, dtype=np.int32), artist_counts)
+        order: NDArray[np.intp] = np.argsort(self.song_artist_codes, kind="stable")
+        self.artist_song_rows = song_rows[order]
+        self.artist_offsets = np.zeros(len(self.artist_names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.song_artist_codes, minlength=len(self.artist_names)), out=self.artist_offsets[1:])
+
+    def __len__(self: "ArtistIndex") -> int:
+        return len(self.artist_names)
+
+    @property
+    def nbytes(self: "ArtistIndex") -> int:
+        """The approximate memory used by the index."""
+        return (self.song_offsets.nbytes + self.song_artist_codes.nbytes
+                + self.artist_offsets.nbytes + self.artist_song_rows.nbytes
+                + self.artist_names.nbytes + sum(sys.getsizeof(name) for name in self.artist_names))
+
+    def update_rows(
+            self: "ArtistIndex",
+            source_rows: NDArray[np.intp],
+            new_artist_lists: Sequence[list[str]],
+    ) -> None:
+        """Rearrange the index for a changed catalog, such as after
+        SongStore.apply_delta. Unchanged songs keep their encoded artists
+        and only the new artist lists are encoded. Artists left without
+        songs stay in the dictionary.
+
+        Parameters:
+            source_rows (NDArray[np.intp]): For each row of the changed
+                catalog, the current row it is copied from, or -1 for a
+                row taken from new_artist_lists.
+            new_artist_lists (Sequence[list[str]]): The artist names of
+                the -1 rows, in row order.
+        """
+
+        name: str
+        new_counts: NDArray[np.int64] = np.fromiter(
+            (len(artists) for artists in new_artist_lists), dtype=np.int64, count=len(new_artist_lists)
+        )
+        for name in chain.from_iterable(new_artist_lists):
+            if name not in self.artist_codes:
+                self.artist_codes[name] = len(self.artist_codes)
+        if len(self.artist_codes) > len(self.artist_names):
+            self.artist_names = np.concatenate([
+                self.artist_names,
+                np.array(list(self.artist_codes)[len(self.artist_names):], dtype=object),
+            ])
+        new_codes: NDArray[np.int32] = np.fromiter(
+            (self.artist_codes[name] for name in chain.from_iterable(new_artist_lists)),
+            dtype=np.int32, count=int(new_counts.sum()),
+        )
+        new_offsets: NDArray[np.int64] = np.zeros(len(new_artist_lists) + 1, dtype=np.int64)
+        np.cumsum(new_counts, out=new_offsets[1:])
+
+        copied: NDArray[np.bool_] = source_rows >= 0
+        artist_counts: NDArray[np.int64] = np.zeros(len(source_rows), dtype=np.int64)
+        artist_counts[copied] = np.diff(self.song_offsets)[source_rows[copied]]
+        artist_counts[~copied] = new_counts
+        song_offsets: NDArray[np.int64] = np.zeros(len(source_rows) + 1, dtype=np.int64)
+        np.cumsum(artist_counts, out=song_offsets[1:])
+
+        song_artist_codes: NDArray[np.int32] = np.empty(int(song_offsets[-1]), dtype=np.int32)
+        song_artist_codes[StringColumn.get_segments(song_offsets, np.flatnonzero(copied))] = \
+            self.song_artist_codes[StringColumn.get_segments(self.song_offsets, source_rows[copied])]
+        song_artist_codes[StringColumn.get_segments(song_offsets, np.flatnonzero(~copied))] = new_codes
+
+        self.song_offsets = song_offsets
+        self.song_artist_codes = song_artist_codes
+        self._index_artists()
+
+    def get_song_artists(
+            self: "ArtistIndex",
+            row: int,
+    ) -> list[str]:
+        """Return the artist names of one song.
+
+        Parameters:
+            row (int): The song row.
+
+        Returns:
+            The artist names, in credit order.
+        """
+
+        return self.artist_names[self.song_artist_codes[self.song_offsets[row]:self.song_offsets[row + 1]]].tolist()
+
+    def get_codes(
+            self: "ArtistIndex",
+            names: Iterable[str],
+    ) -> NDArray[np.intp]:
+        """Return the codes of the given artist names.
+
+        Parameters:
+            names (Iterable[str]): The artist names.
+
+        Returns:
+            The code of each name, or -1 where the artist is unknown.
+        """
+
+        return np.fromiter((self.artist_codes.get(name, -1) for name in names), dtype=np.intp)
+
+    def get_rows_by_artists(
+            self: "ArtistIndex",
+            names: Iterable[str],
+    ) -> NDArray[np.int32]:
+        """Return the rows of every song credited to any of the given
+        artists.
+
+        Parameters:
+            names (Iterable[str]): The artist names.
+
+        Returns:
+            The ascending, unique song rows.
+        """
+
+        codes: NDArray[np.intp] = self.get_codes(names)
+        codes = codes[codes >= 0]
+        if len(codes) == 0:
+            return np.zeros(0, dtype=np.int32)
+        return np.unique(np.concatenate([
+            self.artist_song_rows[self.artist_offsets[code]:self.artist_offsets[code + 1]] for code in codes
+        ]))
+
+    def get_affinity_scores(
+            self: "ArtistIndex",
+            artist_weights: Mapping[str, float],
+    ) -> tuple[NDArray[np.int32], NDArray[np.float64]]:
+        """Score the songs of the weighted artists by the summed weights
+        of their artists, such as a UserProfile's artist counts. Only the
+        songs of the weighted artists are touched, and nothing the size of
+        the catalog is built.
+
+        Parameters:
+            artist_weights (Mapping[str, float]): The weight of each artist name.
+
+        Returns:
+            The rows of the songs of the weighted artists, in ascending
+            order, and the score of each.
+        """
+
+        codes: NDArray[np.intp] = self.get_codes(artist_weights.keys())
+        weights: NDArray[np.float64] = np.fromiter(artist_weights.values(), dtype=np.float64, count=len(codes))
+        known: NDArray[np.bool_] = codes >= 0
+        codes, weights = codes[known], weights[known]
+
+        counts: NDArray[np.int64] = self.artist_offsets[codes + 1] - self.artist_offsets[codes]
+        rows: NDArray[np.int32] = np.concatenate(
+            [self.artist_song_rows[self.artist_offsets[code]:self.artist_offsets[code + 1]] for code in codes]
+            or [np.zeros(0, dtype=np.int32)]
+        )
+        # A song with several of the artists is summed into one row.
+        touched_rows: NDArray[np.int32]
+        inverse: NDArray[np.intp]
+        touched_rows, inverse = np.unique(rows, return_inverse=True)
+        return touched_rows, np.bincount(inverse, weights=np.repeat(weights, counts), minlength=len(touched_rows))
+
+
+class ArtistListColumn:
+    """A read-only song column of artist name lists that is backed by an
+    ArtistIndex, so each artist name is stored only once.
+    """
+
+    # The index holding the encoded artists.
+    artist_index: ArtistIndex
+
+    def __init__(
+            self: "ArtistListColumn",
+            artist_index: ArtistIndex,
+    ) -> None:
+        """Initialize an ArtistListColumn.
+
+        Parameters:
+            artist_index (ArtistIndex): The index holding the encoded artists.
+        """
+
+        self.artist_index = artist_index
+
+    def __len__(self: "ArtistListColumn") -> int:
+        return len(self.artist_index.song_offsets) - 1
+
+    def __getitem__(
+            self: "ArtistListColumn",
+            row: int | Sequence[int] | NDArray[np.integer],
+    ) -> list[str] | list[list[str]]:
+        if isinstance(row, (int, np.integer)):
+            return self.artist_index.get_song_artists(range(len(self))[row])
+        return [self[i] for i in row]
+
+    def __iter__(self: "ArtistListColumn") -> Iterator[list[str]]:
+        i: int
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def nbytes(self: "ArtistListColumn") -> int:
+        """The approximate memory used by the column."""
+        return self.artist_index.nbytes
@@ -0,0 +1,135 @@
+from collections import Counter
+from typing import Mapping
+
+import numpy as np
+from numpy.typing import NDArray
+
+import Data.constants as c
+
+
+class ValidationReport:
+    """The result of validating a batch of songs: which rows to keep,
+    and how many rows broke each rule.
+    """
+
+    # A mask that is True for every row that passed all rules.
+    keep: NDArray[np.bool_]
+
+    # The number of rows that broke each rule. A row that breaks several
+    # rules is counted once per rule.
+    rejection_counts: Counter[str]
+
+    def __init__(
+            self: "ValidationReport",
+            keep: NDArray[np.bool_],
+            rejection_counts: Counter[str],
+    ) -> None:
+        """Initialize a ValidationReport.
+
+        Parameters:
+            keep (NDArray[np.bool_]): The keep-mask.
+            rejection_counts (Counter[str]): The rejections per rule.
+        """
+
+        self.keep = keep
+        self.rejection_counts = rejection_counts
+
+    def __str__(self: "ValidationReport") -> str:
+        return self.format(len(self.keep), self.rejected_count, self.rejection_counts)
+
+    @property
+    def rejected_count(self: "ValidationReport") -> int:
+        """The number of rows that broke at least one rule."""
+        return int(len(self.keep) - np.count_nonzero(self.keep))
+
+    @staticmethod
+    def format(
+            total_count: int,
+            rejected_count: int,
+            rejection_counts: Counter[str],
+    ) -> str:
+        """Format rejection counts as a readable summary.
+
+        Parameters:
+            total_count (int): The number of rows validated.
+            rejected_count (int): The number of rows rejected.
+            rejection_counts (Counter[str]): The rejections per rule.
+
+        Returns:
+            The summary, with one line per broken rule.
+        """
+
+        lines: list[str] = [f"Rejected {rejected_count:,} of {total_count:,} songs:"]
+        rule: str
+        count: int
+        for rule, count in rejection_counts.most_common():
+            if count:
+                lines.append(f"    {rule:<32} {count:>10,}")
+        return "\n".join(lines)
+
+
+class FeatureValidator:
+    """Checks whole columns of song features against the valid ranges
+    in Data/constants.py, with the same rules as Song.validate_features.
+    """
+
+    # The valid range of each feature.
+    feature_ranges: dict[str, tuple[float, float]]
+
+    # Out-of-range values that are still accepted, by feature.
+    extra_values: dict[str, tuple[float, ...]]
+
+    def __init__(
+            self: "FeatureValidator",
+            feature_ranges: dict[str, tuple[float, float]] = c.FEATURE_RANGES,
+            extra_values: dict[str, tuple[float, ...]] = c.FEATURE_EXTRA_VALUES,
+    ) -> None:
+        """Initialize a FeatureValidator.
+
+        Parameters:
+            feature_ranges (dict[str, tuple[float, float]]):
+                The (minimum, maximum) range of each feature to check.
+            extra_values (dict[str, tuple[float, ...]]):
+                Out-of-range values that are still accepted, by feature.
+        """
+
+        self.feature_ranges = feature_ranges
+        self.extra_values = extra_values
+
+    def validate(
+            self: "FeatureValidator",
+            columns: Mapping[str, NDArray],
+    ) -> ValidationReport:
+        """Validate every row of the given feature columns.
+
+        Parameters:
+            columns (Mapping[str, NDArray]):
+                Row-aligned feature columns, containing at least every
+                feature in feature_ranges. NaN values are always invalid.
+
+        Returns:
+            A ValidationReport with the keep-mask and the number of rows
+            that broke each feature's range.
+        """
+
+        keep: NDArray[np.bool_] | None = None
+        rejection_counts: Counter[str] = Counter()
+
+        feature: str
+        minimum: float
+        maximum: float
+        for feature, (minimum, maximum) in self.feature_ranges.items():
+            values: NDArray = columns[feature]
+            valid: NDArray[np.bool_] = (values >= minimum) & (values <= maximum)
+
+            extra_value: float
+            for extra_value in self.extra_values.get(feature, ()):
+                valid |= values == extra_value
+
+            rejection_counts[feature] = int(len(valid) - np.count_nonzero(valid))
+            keep = valid if keep is None else keep & valid
+
+        if keep is None:
+            keep = np.ones(len(next(iter(columns.values()), ())), dtype=np.bool_)
+
+        return ValidationReport(keep, rejection_counts)
@@ -0,0 +1,346 @@
+import os
+
+import numpy as np
+from numpy.typing import NDArray
+
+
+class IVFIndex:
+    """An inverted file (IVF) index for approximate nearest-neighbour
+    search over song feature vectors, in pure NumPy.
+
+    The vectors are clustered with k-means, and each song is filed under
+    its nearest centroid. A query only scans the songs filed under its
+    `probes` nearest centroids, so more probes trade speed for recall.
+    Optionally, each song is also stored as a product quantization (PQ)
+    code of its residual from the centroid: one byte per subspace, which
+    approximates distances without reading the vectors at all.
+
+    Distances are squared Euclidean. For cosine similarity, build the
+    index over unit-length vectors and query with a unit-length vector.
+    """
+
+    # The default number of k-means iterations.
+    DEFAULT_ITERATIONS: int = 10
+
+    # The default number of vectors sampled to train the centroids.
+    DEFAULT_SAMPLE_SIZE: int = 65_536
+
+    # The number of PQ centroids per subspace, so codes fit in a byte.
+    PQ_CENTROID_COUNT: int = 256
+
+    # The number of PQ candidates per requested result that are re-scored
+    # exactly when the vectors are given.
+    RERANK_FACTOR: int = 4
+
+    # The number of vectors assigned to centroids at a time.
+    BLOCK_ROWS: int = 1 << 14
+
+    # The (list count, dimension) coarse centroids.
+    centroids: NDArray[np.float32]
+
+    # The song rows filed under each centroid, in CSR form: the rows of
+    # list l are list_rows[list_offsets[l]:list_offsets[l + 1]].
+    list_offsets: NDArray[np.int64]
+    list_rows: NDArray[np.int32]
+
+    # The dimensions of each PQ subspace, and its (256, subspace size)
+    # codebook, if the index uses product quantization.
+    pq_dimensions: list[NDArray[np.intp]]
+    pq_codebooks: list[NDArray[np.float32]]
+
+    # The (song count, subspace count) PQ codes, aligned with list_rows.
+    pq_codes: NDArray[np.uint8] | None
+
+    # The catalog version the index was built for.
+    catalog_version: int
+
+    def __init__(
+            self: "IVFIndex",
+            centroids: NDArray[np.float32],
+            list_offsets: NDArray[np.int64],
+            list_rows: NDArray[np.int32],
+            pq_codebooks: list[NDArray[np.float32]] | None = None,
+            pq_codes: NDArray[np.uint8] | None = None,
+            catalog_version: int = 0,
+    ) -> None:
+        """Initialize an IVFIndex from its parts; use build or load to
+        create one.
+
+        Parameters:
+            centroids (NDArray[np.float32]): The coarse centroids.
+            list_offsets (NDArray[np.int64]): The CSR offsets of each list.
+            list_rows (NDArray[np.int32]): The song rows of every list.
+            pq_codebooks (list[NDArray[np.float32]] | None): The PQ codebook of each subspace.
+            pq_codes (NDArray[np.uint8] | None): The PQ code of each entry of list_rows.
+            catalog_version (int): The catalog version the index was built for.
+        """
+
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.pq_codebooks = pq_codebooks or []
+        self.pq_dimensions = self._split_dimensions(centroids.shape[1], len(self.pq_codebooks))
+        self.pq_codes = pq_codes
+        self.catalog_version = catalog_version
+
+    def __len__(self: "IVFIndex") -> int:
+        return len(self.list_rows)
+
+    @classmethod
+    def build(
+            cls: type["IVFIndex"],
+            vectors: NDArray[np.floating],
+            list_count: int | None = None,
+            pq_subspace_count: int = 0,
+            iterations: int = DEFAULT_ITERATIONS,
+            sample_size: int = DEFAULT_SAMPLE_SIZE,
+            seed: int = 0,
+            catalog_version: int = 0,
+    ) -> "IVFIndex":
+        """Cluster the vectors and build the index.
+
+        Parameters:
+            vectors (NDArray[np.floating]): The (song count, dimension) vectors.
+            list_count (int | None): The number of centroids, or None for
+                about the square root of the song count.
+            pq_subspace_count (int): The number of PQ subspaces, or 0 for no PQ.
+            iterations (int): The number of k-means iterations.
+            sample_size (int): The number of vectors used to train the centroids.
+            seed (int): The random seed.
+            catalog_version (int): The catalog version of the vectors.
+
+        Returns:
+            The index.
+        """
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        rng: np.random.Generator = np.random.default_rng(seed)
+        if list_count is None:
+            list_count = max(int(np.sqrt(len(vectors))), 1)
+        list_count = max(min(list_count, len(vectors)), 1)
+
+        sample: NDArray[np.float32] = vectors[rng.choice(len(vectors), min(sample_size, len(vectors)), replace=False)]
+        centroids: NDArray[np.float32] = cls._train_kmeans(sample, list_count, iterations, rng)
+
+        assignments: NDArray[np.intp] = cls._assign(vectors, centroids)
+        list_rows: NDArray[np.int32] = np.argsort(assignments, kind="stable").astype(np.int32)
+        list_offsets: NDArray[np.int64] = np.zeros(list_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=list_count), out=list_offsets[1:])
+
+        pq_codebooks: list[NDArray[np.float32]] = []
+        pq_codes: NDArray[np.uint8] | None = None
+        if pq_subspace_count > 0:
+            residuals: NDArray[np.float32] = vectors[list_rows] - centroids[assignments[list_rows]]
+            pq_codes = np.empty((len(vectors), pq_subspace_count), dtype=np.uint8)
+            dimensions: NDArray[np.intp]
+            i: int
+            for i, dimensions in enumerate(cls._split_dimensions(vectors.shape[1], pq_subspace_count)):
+                subspace: NDArray[np.float32] = np.ascontiguousarray(residuals[:, dimensions])
+                codebook: NDArray[np.float32] = cls._train_kmeans(
+                    subspace[rng.choice(len(subspace), min(sample_size, len(subspace)), replace=False)],
+                    cls.PQ_CENTROID_COUNT, iterations, rng,
+                )
+                pq_codebooks.append(codebook)
+                pq_codes[:, i] = cls._assign(subspace, codebook)
+
+        return cls(centroids, list_offsets, list_rows, pq_codebooks, pq_codes, catalog_version)
+
+    @classmethod
+    def _train_kmeans(
+            cls: type["IVFIndex"],
+            sample: NDArray[np.float32],
+            centroid_count: int,
+            iterations: int,
+            rng: np.random.Generator,
+    ) -> NDArray[np.float32]:
+        """Run Lloyd's k-means on a sample. Centroids that lose all
+        their points are moved to random sample points.
+        """
+
+        centroids: NDArray[np.float32] = sample[rng.choice(len(sample), centroid_count,
+                                                           replace=len(sample) < centroid_count)].copy()
+        _: int
+        for _ in range(iterations):
+            assignments: NDArray[np.intp] = cls._assign(sample, centroids)
+            counts: NDArray[np.int64] = np.bincount(assignments, minlength=centroid_count)
+            sums: NDArray[np.float64] = np.zeros((centroid_count, sample.shape[1]), dtype=np.float64)
+            np.add.at(sums, assignments, sample)
+
+            empty: NDArray[np.bool_] = counts == 0
+            centroids[~empty] = sums[~empty] / counts[~empty, np.newaxis]
+            centroids[empty] = sample[rng.choice(len(sample), int(np.count_nonzero(empty)))]
+        return centroids
+
+    @classmethod
+    def _assign(
+            cls: type["IVFIndex"],
+            vectors: NDArray[np.float32],
+            centroids: NDArray[np.float32],
+    ) -> NDArray[np.intp]:
+        """Return the nearest centroid of every vector."""
+        assignments: NDArray[np.intp] = np.empty(len(vectors), dtype=np.intp)
+        centroid_norms: NDArray[np.float32] = np.einsum("ij,ij->i", centroids, centroids)
+
+        # |v - c|^2 ranks the same as |c|^2 - 2 v.c for a fixed v.
+        start: int
+        for start in range(0, len(vectors), cls.BLOCK_ROWS):
+            block: NDArray[np.float32] = vectors[start:start + cls.BLOCK_ROWS]
+            assignments[start:start + len(block)] = np.argmin(centroid_norms - 2 * (block @ centroids.T), axis=1)
+        return assignments
+
+    @staticmethod
+    def _split_dimensions(
+            dimension: int,
+            subspace_count: int,
+    ) -> list[NDArray[np.intp]]:
+        """Split the dimensions into nearly equal PQ subspaces."""
+        if subspace_count <= 0:
+            return []
+        return np.array_split(np.arange(dimension), subspace_count)
+
+    def search(
+            self: "IVFIndex",
+            query: NDArray[np.floating],
+            top_n: int,
+            probes: int,
+            vectors: NDArray[np.floating] | None = None,
+    ) -> tuple[NDArray[np.intp], NDArray[np.floating]]:
+        """Find the approximate nearest songs to a query vector.
+
+        Parameters:
+            query (NDArray[np.floating]): The query vector.
+            top_n (int): The number of songs to return.
+            probes (int): The number of nearest lists to scan.
+            vectors (NDArray[np.floating] | None): The vectors the index
+                was built from, to score the candidates exactly. Without
+                them, the index must use PQ, and distances are approximate.
+
+        Returns:
+            The rows of the nearest songs found, nearest first, and
+            their squared distances.
+
+        Raises:
+            ValueError: If there are no vectors and no PQ codes to score with.
+        """
+
+        if vectors is None and self.pq_codes is None:
+            raise ValueError("an index without product quantization needs the vectors to score with.")
+
+        query = np.asarray(query, dtype=np.float32)
+        probes = max(min(probes, len(self.centroids)), 1)
+        centroid_distances: NDArray[np.float32] = np.sum((self.centroids - query) ** 2, axis=1)
+        probed_lists: NDArray[np.intp] = np.argpartition(centroid_distances, probes - 1)[:probes]
+
+        # The positions in list_rows of every candidate.
+        starts: NDArray[np.int64] = self.list_offsets[probed_lists]
+        counts: NDArray[np.int64] = self.list_offsets[probed_lists + 1] - starts
+        ends: NDArray[np.int64] = np.cumsum(counts)
+        positions: NDArray[np.int64] = np.repeat(starts - (ends - counts), counts) + np.arange(ends[-1])
+        rows: NDArray[np.intp] = self.list_rows[positions].astype(np.intp)
+
+        if self.pq_codes is not None:
+            distances: NDArray[np.float32] = self._get_pq_distances(query, probed_lists, counts, positions)
+            if vectors is None:
+                return self._select(rows, distances, top_n)
+
+            # Re-score the best PQ candidates exactly.
+            rows, _ = self._select(rows, distances, top_n * self.RERANK_FACTOR)
+
+        candidates: NDArray[np.floating] = np.asarray(vectors[rows], dtype=np.float32)
+        return self._select(rows, np.sum((candidates - query) ** 2, axis=1), top_n)
+
+    def _get_pq_distances(
+            self: "IVFIndex",
+            query: NDArray[np.float32],
+            probed_lists: NDArray[np.intp],
+            counts: NDArray[np.int64],
+            positions: NDArray[np.int64],
+    ) -> NDArray[np.float32]:
+        """Approximate the distances of the candidates with their PQ
+        codes, using one lookup table per subspace and probed list.
+        """
+
+        residuals: NDArray[np.float32] = query - self.centroids[probed_lists]
+        candidate_lists: NDArray[np.intp] = np.repeat(np.arange(len(probed_lists)), counts)
+        distances: NDArray[np.float32] = np.zeros(len(positions), dtype=np.float32)
+
+        i: int
+        dimensions: NDArray[np.intp]
+        for i, dimensions in enumerate(self.pq_dimensions):
+            # tables[l, j] is the distance from the residual of probed
+            # list l to codeword j of this subspace.
+            tables: NDArray[np.float32] = np.sum(
+                (residuals[:, np.newaxis, dimensions] - self.pq_codebooks[i][np.newaxis]) ** 2, axis=2
+            )
+            distances += tables[candidate_lists, self.pq_codes[positions, i]]
+        return distances
+
+    @staticmethod
+    def _select(
+            rows: NDArray[np.intp],
+            distances: NDArray[np.floating],
+            top_n: int,
+    ) -> tuple[NDArray[np.intp], NDArray[np.floating]]:
+        """Return the top_n nearest candidates, nearest first."""
+        top_n = min(top_n, len(rows))
+        if top_n <= 0:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=distances.dtype)
+        nearest: NDArray[np.intp] = np.argpartition(distances, top_n - 1)[:top_n]
+        nearest = nearest[np.lexsort((rows[nearest], distances[nearest]))]
+        return rows[nearest], distances[nearest]
+
+    def save(
+            self: "IVFIndex",
+            path: str,
+    ) -> None:
+        """Write the index to a .npz file.
+
+        Parameters:
+            path (str): The file to write.
+        """
+
+        arrays: dict[str, NDArray] = {
+            "centroids": self.centroids,
+            "list_offsets": self.list_offsets,
+            "list_rows": self.list_rows,
+            "catalog_version": np.array(self.catalog_version),
+        }
+        if self.pq_codes is not None:
+            arrays["pq_codes"] = self.pq_codes
+            arrays["pq_codebooks"] = np.stack(
+                [np.pad(codebook, ((0, 0), (0, self.centroids.shape[1] - codebook.shape[1])))
+                 for codebook in self.pq_codebooks]
+            )
+
+        # Write to a temporary file first, so readers never see a partial index.
+        temp_path: str = path + ".tmp.npz"
+        np.savez(temp_path, **arrays)
+        os.replace(temp_path, path)
+        print(f'Wrote {len(self.centroids):,}-list IVF index of {len(self):,} songs to "{os.path.realpath(path)}".')
+
+    @classmethod
+    def load(
+            cls: type["IVFIndex"],
+            path: str,
+    ) -> "IVFIndex":
+        """Read an index written by save.
+
+        Parameters:
+            path (str): The file to read.
+
+        Returns:
+            The index.
+        """
+
+        arrays: np.lib.npyio.NpzFile
+        with np.load(path) as arrays:
+            centroids: NDArray[np.float32] = arrays["centroids"]
+            pq_codebooks: list[NDArray[np.float32]] = []
+            pq_codes: NDArray[np.uint8] | None = None
+            if "pq_codes" in arrays:
+                pq_codes = arrays["pq_codes"]
+                dimensions: list[NDArray[np.intp]] = cls._split_dimensions(centroids.shape[1], pq_codes.shape[1])
+                pq_codebooks = [codebook[:, :len(subspace)]
+                                for codebook, subspace in zip(arrays["pq_codebooks"], dimensions)]
+            return cls(centroids, arrays["list_offsets"], arrays["list_rows"], pq_codebooks, pq_codes,
+                       int(arrays["catalog_version"]))
@@ -0,0 +1,195 @@
+import numpy as np
+from numpy.typing import NDArray
+
+
+class QuantizedFeatureMatrix:
+    """A song feature matrix stored as one byte per value. Each feature
+    column is mapped linearly onto 0-255 with its own scale and offset,
+    so a value decodes as code * scale + offset.
+
+    The matrix can be used in most places a float feature matrix is:
+    indexing decodes the selected values, and `matrix @ vector` scores
+    the codes directly without decoding the whole matrix.
+    """
+
+    # The number of rows decoded at a time when scoring, which keeps the
+    # temporary float32 block small enough to stay in cache.
+    BLOCK_ROWS: int = 1 << 16
+
+    # The largest code.
+    MAX_CODE: int = np.iinfo(np.uint8).max
+
+    # The (song count, feature count) matrix of codes.
+    codes: NDArray[np.uint8]
+
+    # The scale and offset of each feature column.
+    scale: NDArray[np.float64]
+    offset: NDArray[np.float64]
+
+    def __init__(
+            self: "QuantizedFeatureMatrix",
+            codes: NDArray[np.uint8],
+            scale: NDArray[np.float64],
+            offset: NDArray[np.float64],
+    ) -> None:
+        """Initialize a QuantizedFeatureMatrix from existing codes.
+
+        Parameters:
+            codes (NDArray[np.uint8]): The (song count, feature count) codes.
+            scale (NDArray[np.float64]): The scale of each feature column.
+            offset (NDArray[np.float64]): The offset of each feature column.
+        """
+
+        self.codes = codes
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.offset = np.asarray(offset, dtype=np.float64)
+
+    @classmethod
+    def encode(
+            cls: type["QuantizedFeatureMatrix"],
+            matrix: NDArray[np.floating],
+    ) -> "QuantizedFeatureMatrix":
+        """Quantize a float feature matrix. Each column's range is split
+        into 255 equal steps, so the largest error of a value is half a
+        step.
+
+        Parameters:
+            matrix (NDArray[np.floating]): The (song count, feature count) features.
+
+        Returns:
+            The quantized matrix.
+        """
+
+        if len(matrix) == 0:
+            return cls(np.zeros(matrix.shape, dtype=np.uint8), np.ones(matrix.shape[1]), np.zeros(matrix.shape[1]))
+
+        minimum: NDArray[np.float64] = matrix.min(axis=0).astype(np.float64)
+        maximum: NDArray[np.float64] = matrix.max(axis=0).astype(np.float64)
+        scale: NDArray[np.float64] = (maximum - minimum) / cls.MAX_CODE
+
+        # A constant column decodes exactly with any scale.
+        scale[scale == 0] = 1.0
+        quantized: QuantizedFeatureMatrix = cls(np.zeros(matrix.shape, dtype=np.uint8), scale, minimum)
+        quantized.codes = quantized.encode_rows(matrix)
+        return quantized
+
+    def encode_rows(
+            self: "QuantizedFeatureMatrix",
+            matrix: NDArray[np.floating],
+    ) -> NDArray[np.uint8]:
+        """Quantize rows with this matrix's scale and offset, such as
+        new songs added by a catalog delta. Values outside the encoded
+        range are clipped to it.
+
+        Parameters:
+            matrix (NDArray[np.floating]): The (row count, feature count) features.
+
+        Returns:
+            The codes of the rows.
+        """
+
+        codes: NDArray[np.float64] = np.rint((matrix - self.offset) / self.scale)
+        return np.clip(codes, 0, self.MAX_CODE).astype(np.uint8)
+
+    def __len__(self: "QuantizedFeatureMatrix") -> int:
+        return len(self.codes)
+
+    def __getitem__(
+            self: "QuantizedFeatureMatrix",
+            key: int | slice | NDArray | tuple,
+    ) -> NDArray[np.float64]:
+        # Decode only the selected values; the column part of the key
+        # also selects the matching scales and offsets.
+        column_key: int | slice | NDArray = key[1] if isinstance(key, tuple) else slice(None)
+        return self.codes[key] * self.scale[column_key] + self.offset[column_key]
+
+    def __matmul__(
+            self: "QuantizedFeatureMatrix",
+            vectors: NDArray[np.floating],
+    ) -> NDArray[np.float32]:
+        """Multiply the decoded matrix by a vector, or by a
+        (feature count, k) matrix of vectors. The scale is folded into
+        the vectors and the offset into a constant, so only the codes are
+        read, one block at a time.
+        """
+
+        vectors = np.asarray(vectors, dtype=np.float64)
+        column_shape: tuple[int, ...] = (-1,) + (1,) * (vectors.ndim - 1)
+        weights: NDArray[np.float32] = (vectors * self.scale.reshape(column_shape)).astype(np.float32)
+        result: NDArray[np.float32] = np.empty((len(self),) + vectors.shape[1:], dtype=np.float32)
+
+        start: int
+        for start in range(0, len(self), self.BLOCK_ROWS):
+            block: NDArray[np.uint8] = self.codes[start:start + self.BLOCK_ROWS]
+            np.matmul(block.astype(np.float32), weights, out=result[start:start + len(block)])
+
+        result += (self.offset @ vectors).astype(np.float32)
+        return result
+
+    @property
+    def shape(self: "QuantizedFeatureMatrix") -> tuple[int, int]:
+        """The (song count, feature count) shape."""
+        return self.codes.shape
+
+    @property
+    def dtype(self: "QuantizedFeatureMatrix") -> np.dtype:
+        """The dtype that scores are computed in."""
+        return np.dtype(np.float32)
+
+    @property
+    def nbytes(self: "QuantizedFeatureMatrix") -> int:
+        """The number of bytes used by the codes, scales and offsets."""
+        return self.codes.nbytes + self.scale.nbytes + self.offset.nbytes
+
+    def get_squared_norms(self: "QuantizedFeatureMatrix") -> NDArray[np.float32]:
+        """Return the squared Euclidean norm of every decoded row."""
+        squared_norms: NDArray[np.float32] = np.empty(len(self), dtype=np.float32)
+        scale: NDArray[np.float32] = self.scale.astype(np.float32)
+        offset: NDArray[np.float32] = self.offset.astype(np.float32)
+
+        start: int
+        for start in range(0, len(self), self.BLOCK_ROWS):
+            block: NDArray[np.float32] = self.codes[start:start + self.BLOCK_ROWS] * scale + offset
+            squared_norms[start:start + len(block)] = np.einsum("ij,ij->i", block, block)
+        return squared_norms
+
+    def take_columns(
+            self: "QuantizedFeatureMatrix",
+            indices: list[int],
+    ) -> "QuantizedFeatureMatrix":
+        """Return a contiguous copy of some feature columns.
+
+        Parameters:
+            indices (list[int]): The columns to select, in order.
+
+        Returns:
+            The selected columns, still quantized.
+        """
+
+        return QuantizedFeatureMatrix(
+            np.ascontiguousarray(self.codes[:, indices]), self.scale[indices], self.offset[indices]
+        )
+
+    def take(
+            self: "QuantizedFeatureMatrix",
+            source_rows: NDArray[np.intp],
+            new_rows: NDArray[np.floating],
+    ) -> "QuantizedFeatureMatrix":
+        """Return a matrix with rows copied from this one or quantized
+        from new feature rows, keeping this matrix's scales and offsets.
+
+        Parameters:
+            source_rows (NDArray[np.intp]): For each row of the result,
+                the row of this matrix it is copied from, or -1 for a row
+                taken from new_rows.
+            new_rows (NDArray[np.floating]): The features of the -1 rows, in row order.
+
+        Returns:
+            The rearranged matrix.
+        """
+
+        copied: NDArray[np.bool_] = source_rows >= 0
+        codes: NDArray[np.uint8] = np.empty((len(source_rows), self.codes.shape[1]), dtype=np.uint8)
+        codes[copied] = self.codes[source_rows[copied]]
+        codes[~copied] = self.encode_rows(new_rows)
+        return QuantizedFeatureMatrix(codes, self.scale, self.offset)
@@ -0,0 +1,593 @@
+import ast
+import csv
+import io
+import os
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Sequence
+
+import numpy as np
+import pandas as pd
+from numpy.typing import NDArray
+
+from Data.FeatureValidator import FeatureValidator, ValidationReport
+
+
+class SongCsvLoader:
+    """Parses a Spotify tracks CSV file into typed columns.
+
+    The file is read in chunks by the pandas C parser and every field is
+    converted and validated a whole column at a time, instead of building
+    and validating one Song per row. A row is discarded under the same
+    rules as constructing a Song from it: an integer field that int()
+    would reject, a float field that float() would reject, or a feature
+    outside its valid range.
+    """
+
+    # The number of CSV rows parsed per chunk.
+    DEFAULT_CHUNK_SIZE: int = 100_000
+
+    # The default number of worker processes.
+    DEFAULT_WORKERS: int = 1
+
+    # The number of bytes read at a time while looking for shard bounds
+    # and row offsets.
+    SHARD_SCAN_BLOCK_SIZE: int = 1 << 24
+    ROW_SCAN_BLOCK_SIZE: int = 1 << 22
+
+    # The fields parsed as integers.
+    INT_COLUMNS: list[str] = ["track_number", "disc_number", "key", "mode", "duration_ms", "year"]
+
+    # The fields parsed as floats.
+    FLOAT_COLUMNS: list[str] = [
+        "danceability",
+        "energy",
+        "loudness",
+        "speechiness",
+        "acousticness",
+        "instrumentalness",
+        "liveness",
+        "valence",
+        "tempo",
+        "time_signature",
+    ]
+
+    # The fields kept as strings.
+    STRING_COLUMNS: list[str] = ["id", "name", "album", "album_id", "release_date"]
+
+    # The fields holding string representations of lists.
+    LIST_COLUMNS: list[str] = ["artists", "artist_ids"]
+
+    # The display fields that a features-only load skips. They can be
+    # read later with load_rows or load_column.
+    METADATA_COLUMNS: list[str] = ["name", "album", "album_id", "artists", "artist_ids", "release_date"]
+
+    # The column holding the byte offset of each row in a features-only load.
+    ROW_OFFSET_COLUMN: str = "row_offset"
+
+    # The delta file field naming the change made to each track, and the
+    # value that marks a removed track. Any other value (such as "add"
+    # or "update") adds the track, or replaces it if it already exists.
+    CHANGE_COLUMN: str = "change"
+    CHANGE_REMOVE: str = "remove"
+
+    # The strings accepted by int(), without digit separators.
+    INT_PATTERN: str = r"\s*[+-]?\d+\s*"
+
+    # A quoted item of a list such as "['Artist1', \"Artist's 2\"]".
+    LIST_ITEM_PATTERN: re.Pattern = re.compile(r"'([^']*)'|\"([^\"]*)\"")
+
+    # The path to the CSV file.
+    file_path: str
+
+    # The number of CSV rows parsed per chunk.
+    chunk_size: int
+
+    # The number of worker processes that parse shards of the file.
+    workers: int
+
+    # Whether to skip the metadata fields and record row offsets instead.
+    features_only: bool
+
+    # The validator applied to every chunk.
+    validator: FeatureValidator
+
+    # The number of rows read and discarded by the last load.
+    total_song_count: int
+    invalid_song_count: int
+
+    # The number of rows of the last load that broke each rule.
+    rejection_counts: Counter[str]
+
+    def __init__(
+            self: "SongCsvLoader",
+            file_path: str,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            workers: int = DEFAULT_WORKERS,
+            features_only: bool = False,
+    ) -> None:
+        """Initialize a SongCsvLoader.
+
+        Parameters:
+            file_path (str): The path to the CSV file.
+            chunk_size (int): The number of CSV rows parsed per chunk.
+            workers (int): The number of worker processes that parse
+                shards of the file in parallel.
+            features_only (bool): Whether to skip the METADATA_COLUMNS
+                and load the byte offset of each row instead.
+        """
+
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self.workers = max(workers, 1)
+        self.features_only = features_only
+        self.validator = FeatureValidator()
+        self.total_song_count = 0
+        self.invalid_song_count = 0
+        self.rejection_counts = Counter()
+
+    def load(self: "SongCsvLoader") -> dict[str, NDArray]:
+        """Load every valid song in the file. With more than one worker,
+        the file is split into shards that are parsed in parallel by
+        separate processes and joined back in file order.
+
+        Returns:
+            The song fields by name. Integer fields are int64 arrays,
+            float fields are float64 arrays, string and list fields are
+            object arrays, and all columns are row-aligned. A
+            features-only load has a ROW_OFFSET_COLUMN of int64 byte
+            offsets instead of the METADATA_COLUMNS.
+        """
+
+        print(f'\nBeginning data load from "{self.file_path}"...')
+
+        shards: list[tuple[int, int]] = self._find_shards(self.workers)
+        results: list[tuple[dict[str, NDArray], int, int, Counter[str]]]
+        if len(shards) > 1:
+            print(f" Parsing {len(shards)} shards in parallel worker processes...")
+            executor: ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+                results = list(executor.map(self._load_shard, shards))
+        else:
+            results = [self._load_shard(shard) for shard in shards]
+
+        self.total_song_count = sum(result[1] for result in results)
+        self.invalid_song_count = sum(result[2] for result in results)
+        self.rejection_counts = sum((result[3] for result in results), Counter())
+
+        columns: dict[str, NDArray] = self._concatenate([result[0] for result in results if result[0]])
+        if not columns:
+            columns = self._get_empty_columns()
+        print(f'\nSuccessfully loaded {self.total_song_count - self.invalid_song_count:,} of '
+              f'{self.total_song_count:,} songs from "{self.file_path}".')
+        if self.invalid_song_count:
+            print(ValidationReport.format(self.total_song_count, self.invalid_song_count, self.rejection_counts))
+
+        return columns
+
+    def load_delta(self: "SongCsvLoader") -> tuple[dict[str, NDArray], list[str]]:
+        """Load a delta file of catalog changes. A delta file has the same
+        fields as a tracks CSV plus a CHANGE_COLUMN field; removed tracks
+        only need their id. Added and updated songs are validated like a
+        full load, and invalid ones are discarded.
+
+        Returns:
+            The valid added and updated songs as typed columns, in file
+            order, and the IDs of the removed tracks.
+        """
+
+        print(f'\nBeginning delta load from "{self.file_path}"...')
+        self.total_song_count = 0
+        self.invalid_song_count = 0
+        self.rejection_counts = Counter()
+
+        # Delta files are small, so they are read in one go, all as strings.
+        frame: pd.DataFrame = pd.read_csv(
+            self.file_path, dtype=str, keep_default_na=False, na_filter=False, encoding="utf-8",
+            float_precision="round_trip"
+        )
+        removed: NDArray[np.bool_] = np.zeros(len(frame), dtype=np.bool_)
+        if self.CHANGE_COLUMN in frame:
+            removed = (frame[self.CHANGE_COLUMN].str.strip().str.lower() == self.CHANGE_REMOVE).to_numpy(dtype=np.bool_)
+        removed_ids: list[str] = frame["id"][removed].tolist()
+        # A delta of removals only may have no other fields.
+        name: str
+        for name in self.INT_COLUMNS + self.FLOAT_COLUMNS + self.STRING_COLUMNS + self.LIST_COLUMNS + ["explicit"]:
+            if name not in frame:
+                frame[name] = ""
+        columns: dict[str, NDArray] = self._parse_chunk(frame[~removed].reset_index(drop=True))
+
+        print(f"Loaded {self.total_song_count - self.invalid_song_count:,} added or updated songs and "
+              f"{len(removed_ids):,} removed tracks.")
+        if self.invalid_song_count:
+            print(ValidationReport.format(self.total_song_count, self.invalid_song_count, self.rejection_counts))
+
+        return columns, removed_ids
+
+    def _find_shards(
+            self: "SongCsvLoader",
+            shard_count: int,
+    ) -> list[tuple[int, int]]:
+        """Split the data rows of the file into byte ranges of about
+        equal size. Each range ends at a row boundary: a newline with an
+        even number of double quotes before it, so a quoted field that
+        contains a newline is never split.
+
+        Parameters:
+            shard_count (int): The number of shards to aim for.
+
+        Returns:
+            The (start, end) byte range of each non-empty shard, in file order.
+        """
+
+        file_size: int = os.path.getsize(self.file_path)
+        file: BinaryIO
+        with open(self.file_path, "rb") as file:
+            header_size: int = len(file.readline())
+            bounds: list[int] = [header_size]
+            position: int = header_size
+            quote_count: int = 0
+
+            i: int
+            for i in range(1, shard_count):
+                target: int = header_size + (file_size - header_size) * i // shard_count
+                if target <= position:
+                    continue
+
+                # Count the quotes up to the target, then finish the row.
+                while position < target:
+                    block: bytes = file.read(min(self.SHARD_SCAN_BLOCK_SIZE, target - position))
+                    quote_count += block.count(b'"')
+                    position += len(block)
+                while position < file_size:
+                    line: bytes = file.readline()
+                    quote_count += line.count(b'"')
+                    position += len(line)
+                    if quote_count % 2 == 0:
+                        break
+                bounds.append(position)
+
+        bounds.append(file_size)
+        return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+    def _load_shard(
+            self: "SongCsvLoader",
+            shard: tuple[int, int],
+    ) -> tuple[dict[str, NDArray], int, int, Counter[str]]:
+        """Parse and validate one byte range of the file. This runs in a
+        worker process when loading with several workers.
+
+        Parameters:
+            shard (tuple[int, int]): The (start, end) byte range of whole rows.
+
+        Returns:
+            The valid rows as typed columns, the number of rows read, the
+            number discarded, and the number that broke each rule.
+        """
+
+        self.total_song_count = 0
+        self.invalid_song_count = 0
+        self.rejection_counts = Counter()
+
+        start: int
+        end: int
+        start, end = shard
+        file_size: int = os.path.getsize(self.file_path)
+        chunks: list[dict[str, NDArray]] = []
+
+        row_offsets: NDArray[np.int64] | None = self.find_row_offsets(start, end) if self.features_only else None
+        row_count: int = 0
+        skipped_columns: list[str] = self.METADATA_COLUMNS if self.features_only else []
+
+        file: BinaryIO
+        with open(self.file_path, "rb") as file:
+            header: bytes = file.readline()
+            show_progress: bool = start == len(header) and end == file_size
+
+            # A shard is parsed from memory, with the header row in front.
+            stream: BinaryIO = file
+            if not show_progress:
+                file.seek(start)
+                stream = io.BytesIO(header + file.read(end - start))
+            else:
+                file.seek(0)
+
+            frame: pd.DataFrame
+            # Float fields are left to the C parser's own number conversion,
+            # in its round-trip mode, which gives the same values as float();
+            # everything else is read as raw strings.
+            for frame in pd.read_csv(
+                    stream,
+                    dtype={name: str for name in self.INT_COLUMNS + self.STRING_COLUMNS + self.LIST_COLUMNS
+                           + ["explicit"]},
+                    usecols=lambda name: name not in skipped_columns,
+                    keep_default_na=False,
+                    na_filter=False,
+                    encoding="utf-8",
+                    float_precision="round_trip",
+                    chunksize=self.chunk_size,
+            ):
+                if row_offsets is not None:
+                    frame[self.ROW_OFFSET_COLUMN] = row_offsets[row_count:row_count + len(frame)]
+                row_count += len(frame)
+                chunks.append(self._parse_chunk(frame))
+                if show_progress:
+                    print(
+                        f"\r ({min(file.tell() / max(file_size, 1), 1):.0%}) Loaded {self.total_song_count:,} songs "
+                        f"({self.invalid_song_count:,} invalid songs discarded)...",
+                        end="")
+
+        if row_offsets is not None and len(row_offsets) != row_count:
+            raise ValueError(f'found {len(row_offsets):,} row offsets for {row_count:,} rows in "{self.file_path}"')
+
+        return self._concatenate(chunks), self.total_song_count, self.invalid_song_count, self.rejection_counts
+
+    def find_row_offsets(
+            self: "SongCsvLoader",
+            start: int | None = None,
+            end: int | None = None,
+    ) -> NDArray[np.int64]:
+        """Find the byte offset of every row in a range of the file. A
+        row ends at a newline with an even number of double quotes before
+        it, and empty lines are not rows, as in pandas.
+
+        Parameters:
+            start (int | None): The offset of the first row, or None for
+                the first row after the header.
+            end (int | None): The end of the range, or None for the end of the file.
+
+        Returns:
+            The ascending row offsets.
+        """
+
+        file_size: int = os.path.getsize(self.file_path)
+        row_ends: list[NDArray[np.int64]] = []
+        quote_count: int = 0
+
+        file: BinaryIO
+        with open(self.file_path, "rb") as file:
+            if start is None:
+                start = len(file.readline())
+            end = file_size if end is None else end
+            file.seek(start)
+            position: int = start
+            while position < end:
+                block: NDArray[np.uint8] = np.frombuffer(
+                    file.read(min(self.ROW_SCAN_BLOCK_SIZE, end - position)), dtype=np.uint8
+                )
+                quote_counts: NDArray[np.int64] = np.cumsum(block == ord('"')) + quote_count
+                row_ends.append(np.flatnonzero((block == ord("\n")) & (quote_counts % 2 == 0)) + position)
+                quote_count = int(quote_counts[-1])
+                position += len(block)
+
+            ends: NDArray[np.int64] = np.concatenate(row_ends + [np.array([end], dtype=np.int64)])
+            starts: NDArray[np.int64] = np.concatenate([np.array([start], dtype=np.int64), ends[:-1] + 1])
+
+            # Skip empty lines, including lone "\r" line endings.
+            empty: NDArray[np.bool_] = ends <= starts
+            candidate: int
+            for candidate in np.flatnonzero(ends - starts == 1):
+                file.seek(starts[candidate])
+                empty[candidate] = file.read(1) == b"\r"
+
+        return starts[~empty]
+
+    def load_rows(
+            self: "SongCsvLoader",
+            row_offsets: Sequence[int] | NDArray[np.integer],
+            names: list[str] = METADATA_COLUMNS,
+    ) -> dict[str, NDArray]:
+        """Read a few rows at known byte offsets, such as the metadata of
+        songs loaded with features_only.
+
+        Parameters:
+            row_offsets (Sequence[int] | NDArray[np.integer]): The byte offset of each row.
+            names (list[str]): The string or list fields to read.
+
+        Returns:
+            The fields by name, as object arrays aligned with row_offsets.
+        """
+
+        columns: dict[str, NDArray] = {name: np.empty(len(row_offsets), dtype=object) for name in names}
+
+        file: BinaryIO
+        with open(self.file_path, "rb") as file:
+            header: list[str] = next(csv.reader([file.readline().decode("utf-8")]))
+            indices: list[int] = [header.index(name) for name in names]
+
+            i: int
+            row_offset: int
+            for i, row_offset in enumerate(row_offsets):
+                file.seek(int(row_offset))
+                reader: io.TextIOWrapper = io.TextIOWrapper(file, encoding="utf-8", newline="")
+                fields: list[str] = next(csv.reader(reader))
+                reader.detach()
+
+                name: str
+                index: int
+                for name, index in zip(names, indices):
+                    columns[name][i] = self._parse_list(fields[index]) if name in self.LIST_COLUMNS else fields[index]
+
+        return columns
+
+    def load_column(
+            self: "SongCsvLoader",
+            name: str,
+            row_offsets: NDArray[np.int64],
+    ) -> NDArray:
+        """Read one string or list field for the rows of a features-only
+        load.
+
+        Parameters:
+            name (str): The field to read.
+            row_offsets (NDArray[np.int64]): The byte offsets of the loaded rows.
+
+        Returns:
+            The field as an object array aligned with row_offsets.
+        """
+
+        print(f'Loading "{name}" from "{self.file_path}"...')
+        rows: NDArray[np.intp] = np.searchsorted(self.find_row_offsets(), row_offsets)
+        fields: NDArray = pd.read_csv(
+            self.file_path, usecols=[name], dtype=str, keep_default_na=False, na_filter=False, encoding="utf-8",
+            float_precision="round_trip"
+        )[name].to_numpy(dtype=object)[rows]
+        if name not in self.LIST_COLUMNS:
+            return fields
+
+        parsed_lists: dict[str, list[str]] = {field: self._parse_list(field) for field in set(fields)}
+        return np.fromiter((parsed_lists[field] for field in fields), dtype=object, count=len(fields))
+
+    def _parse_chunk(
+            self: "SongCsvLoader",
+            frame: pd.DataFrame,
+    ) -> dict[str, NDArray]:
+        """Convert and validate one chunk of raw CSV fields, dropping the
+        invalid rows.
+
+        Parameters:
+            frame (pd.DataFrame): The chunk, with float fields as parsed
+                by the C parser and every other field as a string.
+
+        Returns:
+            The valid rows of the chunk as typed columns.
+        """
+
+        keep: NDArray[np.bool_] = np.ones(len(frame), dtype=np.bool_)
+        columns: dict[str, NDArray] = {}
+
+        name: str
+        for name in self.INT_COLUMNS:
+            parsable: NDArray[np.bool_]
+            columns[name], parsable = self._parse_ints(frame[name])
+            keep &= parsable
+            self.rejection_counts[f"{name} (not an integer)"] += int(len(parsable) - np.count_nonzero(parsable))
+
+        for name in self.FLOAT_COLUMNS:
+            columns[name] = self._parse_floats(frame[name])
+
+        columns["explicit"] = (frame["explicit"].str.lower() == "true").to_numpy(dtype=np.bool_)
+
+        for name in self.STRING_COLUMNS:
+            if name in frame:
+                columns[name] = frame[name].to_numpy(dtype=object)
+
+        if self.ROW_OFFSET_COLUMN in frame:
+            columns[self.ROW_OFFSET_COLUMN] = frame[self.ROW_OFFSET_COLUMN].to_numpy(dtype=np.int64)
+
+        for name in self.LIST_COLUMNS:
+            if name not in frame:
+                continue
+            # Songs from the same album usually share the same list, so
+            # each distinct field is only parsed once.
+            fields: NDArray = frame[name].to_numpy(dtype=object)
+            parsed_lists: dict[str, list[str]] = {field: self._parse_list(field) for field in set(fields)}
+            columns[name] = np.fromiter((parsed_lists[field] for field in fields), dtype=object, count=len(fields))
+
+        report: ValidationReport = self.validator.validate(columns)
+        keep &= report.keep
+        self.rejection_counts.update(report.rejection_counts)
+
+        self.total_song_count += len(frame)
+        self.invalid_song_count += int(len(frame) - np.count_nonzero(keep))
+
+        return {name: column[keep] for name, column in columns.items()}
+
+    @classmethod
+    def _parse_ints(
+            cls: type["SongCsvLoader"],
+            field: pd.Series,
+    ) -> tuple[NDArray[np.int64], NDArray[np.bool_]]:
+        """Parse a column of integer strings.
+
+        Parameters:
+            field (pd.Series): The raw strings.
+
+        Returns:
+            The parsed values (0 where unparsable) and a mask that is
+            True where the string is a valid integer.
+        """
+
+        # Fast path: every string in the column is an integer.
+        try:
+            values: pd.Series = pd.to_numeric(field)
+            if values.dtype == np.int64:
+                return values.to_numpy(), np.ones(len(field), dtype=np.bool_)
+        except (ValueError, TypeError):
+            pass
+
+        parsable: NDArray[np.bool_] = field.str.fullmatch(cls.INT_PATTERN).to_numpy(dtype=np.bool_)
+        values = pd.to_numeric(field.str.strip().where(parsable, "0"))
+        return values.to_numpy(dtype=np.int64), parsable
+
+    @staticmethod
+    def _parse_floats(
+            field: pd.Series,
+    ) -> NDArray[np.float64]:
+        """Parse a column of floats. The C parser has already converted
+        the column unless some value in the chunk was not a number, in
+        which case those values become NaN, which always fails validation.
+        Strings are converted as float() converts them; pd.to_numeric
+        can be off by an ulp, so it only finds the values that aren't
+        numbers.
+
+        Parameters:
+            field (pd.Series): The column as read by the C parser.
+
+        Returns:
+            The parsed values.
+        """
+
+        if pd.api.types.is_numeric_dtype(field.dtype):
+            return field.to_numpy(dtype=np.float64)
+        try:
+            return field.astype(np.float64).to_numpy()
+        except (ValueError, TypeError):
+            numeric: NDArray[np.bool_] = pd.to_numeric(field, errors="coerce").notna().to_numpy()
+            values: NDArray[np.float64] = np.full(len(field), np.nan)
+            values[numeric] = field[numeric].astype(np.float64).to_numpy()
+            return values
+
+    def _get_empty_columns(self: "SongCsvLoader") -> dict[str, NDArray]:
+        """Return the typed columns of a load without any rows, such as
+        of a file with a header only."""
+        skipped_columns: list[str] = self.METADATA_COLUMNS if self.features_only else []
+        frame: pd.DataFrame = pd.DataFrame({
+            name: pd.Series(dtype=object)
+            for name in self.INT_COLUMNS + self.FLOAT_COLUMNS + self.STRING_COLUMNS + self.LIST_COLUMNS + ["explicit"]
+            if name not in skipped_columns
+        })
+        if self.features_only:
+            frame[self.ROW_OFFSET_COLUMN] = pd.Series(dtype=np.int64)
+        return self._parse_chunk(frame)
+
+    @staticmethod
+    def _concatenate(
+            chunks: list[dict[str, NDArray]],
+    ) -> dict[str, NDArray]:
+        """Join the parsed chunks into one array per column."""
+        if not chunks:
+            return {}
+        return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+    @classmethod
+    def _parse_list(
+            cls: type["SongCsvLoader"],
+            field: str,
+    ) -> list[str]:
+        """Helper method to parse string fields that represent lists
+        (e.g., ['Rage Against The Machine']).
+
+        Fields without escape sequences are split with a regular
+        expression; anything else falls back to ast.literal_eval.
+
+        :param field: A string representation of a list (e.g., "['Artist1', 'Artist2']")
+        :return: A list of strings.
+        """
+        if "\\" not in field and field.startswith("[") and field.endswith("]"):
+            return [single or double for single, double in cls.LIST_ITEM_PATTERN.findall(field)]
+        try:
+            return ast.literal_eval(field)
+        except Exception:
+            return []
@@ -0,0 +1,409 @@
+import json
+import os
+import shutil
+from typing import BinaryIO, Iterable, Iterator, Sequence, TextIO
+
+import numpy as np
+from numpy.typing import NDArray
+
+from Data.QuantizedFeatureMatrix import QuantizedFeatureMatrix
+
+
+class StringColumn:
+    """A read-only column of strings stored as a single UTF-8 blob and
+    an array of offsets into it. The string at row i is the blob slice
+    [offsets[i], offsets[i + 1]), so both arrays can be memory-mapped
+    and nothing is decoded until a row is actually read.
+    """
+
+    # The start offset of each string, plus a final end offset.
+    offsets: NDArray[np.int64]
+
+    # The concatenated UTF-8 bytes of every string.
+    blob: NDArray[np.uint8]
+
+    def __init__(
+            self: "StringColumn",
+            offsets: NDArray[np.int64],
+            blob: NDArray[np.uint8],
+    ) -> None:
+        """Initialize a StringColumn.
+
+        Parameters:
+            offsets (NDArray[np.int64]): The row offsets into the blob.
+            blob (NDArray[np.uint8]): The concatenated UTF-8 string data.
+        """
+
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self: "StringColumn") -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(
+            self: "StringColumn",
+            row: int | Sequence[int] | NDArray[np.integer],
+    ) -> str | list[str]:
+        if isinstance(row, (int, np.integer)):
+            row = range(len(self))[row]
+            return self._decode(self.blob[self.offsets[row]:self.offsets[row + 1]].tobytes())
+        return [self[i] for i in row]
+
+    def __iter__(self: "StringColumn") -> Iterator[str]:
+        i: int
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def nbytes(self: "StringColumn") -> int:
+        """The number of bytes used by the offsets and the blob."""
+        return self.offsets.nbytes + self.blob.nbytes
+
+    def take(
+            self: "StringColumn",
+            source_rows: NDArray[np.intp],
+            new_values: Sequence,
+    ) -> "StringColumn":
+        """Return an in-memory column with rows copied from this column
+        or from new values, without decoding the copied rows.
+
+        Parameters:
+            source_rows (NDArray[np.intp]): For each row of the result,
+                the row of this column it is copied from, or -1 for a
+                row taken from new_values.
+            new_values (Sequence): The values of the -1 rows, in row order.
+
+        Returns:
+            A column of the same type as this one.
+        """
+
+        new_offsets: NDArray[np.int64]
+        new_blob: bytes
+        new_offsets, new_blob = self.encode(new_values)
+
+        copied: NDArray[np.bool_] = source_rows >= 0
+        lengths: NDArray[np.int64] = np.zeros(len(source_rows), dtype=np.int64)
+        lengths[copied] = np.diff(self.offsets)[source_rows[copied]]
+        lengths[~copied] = np.diff(new_offsets)
+        offsets: NDArray[np.int64] = np.zeros(len(source_rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        blob: NDArray[np.uint8] = np.empty(int(offsets[-1]), dtype=np.uint8)
+        blob[self.get_segments(offsets, np.flatnonzero(copied))] = \
+            self.blob[self.get_segments(self.offsets, source_rows[copied])]
+        blob[self.get_segments(offsets, np.flatnonzero(~copied))] = np.frombuffer(new_blob, dtype=np.uint8)
+        return type(self)(offsets, blob)
+
+    @staticmethod
+    def get_segments(
+            offsets: NDArray[np.int64],
+            rows: NDArray[np.integer],
+    ) -> NDArray[np.int64]:
+        """Return the flat positions of the given rows of an offsets
+        array, one row after another. This also works for other
+        offset-encoded (CSR) data, such as ArtistIndex.
+
+        Parameters:
+            offsets (NDArray[np.int64]): The start offset of each row, plus a final end offset.
+            rows (NDArray[np.integer]): The rows to gather.
+
+        Returns:
+            The positions of every item of the rows, in order.
+        """
+        starts: NDArray[np.int64] = offsets[rows]
+        lengths: NDArray[np.int64] = offsets[rows + 1] - starts
+        ends: NDArray[np.int64] = np.cumsum(lengths)
+        return np.repeat(starts - (ends - lengths), lengths) + np.arange(ends[-1] if len(ends) else 0)
+
+    def _decode(
+            self: "StringColumn",
+            data: bytes,
+    ) -> str:
+        """Decode a single row's bytes."""
+        return data.decode("utf-8")
+
+    @staticmethod
+    def encode(
+            values: Iterable[str],
+    ) -> tuple[NDArray[np.int64], bytes]:
+        """Encode strings into an offset array and a UTF-8 blob.
+
+        Parameters:
+            values (Iterable[str]): The strings to encode, in row order.
+
+        Returns:
+            The offset array and the blob bytes.
+        """
+
+        encoded: list[bytes] = [("" if value is None else value).encode("utf-8") for value in values]
+        offsets: NDArray[np.int64] = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(data) for data in encoded], out=offsets[1:])
+        return offsets, b"".join(encoded)
+
+
+class StringListColumn(StringColumn):
+    """A StringColumn whose rows are lists of strings, such as the
+    artists credited on each song. Each row is stored as its items
+    joined by SEPARATOR.
+    """
+
+    # An ASCII unit separator, which never occurs in song metadata.
+    SEPARATOR: str = "\x1f"
+
+    def _decode(
+            self: "StringListColumn",
+            data: bytes,
+    ) -> list[str]:
+        """Decode a single row's bytes into a list of strings."""
+        return data.decode("utf-8").split(self.SEPARATOR) if data else []
+
+    @staticmethod
+    def encode(
+            values: Iterable[list[str]],
+    ) -> tuple[NDArray[np.int64], bytes]:
+        """Encode lists of strings into an offset array and a UTF-8 blob.
+
+        Parameters:
+            values (Iterable[list[str]]): The lists to encode, in row order.
+
+        Returns:
+            The offset array and the blob bytes.
+        """
+
+        return StringColumn.encode(StringListColumn.SEPARATOR.join(value or []) for value in values)
+
+
+class SongSnapshotWriter:
+    """Writes a song catalog to a snapshot directory that
+    SongSnapshotReader can memory-map.
+
+    The directory holds a manifest.json describing the columns, one .npy
+    file per numeric column (including the feature matrix), and an
+    .offsets.npy/.blob pair per string column. A quantized feature matrix
+    is stored as its codes, with the scales and offsets in the manifest.
+    """
+
+    # The snapshot format written by this class.
+    FORMAT_VERSION: int = 1
+
+    # The snapshot directory path.
+    path: str
+
+    def __init__(
+            self: "SongSnapshotWriter",
+            path: str,
+    ) -> None:
+        """Initialize a SongSnapshotWriter.
+
+        Parameters:
+            path (str): The snapshot directory to write.
+        """
+
+        self.path = path
+
+    def write(
+            self: "SongSnapshotWriter",
+            feature_columns: list[str],
+            feature_matrix: NDArray[np.floating] | QuantizedFeatureMatrix,
+            numeric_columns: dict[str, NDArray],
+            string_columns: dict[str, Sequence[str]],
+            list_columns: dict[str, Sequence[list[str]]],
+            catalog_version: int = 0,
+    ) -> None:
+        """Write the snapshot. The snapshot is assembled in a temporary
+        directory, the current snapshot is renamed aside to a .old
+        directory, and the new one is renamed into place, so readers never
+        see a partially written catalog. Between the two renames the path
+        briefly does not exist, and a reader opening it then fails and
+        should keep using the snapshot it has open. The .old directory is
+        removed last; a writer that dies during the swap leaves it behind,
+        and the next write replaces it.
+
+        Parameters:
+            feature_columns (list[str]): The feature names of the matrix columns.
+            feature_matrix (NDArray[np.floating] | QuantizedFeatureMatrix):
+                The (song count, feature count) feature matrix.
+            numeric_columns (dict[str, NDArray]): The other numeric columns by name.
+            string_columns (dict[str, Sequence[str]]): The string columns by name.
+            list_columns (dict[str, Sequence[list[str]]]): The string list columns by name.
+            catalog_version (int): The number of deltas applied to the catalog.
+        """
+
+        temp_path: str = self.path + ".tmp"
+        if os.path.exists(temp_path):
+            shutil.rmtree(temp_path)
+        os.makedirs(temp_path)
+
+        quantized: bool = isinstance(feature_matrix, QuantizedFeatureMatrix)
+        np.save(os.path.join(temp_path, "feature_matrix.npy"),
+                np.ascontiguousarray(feature_matrix.codes if quantized else feature_matrix))
+
+        name: str
+        column: NDArray
+        for name, column in numeric_columns.items():
+            np.save(os.path.join(temp_path, f"{name}.npy"), np.ascontiguousarray(column))
+
+        # Columns that are already encoded are written as they are.
+        values: Sequence
+        for name, values in string_columns.items():
+            if type(values) is StringColumn:
+                self._write_strings(temp_path, name, values.offsets, values.blob.tobytes())
+            else:
+                self._write_strings(temp_path, name, *StringColumn.encode(values))
+        for name, values in list_columns.items():
+            if isinstance(values, StringListColumn):
+                self._write_strings(temp_path, name, values.offsets, values.blob.tobytes())
+            else:
+                self._write_strings(temp_path, name, *StringListColumn.encode(values))
+
+        manifest: dict = {
+            "format_version": self.FORMAT_VERSION,
+            "song_count": int(feature_matrix.shape[0]),
+            "catalog_version": catalog_version,
+            "feature_columns": list(feature_columns),
+            "numeric_columns": {name: str(column.dtype) for name, column in numeric_columns.items()},
+            "string_columns": list(string_columns),
+            "list_columns": list(list_columns),
+        }
+        if quantized:
+            manifest["feature_quantization"] = {
+                "scale": feature_matrix.scale.tolist(),
+                "offset": feature_matrix.offset.tolist(),
+            }
+        file: TextIO
+        with open(os.path.join(temp_path, "manifest.json"), "w", encoding="utf-8") as file:
+            json.dump(manifest, file, indent=4)
+
+        # Only renames touch the snapshot path; a .old directory without a
+        # snapshot beside it is the last complete one, so it is kept until
+        # the new one is in place.
+        old_path: str = self.path + ".old"
+        if os.path.exists(self.path):
+            if os.path.exists(old_path):
+                shutil.rmtree(old_path)
+            os.replace(self.path, old_path)
+        os.replace(temp_path, self.path)
+        # Readers may still have the old files mapped, which some platforms
+        # won't delete; a leftover is removed by the next write.
+        shutil.rmtree(old_path, ignore_errors=True)
+
+        print(f'Wrote snapshot of {manifest["song_count"]:,} songs (catalog version {catalog_version}) '
+              f'to "{os.path.realpath(self.path)}".')
+
+    @staticmethod
+    def _write_strings(
+            path: str,
+            name: str,
+            offsets: NDArray[np.int64],
+            blob: bytes,
+    ) -> None:
+        """Write one encoded string column."""
+        np.save(os.path.join(path, f"{name}.offsets.npy"), offsets)
+        file: BinaryIO
+        with open(os.path.join(path, f"{name}.blob"), "wb") as file:
+            file.write(blob)
+
+
+class SongSnapshotReader:
+    """Opens a snapshot written by SongSnapshotWriter. Every column is
+    memory-mapped read-only, so opening is cheap and the pages are
+    shared by every process that opens the same snapshot.
+    """
+
+    # The snapshot directory path.
+    path: str
+
+    # The parsed manifest.json.
+    manifest: dict
+
+    # The memory-mapped feature matrix.
+    feature_matrix: NDArray[np.floating] | QuantizedFeatureMatrix
+
+    # The memory-mapped numeric, string and string list columns by name.
+    columns: dict[str, NDArray | StringColumn]
+
+    def __init__(
+            self: "SongSnapshotReader",
+            path: str,
+    ) -> None:
+        """Open a snapshot.
+
+        Parameters:
+            path (str): The snapshot directory to read.
+
+        Raises:
+            FileNotFoundError: If the snapshot does not exist.
+            ValueError: If the snapshot was written in an unsupported format.
+        """
+
+        self.path = path
+        self.manifest = self.read_manifest(path)
+
+        if self.manifest["format_version"] != SongSnapshotWriter.FORMAT_VERSION:
+            raise ValueError(
+                f"unsupported song snapshot format: {self.manifest['format_version']} "
+                f"(expected {SongSnapshotWriter.FORMAT_VERSION})."
+            )
+
+        self.feature_matrix = np.load(os.path.join(path, "feature_matrix.npy"), mmap_mode="r")
+        if "feature_quantization" in self.manifest:
+            self.feature_matrix = QuantizedFeatureMatrix(
+                self.feature_matrix,
+                np.array(self.manifest["feature_quantization"]["scale"]),
+                np.array(self.manifest["feature_quantization"]["offset"]),
+            )
+
+        self.columns = {}
+        name: str
+        for name in self.manifest["numeric_columns"]:
+            self.columns[name] = np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        for name in self.manifest["string_columns"]:
+            self.columns[name] = StringColumn(*self._map_strings(name))
+        for name in self.manifest["list_columns"]:
+            self.columns[name] = StringListColumn(*self._map_strings(name))
+
+    def __len__(self: "SongSnapshotReader") -> int:
+        return self.manifest["song_count"]
+
+    @property
+    def catalog_version(self: "SongSnapshotReader") -> int:
+        """The number of deltas applied to the catalog. Snapshots written
+        before catalog versions existed are version 0.
+        """
+        return self.manifest.get("catalog_version", 0)
+
+    @staticmethod
+    def read_manifest(path: str) -> dict:
+        """Read the manifest of a snapshot without opening its columns,
+        for example to check whether the catalog version has changed.
+
+        Parameters:
+            path (str): The snapshot directory.
+
+        Returns:
+            The parsed manifest.json.
+
+        Raises:
+            FileNotFoundError: If the snapshot does not exist.
+        """
+
+        manifest_path: str = os.path.join(path, "manifest.json")
+        if not os.path.exists(manifest_path):
+            raise FileNotFoundError(f"Cannot find song snapshot '{os.path.realpath(path)}'")
+
+        file: TextIO
+        with open(manifest_path, "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    def _map_strings(
+            self: "SongSnapshotReader",
+            name: str,
+    ) -> tuple[NDArray[np.int64], NDArray[np.uint8]]:
+        """Memory-map the offsets and blob of one string column."""
+        offsets: NDArray[np.int64] = np.load(os.path.join(self.path, f"{name}.offsets.npy"), mmap_mode="r")
+        blob_path: str = os.path.join(self.path, f"{name}.blob")
+
+        # Empty files cannot be memory-mapped.
+        if os.path.getsize(blob_path) == 0:
+            return offsets, np.zeros(0, dtype=np.uint8)
+        return offsets, np.memmap(blob_path, dtype=np.uint8, mode="r")
@@ -1,105 +1,878 @@
-import csv
-import ast
 import os
-from io import TextIOWrapper
-from typing import TextIO
+import sys
+from typing import Iterable, Iterator, Sequence
 
+import numpy as np
+from numpy.typing import NDArray
+from scipy.spatial import KDTree
+
+from Data.ArtistIndex import ArtistIndex, ArtistListColumn
+from Data.IVFIndex import IVFIndex
+from Data.QuantizedFeatureMatrix import QuantizedFeatureMatrix
 from Data.Song import Song
-import Data.constants as c
+from Data.SongCsvLoader import SongCsvLoader
+from Data.SongSnapshot import SongSnapshotReader, SongSnapshotWriter, StringColumn
 
 
 class SongStore:
     # Default name for the "Data" directory.
     DATA_DIRNAME: str = "Data"
 
-    # The path to the CSV song data file.
+    # The numeric song features stored in the feature matrix, in column
+    # order. This matches the order of UserProfile.get_user_vector().
+    FEATURE_COLUMNS: list[str] = [
+        "acousticness",
+        "danceability",
+        "energy",
+        "instrumentalness",
+        "liveness",
+        "loudness",
+        "speechiness",
+        "tempo",
+        "valence",
+    ]
+
+    # The ways the feature matrix can be stored: full precision, half
+    # the memory, or one byte per value (see QuantizedFeatureMatrix).
+    FEATURE_STORAGE_TYPES: list[str] = ["float64", "float32", "uint8"]
+
+    # The other numeric song fields and the dtypes used to store them.
+    # Missing values are stored as NaN in float columns, and as 0 (or
+    # False) in integer and bool columns, which have no NaN.
+    NUMERIC_COLUMNS: dict[str, type] = {
+        "track_number": np.int32,
+        "disc_number": np.int32,
+        "explicit": np.bool_,
+        "key": np.int8,
+        "mode": np.int8,
+        "duration_ms": np.int32,
+        "time_signature": np.float32,
+        "year": np.int16,
+        "popularity": np.float64,
+    }
+
+    # The string song fields.
+    STRING_COLUMNS: list[str] = ["id", "name", "album", "album_id", "release_date"]
+
+    # The song fields holding lists of strings.
+    LIST_COLUMNS: list[str] = ["artists", "artist_ids"]
+
+    # The path to the CSV song data file, or to the snapshot directory.
     file_path: str
 
-    # A list of parsed Song objects.
-    songs: list[Song]
+    # Every Song object, once get_all_songs has built them; otherwise
+    # songs are only built from the columns when requested.
+    songs: list[Song] | None
+
+    # The memory-mapped snapshot backing this store, if any.
+    snapshot: SongSnapshotReader | None
+
+    # A contiguous (song count, feature count) matrix of song features,
+    # in the precision chosen by set_feature_storage. Every row index
+    # used by the store refers to a row of this matrix.
+    feature_matrix: NDArray[np.floating] | QuantizedFeatureMatrix
+
+    # The non-feature song fields by name, row-aligned with
+    # feature_matrix.
+    columns: dict[str, NDArray | Sequence]
+
+    # The track IDs, row-aligned with feature_matrix.
+    song_ids: Sequence[str]
+
+    # The byte offset of each song's row in the CSV file, for stores
+    # loaded with features_only. Their metadata fields are read from the
+    # file when first needed.
+    row_offsets: NDArray[np.int64] | None
+
+    # The number of deltas applied to the catalog. Anything cached per
+    # row (such as a recommender's normalized matrix) is stale once this
+    # changes.
+    catalog_version: int
+
+    # The artist dictionary and artist -> songs index. Stores opened
+    # from a snapshot build it on first use instead of when opening.
+    _artist_index: ArtistIndex | None
+
+    # The row of each track ID. Stores opened from a snapshot build it
+    # on the first lookup instead of when opening.
+    _id_index: dict[str, int] | None
+
+    # Songs built from the columns so far, by row. Reusing them keeps
+    # the same row mapped to the same Song object.
+    _song_cache: dict[int, Song]
+
+    # Contiguous copies of column subsets of feature_matrix, keyed by
+    # the selected column names.
+    _matrix_cache: dict[tuple[str, ...], NDArray[np.floating] | QuantizedFeatureMatrix]
+
+    # The squared norms of the rows of column subsets of feature_matrix,
+    # keyed by the selected column names.
+    _norm_cache: dict[tuple[str, ...], NDArray[np.floating]]
+
+    # Column subsets of feature_matrix with every row scaled to unit
+    # length, keyed by the selected column names.
+    _unit_matrix_cache: dict[tuple[str, ...], NDArray[np.floating]]
+
+    # KD-trees over column subsets of feature_matrix, keyed by the
+    # selected column names.
+    _spatial_index_cache: dict[tuple[str, ...], KDTree]
+
+    # IVF indexes over column subsets of feature_matrix, keyed by the
+    # selected column names, whether the rows are unit length, and the
+    # number of PQ subspaces.
+    _ann_index_cache: dict[tuple[tuple[str, ...], bool, int], IVFIndex]
 
     def __init__(
             self: "SongStore",
             file_name: str,
+            workers: int = SongCsvLoader.DEFAULT_WORKERS,
+            features_only: bool = False,
+            feature_storage: str = "float64",
     ) -> None:
         """Initialize the SongStore with the given CSV file path.
 
         :param file_name: The name of the CSV file (e.g., 'tracks_features.csv').
+        :param workers: The number of processes that parse shards of the file in parallel.
+        :param features_only: Whether to skip the display metadata (name, album, artists, ...)
+            while loading. It is read from the file for the songs that are actually returned.
+        :param feature_storage: How to store the feature matrix; one of FEATURE_STORAGE_TYPES.
         """
         self.file_path = os.path.join(self.DATA_DIRNAME, file_name)  # Combine folder and file name
-        self.songs = self._load_songs()
-
-    def _load_songs(self: "SongStore") -> list[Song]:
-        """Load songs from the CSV file and returns a list of Song
-        objects.
-
-        :return: A list of Song instances.
-        """
-        print(f'\nBeginning data load from "{self.file_path}"...')
-        songs: list[Song] = []
-
-        file: TextIO
-        with open(self.file_path, newline='', encoding='utf-8') as file:
-            # Count the number of data points.
-            total_songs: int = sum(1 for _ in file) - 1
-            file.seek(0)
-
-            reader: csv.DictReader = csv.DictReader(file)
-
-            row: dict[str, str]
-            row_num: int = 0
-            invalid_song_count: int = 0
-            for row in reader:
-                row_num += 1
-                print(
-                    f"\r ({row_num / total_songs:.0%}) Loading song {row_num:,} of {total_songs:,} ({invalid_song_count:,} invalid songs discarded)...",
-                    end="")
-
-                # Attempt to save a song.
-                try:
-                    song: Song = Song(
-                        id=row['id'],
-                        name=row['name'],
-                        album=row['album'],
-                        album_id=row['album_id'],
-                        artists=self._parse_list(row['artists']),
-                        artist_ids=self._parse_list(row['artist_ids']),
-                        track_number=int(row['track_number']),
-                        disc_number=int(row['disc_number']),
-                        explicit=row['explicit'].lower() == 'true',
-                        danceability=float(row['danceability']),
-                        energy=float(row['energy']),
-                        key=int(row['key']),
-                        loudness=float(row['loudness']),
-                        mode=int(row['mode']),
-                        speechiness=float(row['speechiness']),
-                        acousticness=float(row['acousticness']),
-                        instrumentalness=float(row['instrumentalness']),
-                        liveness=float(row['liveness']),
-                        valence=float(row['valence']),
-                        tempo=float(row['tempo']),
-                        duration_ms=int(row['duration_ms']),
-                        time_signature=float(row['time_signature']),
-                        year=int(row['year']),
-                        release_date=row['release_date'],
-                        popularity=None,
-                    )
-                    songs.append(song)
-                # If the song has invalid data, skip it.
-                except ValueError:
-                    invalid_song_count += 1
-
-        print(f'\nSuccessfully loaded {len(songs):,} of {total_songs:,} songs from "{self.file_path}".')
-
-        return songs
+        self.snapshot = None
+        self.songs = None
+        self.catalog_version = 0
+        self._set_columns(SongCsvLoader(self.file_path, workers=workers, features_only=features_only).load())
+        self.set_feature_storage(feature_storage)
+        print(f"Catalog memory: about {self.get_bytes_per_song():,.0f} bytes per song.")
+
+    def __len__(self: "SongStore") -> int:
+        return self.feature_matrix.shape[0]
+
+    def __getstate__(self: "SongStore") -> dict:
+        # A snapshot-backed store pickles as a reference to its snapshot
+        # instead of copying the whole catalog.
+        if self.snapshot is not None:
+            return {"snapshot_path": self.snapshot.path}
+        return self.__dict__
+
+    def __setstate__(
+            self: "SongStore",
+            state: dict,
+    ) -> None:
+        if "snapshot_path" in state:
+            self._open_snapshot(state["snapshot_path"])
+        else:
+            self.__dict__.update(state)
+
+    @classmethod
+    def from_snapshot(
+            cls: type["SongStore"],
+            snapshot_path: str,
+    ) -> "SongStore":
+        """Open a SongStore backed by a snapshot written with
+        save_snapshot. The snapshot is memory-mapped, so this takes
+        milliseconds and Song objects are only built for the rows that
+        are actually requested.
+
+        :param snapshot_path: The snapshot directory.
+        :return: A SongStore reading from the snapshot.
+        """
+        song_store: SongStore = cls.__new__(cls)
+        song_store._open_snapshot(snapshot_path)
+        return song_store
+
+    def _set_columns(
+            self: "SongStore",
+            columns: dict[str, NDArray],
+    ) -> None:
+        """Build the feature matrix and the typed columns from parsed
+        song fields. This runs once per load so that recommenders can
+        score the whole catalog without touching Song objects.
+
+        :param columns: Row-aligned arrays for every song field. Fields
+            missing from it (such as popularity in tracks_features.csv)
+            are stored as missing.
+        """
+        self.feature_matrix = self._build_feature_matrix(columns)
+        self.columns = self._build_numeric_columns(columns)
+        self.row_offsets = columns.get(SongCsvLoader.ROW_OFFSET_COLUMN)
+        name: str
+        for name in self.STRING_COLUMNS + self.LIST_COLUMNS:
+            if name in columns:
+                self.columns[name] = columns[name]
+
+        # Store each artist name once, and read song artists through the index.
+        self._artist_index = None
+        if "artists" in self.columns:
+            self._set_artists(self.columns["artists"])
+
+        self.song_ids = self.columns["id"]
+        self._id_index = self._build_id_index(self.song_ids)
+        self._clear_row_caches()
+
+    @classmethod
+    def _build_feature_matrix(
+            cls: type["SongStore"],
+            columns: dict[str, NDArray],
+    ) -> NDArray[np.float64]:
+        """Copy the feature fields of parsed songs into a contiguous matrix.
+
+        :param columns: Row-aligned arrays for every song field.
+        :return: A (song count, feature count) matrix in FEATURE_COLUMNS order.
+        """
+        feature_matrix: NDArray[np.float64] = np.empty((len(columns["id"]), len(cls.FEATURE_COLUMNS)),
+                                                       dtype=np.float64)
+        i: int
+        name: str
+        for i, name in enumerate(cls.FEATURE_COLUMNS):
+            feature_matrix[:, i] = columns[name]
+        return feature_matrix
+
+    @classmethod
+    def _build_numeric_columns(
+            cls: type["SongStore"],
+            columns: dict[str, NDArray],
+    ) -> dict[str, NDArray]:
+        """Cast the other numeric fields of parsed songs to their storage
+        dtypes. Fields missing from the columns are stored as NaN in float
+        columns, and as 0 (or False) in integer and bool columns.
+
+        :param columns: Row-aligned arrays for every song field.
+        :return: The NUMERIC_COLUMNS arrays by name.
+        """
+        song_count: int = len(columns["id"])
+        numeric_columns: dict[str, NDArray] = {}
+        name: str
+        dtype: type
+        for name, dtype in cls.NUMERIC_COLUMNS.items():
+            if name in columns:
+                numeric_columns[name] = np.asarray(columns[name]).astype(dtype)
+            elif np.issubdtype(dtype, np.floating):
+                numeric_columns[name] = np.full(song_count, np.nan, dtype=dtype)
+            else:
+                numeric_columns[name] = np.zeros(song_count, dtype=dtype)
+        return numeric_columns
+
+    @property
+    def feature_storage(self: "SongStore") -> str:
+        """How the feature matrix is stored; one of FEATURE_STORAGE_TYPES."""
+        if isinstance(self.feature_matrix, QuantizedFeatureMatrix):
+            return "uint8"
+        return str(self.feature_matrix.dtype)
+
+    def set_feature_storage(
+            self: "SongStore",
+            feature_storage: str,
+    ) -> None:
+        """Convert the feature matrix to another precision. float32
+        halves its memory and uint8 cuts it to an eighth, at the cost of
+        small errors in the features (see verify_feature_storage.py).
+        Songs built afterwards carry the stored, rounded features.
+
+        :param feature_storage: One of FEATURE_STORAGE_TYPES.
+        :raises ValueError: If the storage type is unknown.
+        """
+        if feature_storage not in self.FEATURE_STORAGE_TYPES:
+            raise ValueError(f"unknown feature storage '{feature_storage}' "
+                             f"(expected one of {', '.join(self.FEATURE_STORAGE_TYPES)}).")
+        if feature_storage == self.feature_storage:
+            return
+
+        feature_matrix: NDArray[np.floating] = self.feature_matrix[:]
+        if feature_storage == "uint8":
+            self.feature_matrix = QuantizedFeatureMatrix.encode(feature_matrix)
+        else:
+            self.feature_matrix = feature_matrix.astype(feature_storage)
+        self._clear_row_caches()
+
+    def _set_artists(
+            self: "SongStore",
+            artist_lists: Sequence[list[str]],
+    ) -> None:
+        """Encode the artists column into an ArtistIndex."""
+        self._artist_index = ArtistIndex(artist_lists)
+        self.columns["artists"] = ArtistListColumn(self._artist_index)
+
+    def _open_snapshot(
+            self: "SongStore",
+            snapshot_path: str,
+    ) -> None:
+        """Point this store at a memory-mapped snapshot."""
+        print(f'\nOpening song snapshot "{os.path.realpath(snapshot_path)}"...')
+        self.snapshot = SongSnapshotReader(snapshot_path)
+        self.file_path = snapshot_path
+        self.feature_matrix = self.snapshot.feature_matrix
+        self.columns = self.snapshot.columns
+        self.song_ids = self.columns["id"]
+        self.row_offsets = None
+        self.catalog_version = self.snapshot.catalog_version
+        self._artist_index = None
+        self._id_index = None
+        self._clear_row_caches()
+
+    def _clear_row_caches(self: "SongStore") -> None:
+        """Drop everything cached per row, after the rows or their
+        features have changed.
+        """
+        self.songs = None
+        self._song_cache = {}
+        self._matrix_cache = {}
+        self._norm_cache = {}
+        self._unit_matrix_cache = {}
+        self._spatial_index_cache = {}
+        self._ann_index_cache = {}
+
+    @staticmethod
+    def _build_id_index(
+            song_ids: Sequence[str],
+    ) -> dict[str, int]:
+        """Map each track ID to its row. If an ID occurs more than once,
+        its first row is used.
+
+        :param song_ids: The track IDs in row order.
+        :return: The row of each track ID.
+        """
+        # Later entries overwrite earlier ones, so insert in reverse.
+        return dict(zip(reversed(list(song_ids)), range(len(song_ids) - 1, -1, -1)))
+
+    def save_snapshot(
+            self: "SongStore",
+            snapshot_path: str,
+    ) -> None:
+        """Write the catalog to a snapshot directory that from_snapshot
+        can open.
+
+        :param snapshot_path: The snapshot directory to write.
+        """
+        SongSnapshotWriter(snapshot_path).write(
+            feature_columns=self.FEATURE_COLUMNS,
+            feature_matrix=self.feature_matrix,
+            numeric_columns={name: self.columns[name] for name in self.NUMERIC_COLUMNS},
+            string_columns={name: self.get_column(name) for name in self.STRING_COLUMNS},
+            list_columns={name: self.get_column(name) for name in self.LIST_COLUMNS},
+            catalog_version=self.catalog_version,
+        )
+
+    def apply_delta(
+            self: "SongStore",
+            delta_file_name: str,
+    ) -> dict[str, int]:
+        """Apply a delta file of added, updated and removed tracks to the
+        loaded catalog (see SongCsvLoader.load_delta for the format), and
+        bump catalog_version. Only the changed rows are parsed, and the
+        ID and artist indexes are updated instead of rebuilt.
+
+        A removed row is filled with the last row of the catalog, so only
+        the moved rows change position; added songs are appended. A track
+        that is both updated and removed is removed. A snapshot-backed
+        store is copied into memory; call save_snapshot to persist the
+        changes.
+
+        :param delta_file_name: The name of the delta CSV file in the Data directory.
+        :return: The number of songs added, updated and removed.
+        """
+        # Added songs have no row in the CSV file, so every metadata field
+        # of a features-only store is loaded first.
+        self._load_metadata()
+        self.row_offsets = None
+
+        delta: dict[str, NDArray]
+        removed_ids: list[str]
+        delta, removed_ids = SongCsvLoader(os.path.join(self.DATA_DIRNAME, delta_file_name)).load_delta()
+        if self._id_index is None:
+            self._id_index = self._build_id_index(self.song_ids)
+        id_index: dict[str, int] = self._id_index
+        song_count: int = len(self)
+
+        # Find the final change to each track.
+        removed: set[str] = set(removed_ids)
+        latest: dict[str, int] = dict(zip(delta["id"], range(len(delta["id"]))))
+        track_id: str
+        for track_id in removed:
+            latest.pop(track_id, None)
+
+        removed_rows: NDArray[np.intp] = np.array(
+            sorted(id_index[track_id] for track_id in removed if track_id in id_index), dtype=np.intp
+        )
+        delta_rows_by_row: NDArray[np.intp] = np.full(song_count, -1, dtype=np.intp)
+        added_delta_rows: list[int] = []
+        delta_row: int
+        for track_id, delta_row in latest.items():
+            row: int | None = id_index.get(track_id)
+            if row is None:
+                added_delta_rows.append(delta_row)
+            else:
+                delta_rows_by_row[row] = delta_row
+        updated_count: int = int(np.count_nonzero(delta_rows_by_row >= 0))
+
+        # Plan the changed catalog: for each row, the current row it is
+        # copied from, or the delta row it is taken from.
+        kept_count: int = song_count - len(removed_rows)
+        source_rows: NDArray[np.intp] = np.arange(kept_count + len(added_delta_rows), dtype=np.intp)
+        holes: NDArray[np.intp] = removed_rows[removed_rows < kept_count]
+        moved_rows: NDArray[np.intp] = np.setdiff1d(np.arange(kept_count, song_count), removed_rows)
+        source_rows[holes] = moved_rows
+        delta_rows: NDArray[np.intp] = np.full(len(source_rows), -1, dtype=np.intp)
+        delta_rows[:kept_count] = delta_rows_by_row[source_rows[:kept_count]]
+        delta_rows[kept_count:] = added_delta_rows
+        source_rows[delta_rows >= 0] = -1
+        new_rows: NDArray[np.intp] = delta_rows[delta_rows >= 0]
+
+        old_ids: Sequence[str] = self.song_ids
+        moved_ids: list[str] = [old_ids[row] for row in moved_rows]
+        removed_row_ids: list[str] = [old_ids[row] for row in removed_rows]
+
+        self.feature_matrix = self._take_rows(
+            self.feature_matrix, source_rows, self._build_feature_matrix(delta)[new_rows]
+        )
+        new_columns: dict[str, NDArray] = self._build_numeric_columns(delta)
+        name: str
+        for name in self.STRING_COLUMNS + self.LIST_COLUMNS:
+            new_columns[name] = delta[name]
+        for name in list(self.columns):
+            self.columns[name] = self._take_rows(self.columns[name], source_rows, new_columns[name][new_rows])
+        if self._artist_index is not None and not isinstance(self.columns["artists"], ArtistListColumn):
+            self._artist_index.update_rows(source_rows, delta["artists"][new_rows])
+
+        # Only the removed, moved and added tracks change rows.
+        for track_id in removed_row_ids:
+            del id_index[track_id]
+        hole: int
+        moved_row: int
+        for hole, moved_row, track_id in zip(holes, moved_rows, moved_ids):
+            if id_index.get(track_id) == moved_row:
+                id_index[track_id] = int(hole)
+        for row in range(kept_count, len(source_rows)):
+            id_index[self.columns["id"][row]] = row
+
+        self.song_ids = self.columns["id"]
+        self.snapshot = None
+        self._clear_row_caches()
+        self.catalog_version += 1
+
+        changes: dict[str, int] = {
+            "added": len(added_delta_rows),
+            "updated": updated_count,
+            "removed": len(removed_rows),
+        }
+        print(f"Applied delta to catalog version {self.catalog_version}: {changes['added']:,} added, "
+              f"{changes['updated']:,} updated, {changes['removed']:,} removed, {len(self):,} songs in total.")
+        return changes
+
+    def _take_rows(
+            self: "SongStore",
+            column: NDArray | Sequence,
+            source_rows: NDArray[np.intp],
+            new_values: NDArray,
+    ) -> NDArray | Sequence:
+        """Return a column rearranged for a changed catalog.
+
+        :param column: A column of the store, or the feature matrix.
+        :param source_rows: For each row of the result, the row of the
+            column it is copied from, or -1 for a row taken from new_values.
+        :param new_values: The values of the -1 rows, in row order.
+        :return: The rearranged column.
+        """
+        if isinstance(column, ArtistListColumn):
+            column.artist_index.update_rows(source_rows, new_values)
+            return column
+        if isinstance(column, (StringColumn, QuantizedFeatureMatrix)):
+            return column.take(source_rows, new_values)
+
+        copied: NDArray[np.bool_] = source_rows >= 0
+        result: NDArray = np.empty((len(source_rows),) + column.shape[1:], dtype=column.dtype)
+        result[copied] = column[source_rows[copied]]
+        result[~copied] = new_values
+        return result
 
     def get_all_songs(self: "SongStore") -> list[Song]:
-        """Return the list of all songs.
+        """Return the list of all songs. This builds every Song the
+        first time it is called, so prefer get_songs where possible.
 
         :return: A list of all Song instances.
         """
+        if self.songs is None:
+            self._load_metadata()
+            self.songs = self.get_songs(range(len(self)))
         return self.songs
 
+    def _load_metadata(self: "SongStore") -> None:
+        """Load every metadata field that a features-only load skipped."""
+        name: str
+        for name in SongCsvLoader.METADATA_COLUMNS:
+            self.get_column(name)
+
+    def get_column(
+            self: "SongStore",
+            name: str,
+    ) -> NDArray | Sequence:
+        """Return one song field for every song, row-aligned with the
+        feature matrix.
+
+        A metadata field skipped by a features-only load is read from the
+        CSV file on first use.
+
+        :param name: The Song attribute name.
+        :return: A NumPy array for numeric fields, or a sequence for string fields.
+        """
+        if name in self.FEATURE_COLUMNS:
+            return self.feature_matrix[:, self.FEATURE_COLUMNS.index(name)]
+        if name not in self.columns and self.row_offsets is not None and name in SongCsvLoader.METADATA_COLUMNS:
+            values: NDArray = SongCsvLoader(self.file_path).load_column(name, self.row_offsets)
+            if name == "artists":
+                self._set_artists(values)
+            else:
+                self.columns[name] = values
+        return self.columns[name]
+
+    def get_bytes_per_song(
+            self: "SongStore",
+            sample_size: int = 1000,
+    ) -> float:
+        """Estimate the memory used per song by the feature matrix and
+        the columns. Object columns are estimated from a sample of rows.
+        Songs already built by get_songs are not included.
+
+        :param sample_size: The number of rows sampled per object column.
+        :return: The estimated number of bytes per song.
+        """
+        song_count: int = len(self)
+        if song_count == 0:
+            return 0.0
+
+        total_bytes: float = self.feature_matrix.nbytes
+        if self.row_offsets is not None:
+            total_bytes += self.row_offsets.nbytes
+        column: NDArray | Sequence
+        for column in self.columns.values():
+            if isinstance(column, np.ndarray) and column.dtype == object:
+                sample: NDArray = column[:sample_size]
+                value_bytes: float = sum(self._get_object_size(value) for value in sample) / len(sample)
+                total_bytes += column.nbytes + value_bytes * song_count
+            else:
+                total_bytes += column.nbytes
+
+        return total_bytes / song_count
+
+    @staticmethod
+    def _get_object_size(value: object) -> int:
+        """Return the size of an object column value, including the
+        strings inside a list value.
+        """
+        if isinstance(value, list):
+            return sys.getsizeof(value) + sum(sys.getsizeof(item) for item in value)
+        return sys.getsizeof(value)
+
+    def get_artist_index(self: "SongStore") -> ArtistIndex:
+        """Return the artist dictionary and artist -> songs index.
+
+        :return: The ArtistIndex of the catalog.
+        """
+        if self._artist_index is None:
+            artist_lists: Sequence[list[str]] = self.get_column("artists")
+            if self._artist_index is None:
+                self._artist_index = ArtistIndex(artist_lists)
+        return self._artist_index
+
+    def get_rows_by_artists(
+            self: "SongStore",
+            artists: Iterable[str],
+    ) -> NDArray[np.int32]:
+        """Return the rows of every song by any of the given artists,
+        such as the names from UserProfile.get_top_artists.
+
+        :param artists: The artist names.
+        :return: The ascending, unique song rows.
+        """
+        return self.get_artist_index().get_rows_by_artists(artists)
+
+    def get_feature_matrix(
+            self: "SongStore",
+            columns: list[str] | None = None,
+    ) -> NDArray[np.floating] | QuantizedFeatureMatrix:
+        """Return the song feature matrix, optionally restricted to a
+        subset of FEATURE_COLUMNS. Column subsets are copied into a
+        contiguous matrix once and then reused.
+
+        The matrix is in the store's feature_storage precision, and a
+        QuantizedFeatureMatrix for uint8 storage; score with `matrix @ vector`
+        after casting the vector to matrix.dtype.
+
+        :param columns: The feature names to select, in order, or None for all features.
+        :return: A (song count, len(columns)) matrix row-aligned with the songs.
+        """
+        if columns is None:
+            return self.feature_matrix
+
+        key: tuple[str, ...] = tuple(columns)
+        if key not in self._matrix_cache:
+            indices: list[int] = [self.FEATURE_COLUMNS.index(column) for column in columns]
+            if isinstance(self.feature_matrix, QuantizedFeatureMatrix):
+                self._matrix_cache[key] = self.feature_matrix.take_columns(indices)
+            else:
+                self._matrix_cache[key] = np.ascontiguousarray(self.feature_matrix[:, indices])
+        return self._matrix_cache[key]
+
+    def get_squared_norms(
+            self: "SongStore",
+            columns: list[str] | None = None,
+    ) -> NDArray[np.floating]:
+        """Return the squared Euclidean norm of every song's feature
+        vector, as used by cosine similarity and Euclidean distance. The
+        norms are computed once per column subset and then reused.
+
+        :param columns: The feature names to select, in order, or None for all features.
+        :return: The squared norm of each row, in the feature matrix's precision.
+        """
+        key: tuple[str, ...] = tuple(self.FEATURE_COLUMNS if columns is None else columns)
+        if key not in self._norm_cache:
+            song_matrix: NDArray[np.floating] | QuantizedFeatureMatrix = self.get_feature_matrix(columns)
+            if isinstance(song_matrix, QuantizedFeatureMatrix):
+                self._norm_cache[key] = song_matrix.get_squared_norms()
+            else:
+                self._norm_cache[key] = np.einsum("ij,ij->i", song_matrix, song_matrix)
+        return self._norm_cache[key]
+
+    def get_unit_feature_matrix(
+            self: "SongStore",
+            columns: list[str] | None = None,
+    ) -> NDArray[np.floating]:
+        """Return the song feature matrix with every row scaled to unit
+        length, so that cosine similarities are a single matrix-vector
+        product. The matrix is built once per column subset and then
+        reused. Rows with no length stay zero.
+
+        Normalizing loses the per-feature scales of uint8 storage, so
+        those unit vectors are kept as float32.
+
+        :param columns: The feature names to select, in order, or None for all features.
+        :return: A (song count, len(columns)) matrix row-aligned with the songs.
+        """
+        key: tuple[str, ...] = tuple(self.FEATURE_COLUMNS if columns is None else columns)
+        if key not in self._unit_matrix_cache:
+            song_matrix: NDArray[np.floating] = self.get_feature_matrix(columns)[:]
+            dtype: np.dtype = np.result_type(song_matrix.dtype, np.float32)
+            norms: NDArray[np.floating] = np.sqrt(self.get_squared_norms(columns)).astype(dtype)
+            norms[norms == 0] = 1
+            self._unit_matrix_cache[key] = (song_matrix / norms[:, np.newaxis]).astype(dtype, copy=False)
+        return self._unit_matrix_cache[key]
+
+    @staticmethod
+    def get_unit_vectors(
+            vectors: NDArray[np.floating],
+    ) -> NDArray[np.floating]:
+        """Return vectors, such as user profiles, scaled to unit length
+        along their last axis, to compare with get_unit_feature_matrix.
+        A small epsilon is added to every length so that zero vectors
+        stay zero instead of dividing by zero.
+
+        :param vectors: One vector, or a matrix of one vector per row.
+        :return: The unit vectors, in the same shape.
+        """
+        return vectors / (np.linalg.norm(vectors, axis=-1, keepdims=True) + 1e-10)
+
+    def get_spatial_index(
+            self: "SongStore",
+            columns: list[str] | None = None,
+    ) -> KDTree:
+        """Return a KD-tree over the song feature vectors, for exact
+        nearest-neighbour queries in sub-linear time. The tree is built
+        once per catalog version and column subset, from the stored
+        (possibly rounded) features.
+
+        :param columns: The feature names to select, in order, or None for all features.
+        :return: A KD-tree whose point indices are song rows.
+        """
+        key: tuple[str, ...] = tuple(self.FEATURE_COLUMNS if columns is None else columns)
+        if key not in self._spatial_index_cache:
+            print(f"Building a KD-tree over {len(self):,} songs...")
+            self._spatial_index_cache[key] = KDTree(np.asarray(self.get_feature_matrix(columns)[:], dtype=np.float64))
+        return self._spatial_index_cache[key]
+
+    def get_ann_index(
+            self: "SongStore",
+            columns: list[str] | None = None,
+            unit: bool = False,
+            pq_subspace_count: int = 0,
+    ) -> IVFIndex:
+        """Return an IVF index over the song feature vectors, for
+        approximate nearest-neighbour queries that only scan a few
+        clusters of songs. The index is built once per catalog version
+        and column subset; a snapshot-backed store reads it from the
+        snapshot directory if save_ann_index wrote it for the same
+        catalog version.
+
+        :param columns: The feature names to select, in order, or None for all features.
+        :param unit: Whether to index the unit-length rows, for cosine similarity.
+        :param pq_subspace_count: The number of product quantization subspaces, or 0 for none.
+        :return: An IVF index whose rows are song rows.
+        """
+        key: tuple[tuple[str, ...], bool, int] = (
+            tuple(self.FEATURE_COLUMNS if columns is None else columns), unit, pq_subspace_count
+        )
+        if key not in self._ann_index_cache:
+            ann_index: IVFIndex | None = None
+            index_path: str | None = self._get_ann_index_path(key)
+            if index_path is not None and os.path.exists(index_path):
+                ann_index = IVFIndex.load(index_path)
+                if ann_index.catalog_version != self.catalog_version or len(ann_index) != len(self):
+                    ann_index = None
+
+            if ann_index is None:
+                print(f"Building an IVF index over {len(self):,} songs...")
+                vectors: NDArray[np.floating] = (
+                    self.get_unit_feature_matrix(columns) if unit else self.get_feature_matrix(columns)[:]
+                )
+                ann_index = IVFIndex.build(vectors, pq_subspace_count=pq_subspace_count,
+                                           catalog_version=self.catalog_version)
+            self._ann_index_cache[key] = ann_index
+        return self._ann_index_cache[key]
+
+    def save_ann_index(
+            self: "SongStore",
+            columns: list[str] | None = None,
+            unit: bool = False,
+            pq_subspace_count: int = 0,
+    ) -> None:
+        """Write the IVF index returned by get_ann_index into the
+        snapshot directory, so stores opening the snapshot don't have to
+        build it. Rewriting the snapshot removes it.
+
+        :param columns: The feature names to select, in order, or None for all features.
+        :param unit: Whether to index the unit-length rows, for cosine similarity.
+        :param pq_subspace_count: The number of product quantization subspaces, or 0 for none.
+        :raises ValueError: If the store is not backed by a snapshot.
+        """
+        key: tuple[tuple[str, ...], bool, int] = (
+            tuple(self.FEATURE_COLUMNS if columns is None else columns), unit, pq_subspace_count
+        )
+        index_path: str | None = self._get_ann_index_path(key)
+        if index_path is None:
+            raise ValueError("only a snapshot-backed song store can save its IVF indexes.")
+        self.get_ann_index(columns, unit, pq_subspace_count).save(index_path)
+
+    def _get_ann_index_path(
+            self: "SongStore",
+            key: tuple[tuple[str, ...], bool, int],
+    ) -> str | None:
+        """Return the file in the snapshot directory that stores an IVF
+        index, or None if the store is not backed by a snapshot.
+        """
+        if self.snapshot is None:
+            return None
+        columns, unit, pq_subspace_count = key
+        file_name: str = "ivf-" + ("unit-" if unit else "") + "-".join(columns)
+        if pq_subspace_count > 0:
+            file_name += f"-pq{pq_subspace_count}"
+        return os.path.join(self.snapshot.path, file_name + ".npz")
+
+    def get_songs(
+            self: "SongStore",
+            rows: NDArray[np.integer] | Sequence[int],
+    ) -> list[Song]:
+        """Return the songs at the given feature matrix rows.
+
+        :param rows: Row indices into the feature matrix.
+        :return: The matching Song instances, in the same order.
+        """
+        if self.songs is not None:
+            return [self.songs[row] for row in rows]
+
+        rows = [int(row) for row in rows]
+        new_rows: list[int] = [row for row in dict.fromkeys(rows) if row not in self._song_cache]
+        if new_rows:
+            metadata: dict[str, Sequence] = self._get_metadata(new_rows)
+            i: int
+            row: int
+            for i, row in enumerate(new_rows):
+                self._song_cache[row] = self._build_song(row, {name: values[i] for name, values in metadata.items()})
+        return [self._song_cache[row] for row in rows]
+
+    def _get_metadata(
+            self: "SongStore",
+            rows: list[int],
+    ) -> dict[str, Sequence]:
+        """Return the metadata fields of some rows. Fields that a
+        features-only load skipped are read from the CSV file by row
+        offset, in a single pass.
+
+        :param rows: The rows to read.
+        :return: Each metadata field by name, aligned with rows.
+        """
+        metadata: dict[str, Sequence] = {}
+        missing_names: list[str] = []
+        name: str
+        for name in SongCsvLoader.METADATA_COLUMNS:
+            if name in self.columns:
+                metadata[name] = self.columns[name][rows]
+            else:
+                missing_names.append(name)
+
+        if missing_names:
+            metadata.update(SongCsvLoader(self.file_path).load_rows(self.row_offsets[rows], missing_names))
+        return metadata
+
+    def _build_song(
+            self: "SongStore",
+            row: int,
+            metadata: dict[str, str | list[str]],
+    ) -> Song:
+        """Build the Song at a row of the columns.
+
+        :param row: The row.
+        :param metadata: The row's metadata fields by name.
+        :return: The Song.
+        """
+        columns: dict[str, NDArray | Sequence] = self.columns
+        features: NDArray[np.floating] = self.feature_matrix[row]
+        popularity: float = float(columns["popularity"][row])
+        return Song(
+            id=columns["id"][row],
+            name=metadata["name"],
+            album=metadata["album"],
+            album_id=metadata["album_id"],
+            artists=metadata["artists"],
+            artist_ids=metadata["artist_ids"],
+            track_number=int(columns["track_number"][row]),
+            disc_number=int(columns["disc_number"][row]),
+            explicit=bool(columns["explicit"][row]),
+            key=int(columns["key"][row]),
+            mode=int(columns["mode"][row]),
+            duration_ms=int(columns["duration_ms"][row]),
+            time_signature=float(columns["time_signature"][row]),
+            year=int(columns["year"][row]),
+            release_date=metadata["release_date"],
+            popularity=None if np.isnan(popularity) else popularity,
+            **{feature: float(value) for feature, value in zip(self.FEATURE_COLUMNS, features)},
+        )
+
+    def get_row_by_id(
+            self: "SongStore",
+            track_id: str,
+    ) -> int | None:
+        """Return the feature matrix row of a track ID.
+
+        :param track_id: The unique track ID of the song.
+        :return: The row of the song, or None if not found.
+        """
+        if self._id_index is None:
+            self._id_index = self._build_id_index(self.song_ids)
+        return self._id_index.get(track_id)
+
+    def get_rows_by_ids(
+            self: "SongStore",
+            track_ids: Iterable[str],
+    ) -> NDArray[np.intp]:
+        """Return the feature matrix rows of many track IDs at once.
+
+        :param track_ids: The track IDs to look up.
+        :return: The row of each track ID, or -1 where it was not found.
+        """
+        if self._id_index is None:
+            self._id_index = self._build_id_index(self.song_ids)
+        id_index: dict[str, int] = self._id_index
+        return np.fromiter((id_index.get(track_id, -1) for track_id in track_ids), dtype=np.intp)
+
     def get_song_by_id(
             self: "SongStore",
             track_id: str,
@@ -109,22 +882,19 @@ class SongStore:
         :param track_id: The unique track ID of the song.
         :return: The Song instance with the matching track ID, or None if not found.
         """
-        for song in self.songs:
-            if song.track_id == track_id:
-                return song
-        return None
+        row: int | None = self.get_row_by_id(track_id)
+        return None if row is None else self.get_songs([row])[0]
 
-    @staticmethod
-    def _parse_list(
-            field: str,
-    ) -> list[str]:
-        """Helper method to parse string fields that represent lists
-        (e.g., ['Rage Against The Machine']).
-
-        :param field: A string representation of a list (e.g., "['Artist1', 'Artist2']")
-        :return: A list of strings.
-        """
-        try:
-            return ast.literal_eval(field)
-        except Exception:
-            return []
+    def get_songs_by_ids(
+            self: "SongStore",
+            track_ids: Iterable[str],
+    ) -> list[Song | None]:
+        """Return the songs for many track IDs at once.
+
+        :param track_ids: The track IDs to look up.
+        :return: The Song instance for each track ID, or None where it was not found.
+        """
+        rows: NDArray[np.intp] = self.get_rows_by_ids(track_ids)
+        found: NDArray[np.bool_] = rows >= 0
+        found_songs: Iterator[Song] = iter(self.get_songs(rows[found]))
+        return [next(found_songs) if is_found else None for is_found in found]
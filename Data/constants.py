@@ -33,4 +33,25 @@ TIME_SIG_MIN: int = 3
 TIME_SIG_MAX: int = 7
 
 VALENCE_MIN: float = 0.0
-VALENCE_MAX: float = 1.0
\ No newline at end of file
+VALENCE_MAX: float = 1.0
+
+# The valid (minimum, maximum) range of each range-checked song feature.
+FEATURE_RANGES: dict[str, tuple[float, float]] = {
+    "acousticness": (ACOUSTICNESS_MIN, ACOUSTICNESS_MAX),
+    "danceability": (DANCEABILITY_MIN, DANCEABILITY_MAX),
+    "energy": (ENERGY_MIN, ENERGY_MAX),
+    "instrumentalness": (INSTRUMENTALNESS_MIN, INSTRUMENTALNESS_MAX),
+    "key": (KEY_MIN, KEY_MAX),
+    "liveness": (LIVENESS_MIN, LIVENESS_MAX),
+    "loudness": (LOUDNESS_MIN_USEFUL, LOUDNESS_MAX),
+    "mode": (MODE_MINOR, MODE_MAJOR),
+    "speechiness": (SPEECHINESS_MIN, SPEECHINESS_MAX),
+    "tempo": (TEMPO_MIN_USEFUL, TEMPO_MAX_USEFUL),
+    "time_signature": (TIME_SIG_MIN, TIME_SIG_MAX),
+    "valence": (VALENCE_MIN, VALENCE_MAX),
+}
+
+# Values accepted for a feature even though they fall outside its range.
+FEATURE_EXTRA_VALUES: dict[str, tuple[float, ...]] = {
+    "key": (KEY_NONE_DETECTED,),
+}
@@ -1,8 +1,20 @@
 from Data import Song
-from RecommendationSystem import Recommender
-from collections import Counter
+from Data.SongStore import SongStore
+from RecommendationSystem.Recommender import Recommender
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import os
+import time
+from typing import Iterator
+
+import numpy as np
+from numpy.typing import NDArray
 
 from RecommendationSystem.ColdStart.RandomSamplingStrategy import RandomSamplingStrategy
+from RecommendationSystem.EpsilonGreedyExplorer import EpsilonGreedyExplorer
+from RecommendationSystem.MMRReranker import MMRReranker
+from RecommendationSystem.RecommendationCache import RecommendationCache
+from UserProfileSystem.SeenSongs import SeenSongs
 from UserProfileSystem.UserProfile import UserProfile
 from UserProfileSystem.UserProfileStore import UserProfileStore
 from UserProfileSystem.FeedbackSystem.NewFeedbackStrategy import NewFeedbackStrategy
@@ -11,6 +23,31 @@ from UserProfileSystem.FeedbackSystem.NewFeedbackStrategy import NewFeedbackStra
 class Aggregator:
     DEFAULT_TOP_N: int = 5
 
+    # How the recommenders are run: one after another, concurrently on a
+    # thread pool shared by all aggregators (NumPy releases the GIL while
+    # scoring), or on a shared process pool, which pickles each
+    # recommender and its song store (a snapshot-backed store pickles as
+    # its path).
+    EXECUTION_MODES: list[str] = ["sequential", "thread", "process"]
+
+    # How the recommenders' results are combined: by their scores, each
+    # rescaled to 0-1 over the recommender's own results, or by their
+    # ranks, with reciprocal rank fusion.
+    FUSION_METHODS: list[str] = ["score", "rank"]
+
+    # The rank offset of reciprocal rank fusion, which scores rank r
+    # (from 0) as 1 / (RANK_FUSION_OFFSET + r + 1).
+    RANK_FUSION_OFFSET: int = 60
+
+    # How many pages past the one asked for are ranked when the ranked
+    # buffer runs out of unseen songs. The buffer also at least doubles
+    # each time, so scrolling through N songs ranks O(log N) times.
+    PREFETCH_PAGES: int = 4
+
+    # The pools shared by all aggregators, created on first use.
+    _thread_pool: ThreadPoolExecutor | None = None
+    _process_pool: ProcessPoolExecutor | None = None
+
     user_id: str
     user_profile_store: UserProfileStore
     user_profile: UserProfile
@@ -19,6 +56,32 @@ class Aggregator:
     feedback_strategy: NewFeedbackStrategy  # Updated to use NewFeedbackStrategy
     weights: list[float]
     top_n: int
+    execution_mode: str
+    fusion: str
+
+    # The cache of recommended rows, or None to always score.
+    result_cache: RecommendationCache | None
+
+    # The time each recommender has to finish, in seconds from the start
+    # of recommend, or None for no limit. Only the pool modes enforce it,
+    # and leave out recommenders that run late or fail.
+    timeouts: list[float | None]
+
+    # The exploration stage mixing exploration picks into the ranked
+    # songs, or None to serve the ranked songs only.
+    explorer: EpsilonGreedyExplorer | None
+
+    # The diversity re-ranker of the fused shortlist, or None to serve
+    # the fused ranking as it is.
+    reranker: MMRReranker | None
+
+    # The ranked rows served page by page, seen or not, and the user ID,
+    # profile version and catalog version they were ranked for.
+    _ranked_rows: tuple[tuple[str, int, int], NDArray[np.intp]] | None
+
+    # The songs served without a user profile, which only this aggregator
+    # remembers.
+    _served_songs: SeenSongs
 
     def __init__(
             self: "Aggregator",
@@ -29,6 +92,12 @@ class Aggregator:
             cold_start_strategy: RandomSamplingStrategy,
             feedback_strategy: NewFeedbackStrategy,  # Adding the feedback strategy
             top_n: int = DEFAULT_TOP_N,
+            execution_mode: str = "sequential",
+            timeouts: list[float | None] | None = None,
+            fusion: str = "rank",
+            result_cache: RecommendationCache | None = None,
+            explorer: EpsilonGreedyExplorer | None = None,
+            reranker: MMRReranker | None = None,
     ) -> None:
         """Initializes the Aggregator with a list of recommenders and
         their corresponding weights.
@@ -36,10 +105,27 @@ class Aggregator:
         :param recommenders: List of Recommender objects to aggregate.
         :param weights: List of weights corresponding to the recommenders.
         :param feedback_strategy: Instance of feedback strategy to update user profile.
+        :param execution_mode: How the recommenders are run; one of EXECUTION_MODES.
+        :param timeouts: The time in seconds each recommender has to finish, or None for no limit.
+            A recommender that runs late or fails is left out, and the others' results are used.
+        :param fusion: How the recommenders' results are combined; one of FUSION_METHODS.
+        :param result_cache: A cache of recommended rows to consult first, shared between requests.
+            One from RecommendationCache.get_shared stays the process's cache when the aggregator
+            is pickled and unpickled between requests.
+        :param explorer: An exploration stage that mixes exploration picks into every list served,
+            with the probability of the user's epsilon, which decays as they give feedback.
+        :param reranker: A diversity re-ranker, which picks the ranked songs from a shortlist of
+            reranker.shortlist_factor times as many fused songs.
         """
 
         if len(recommenders) != len(weights):
             raise ValueError("The number of recommenders must be equal to the number of weights.")
+        if timeouts is not None and len(recommenders) != len(timeouts):
+            raise ValueError("The number of recommenders must be equal to the number of timeouts.")
+        if execution_mode not in self.EXECUTION_MODES:
+            raise ValueError(f"Unknown execution mode {execution_mode!r}; expected one of {self.EXECUTION_MODES}.")
+        if fusion not in self.FUSION_METHODS:
+            raise ValueError(f"Unknown fusion method {fusion!r}; expected one of {self.FUSION_METHODS}.")
 
         self.user_id = user_id
         self.user_profile_store = user_profile_store
@@ -49,6 +135,14 @@ class Aggregator:
         self.feedback_strategy = feedback_strategy  # Initialize feedback strategy
         self.weights = weights
         self.top_n = top_n
+        self.execution_mode = execution_mode
+        self.timeouts = [None] * len(recommenders) if timeouts is None else timeouts
+        self.fusion = fusion
+        self.result_cache = result_cache
+        self.explorer = explorer
+        self.reranker = reranker
+        self._ranked_rows = None
+        self._served_songs = SeenSongs()
 
     def recommend(self: "Aggregator") -> list[Song]:
         """
@@ -56,28 +150,306 @@ class Aggregator:
         
         :return: List of top N recommended songs.
         """
-        all_song_scores: Counter[Song] = Counter()
-
         if self.user_profile is None or self.user_profile.is_cold_start():
             print("\nApplying cold start strategy...")
-            return self.cold_start_strategy.recommend()
+            return self._mark_seen(self.cold_start_strategy.recommend(self._get_seen_songs()))
+
+        # Reuse the rows ranked for the same profile and catalog versions
+        top_rows: NDArray[np.intp] = self._get_ranked_rows(self.top_n, self.top_n)
+        if len(top_rows) == 0:
+            print("\nNo recommender returned any songs; applying cold start strategy...")
+            return self._mark_seen(self.cold_start_strategy.recommend(self._get_seen_songs()))
+
+        # Only the final top N rows become Song objects
+        top_rows, _ = self._explore(top_rows[:self.top_n])
+        return self._mark_seen(self.recommenders[0].song_store.get_songs(top_rows))
+
+    def iter_pages(
+            self: "Aggregator",
+            page_size: int | None = None,
+    ) -> Iterator[list[Song]]:
+        """
+        Generate successive pages of recommendations, for infinite scrolling. Each page is the next
+        ranked songs the user has not seen, and its songs are recorded as seen, as by get_page. The
+        songs are ranked once per profile and catalog version into a buffer, which is extended with
+        a deeper ranking only when it runs out of unseen songs. With an explorer, exploration picks
+        take some slots of each page, and the ranked songs they displace move to the next page.
+
+        :param page_size: The number of songs per page, or None for top_n.
+        :return: An iterator over the pages, which ends when the recommenders run out of songs.
+        """
+        if page_size is None:
+            page_size = self.top_n
+        song_store: SongStore = self.recommenders[0].song_store
+
+        while True:
+            page_rows: NDArray[np.intp] = self._get_page_rows(page_size)
+            if len(page_rows) == 0:
+                return
+            yield self._mark_seen(song_store.get_songs(page_rows))
+
+    def get_page(
+            self: "Aggregator",
+            cursor: str | None = None,
+            page_size: int | None = None,
+    ) -> tuple[list[Song], str | None]:
+        """
+        Get one page of recommendations, and the cursor of the next page.
+
+        A page is the next ranked songs the user has not seen, and its songs are recorded as seen,
+        so the position is kept by the user's seen songs rather than by the cursor. A ranking that
+        is rebuilt, when the cached one expired or in another process, already leaves out the songs
+        served, so no song is skipped or served twice. The cursor holds the profile and catalog
+        versions of the page; a cursor from an older version continues with the new ranking.
+
+        :param cursor: The next_cursor of the previous page, or None for the first page.
+        :param page_size: The number of songs per page, or None for top_n.
+        :return: The songs of the page, and the cursor of the next page, or None after the last.
+        :raises ValueError: If the cursor is not one returned by get_page.
+        """
+        if cursor is not None:
+            try:
+                versions: tuple[int, ...] = tuple(int(part) for part in cursor.split("."))
+            except ValueError:
+                raise ValueError(f"Invalid recommendations cursor {cursor!r}.") from None
+            if len(versions) != 2 or min(versions) < 0:
+                raise ValueError(f"Invalid recommendations cursor {cursor!r}.")
+
+        page_rows: NDArray[np.intp] = self._get_page_rows(self.top_n if page_size is None else page_size)
+        if len(page_rows) == 0:
+            return [], None
+        key: tuple[str, int, int] = self._get_ranking_key()
+        return self._mark_seen(self.recommenders[0].song_store.get_songs(page_rows)), f"{key[1]}.{key[2]}"
+
+    def _mark_seen(
+            self: "Aggregator",
+            songs: list[Song],
+    ) -> list[Song]:
+        """
+        Record served songs as seen, so later pages and rankings leave them out. The profile
+        version is unchanged, so the ranked rows of this version are still used, without the
+        songs served. The caller saves the profile.
+
+        :param songs: The songs served.
+        :return: The same songs.
+        """
+        seen_songs: SeenSongs = self._get_seen_songs()
+        song: Song
+        for song in songs:
+            seen_songs.add(song.id)
+        return songs
+
+    def _get_seen_songs(self: "Aggregator") -> SeenSongs:
+        """
+        :return: The user's seen songs, or, without a profile, the songs served by this aggregator.
+        """
+        return self._served_songs if self.user_profile is None else self.user_profile.seen_songs
+
+    def _get_page_rows(
+            self: "Aggregator",
+            page_size: int,
+    ) -> NDArray[np.intp]:
+        """
+        Get the rows of the next page, ranking more songs if too few ranked songs are unseen.
 
-        # Collect recommendations from each recommender and add scores based on weights
+        :param page_size: The number of songs per page.
+        :return: The rows of the page.
+        """
+        ranked_rows: NDArray[np.intp] = self._get_ranked_rows(
+            page_size, page_size + self.PREFETCH_PAGES * page_size
+        )
+        page_rows: NDArray[np.intp]
+        page_rows, _ = self._explore(ranked_rows[:page_size])
+        return page_rows
+
+    def _explore(
+            self: "Aggregator",
+            ranked_rows: NDArray[np.intp],
+    ) -> tuple[NDArray[np.intp], int]:
+        """
+        Mix exploration picks into a list of ranked rows, if there is an explorer and the user is
+        past their cold start, whose songs are random already. Picks are never rows of the ranked
+        buffer, which later lists serve, or seen songs; served picks are recorded as seen, so later
+        lists leave them out too.
+
+        :param ranked_rows: The ranked rows of the list.
+        :return: The rows of the list, and the number of ranked rows it used.
+        """
+        if (self.explorer is None or len(ranked_rows) == 0
+                or self.user_profile is None or self.user_profile.is_cold_start()):
+            return ranked_rows, len(ranked_rows)
+        return self.explorer.explore(
+            self.user_profile, ranked_rows, self.recommenders[0].song_store, len(ranked_rows),
+            None if self._ranked_rows is None else self._ranked_rows[1]
+        )
+
+    def _get_ranking_key(self: "Aggregator") -> tuple[str, int, int]:
+        """
+        :return: The user ID, profile version and catalog version that ranked rows are kept for.
+        """
+        profile_version: int = 0 if self.user_profile is None else self.user_profile.version
+        return self.user_id, profile_version, self.recommenders[0].song_store.catalog_version
+
+    def _get_ranked_rows(
+            self: "Aggregator",
+            count: int,
+            depth: int,
+    ) -> NDArray[np.intp]:
+        """
+        Return the unseen ranked rows of the current profile and catalog versions, from this
+        aggregator's buffer or the result cache. If fewer than count are unseen, the recommenders
+        are run again to rank depth unseen songs, or at least as many as are buffered, so the
+        buffer at least doubles and scrolling through N songs ranks O(log N) times. The rows not
+        already ranked are appended in their new order.
+
+        :param count: The number of unseen ranked rows needed.
+        :param depth: The number of songs to rank if too few are unseen.
+        :return: The unseen ranked rows, best first; fewer than count if the recommenders run out.
+        """
+        key: tuple[str, int, int] = self._get_ranking_key()
+        song_store: SongStore = self.recommenders[0].song_store
+        ranked_rows: NDArray[np.intp] | None = None
+        if self._ranked_rows is not None and self._ranked_rows[0] == key:
+            ranked_rows = self._ranked_rows[1]
+        elif self.result_cache is not None:
+            ranked_rows = self.result_cache.get(*key)
+        if ranked_rows is None:
+            ranked_rows = np.zeros(0, dtype=np.intp)
+        seen_songs: SeenSongs = self._get_seen_songs()
+        unseen_rows: NDArray[np.intp] = ranked_rows[~seen_songs.get_row_mask(song_store, ranked_rows)]
+
+        if len(unseen_rows) < count:
+            depth = max(depth, len(ranked_rows))
+            deeper_rows: NDArray[np.intp]
+            if self.user_profile is None or self.user_profile.is_cold_start():
+                deeper_rows, _ = self.cold_start_strategy.get_top_scores(depth, seen_songs)
+            elif self.reranker is None:
+                # Collect the scored rows of each recommender, and fuse them with their weights
+                deeper_rows, _ = self.fuse(self._run_recommenders(depth), depth)
+            else:
+                # Fuse a shortlist, and pick diverse songs among those not ranked yet
+                shortlist_size: int = depth * self.reranker.shortlist_factor
+                deeper_scores: NDArray[np.float64]
+                deeper_rows, deeper_scores = self.fuse(self._run_recommenders(shortlist_size), shortlist_size)
+                unranked: NDArray[np.bool_] = ~np.isin(deeper_rows, ranked_rows)
+                deeper_rows, _ = self.reranker.rerank(deeper_rows[unranked], deeper_scores[unranked], depth)
+            ranked_rows = np.concatenate([
+                ranked_rows, deeper_rows[~np.isin(deeper_rows, ranked_rows)]
+            ]).astype(np.intp)
+            if self.result_cache is not None and len(ranked_rows) > 0:
+                self.result_cache.put(*key, ranked_rows)
+            unseen_rows = ranked_rows[~seen_songs.get_row_mask(song_store, ranked_rows)]
+
+        self._ranked_rows = (key, ranked_rows)
+        return unseen_rows
+
+    def fuse(
+            self: "Aggregator",
+            results: list[tuple[NDArray[np.intp], NDArray[np.floating]] | None],
+            top_n: int | None = None,
+    ) -> tuple[NDArray[np.intp], NDArray[np.float64]]:
+        """
+        Combine the scored rows of every recommender into one ranking. Each recommender's results
+        are turned into 0-1 scores, by rescaling their scores or by their ranks, multiplied by its
+        weight, and summed per row.
+
+        :param results: The rows and scores of each recommender, best first, or None for one that
+            returned nothing.
+        :param top_n: The number of rows to return, or None for self.top_n.
+        :return: The top N rows, best first, and their fused scores.
+        """
+        all_rows: list[NDArray[np.intp]] = []
+        all_scores: list[NDArray[np.float64]] = []
+
+        result: tuple[NDArray[np.intp], NDArray[np.floating]] | None
         recommender: Recommender
         weight: float
-        for recommender, weight in zip(self.recommenders, self.weights):
-            recommendations: list[Song] = recommender.recommend()
+        for result, recommender, weight in zip(results, self.recommenders, self.weights):
+            if result is None or len(result[0]) == 0:
+                continue
+            rows: NDArray[np.intp] = np.asarray(result[0], dtype=np.intp)
 
-            # For each song, add the weighted score to the all_song_scores
-            song: Song
-            for song in recommendations:
-                all_song_scores[song] += weight
+            fused_scores: NDArray[np.float64]
+            if self.fusion == "rank":
+                fused_scores = 1 / (self.RANK_FUSION_OFFSET + 1 + np.arange(len(rows), dtype=np.float64))
+            else:
+                scores: NDArray[np.float64] = np.asarray(result[1], dtype=np.float64)
+                if not recommender.higher_is_better:
+                    scores = -scores
+                score_range: float = float(scores.max() - scores.min())
+                fused_scores = (scores - scores.min()) / score_range if score_range > 0 else np.ones(len(rows))
 
-        # Sort songs by total score (descending) and get the top N
-        song: Song
-        recommended_songs: list[Song] = [song for (song, _) in all_song_scores.most_common(self.top_n)]
+            all_rows.append(rows)
+            all_scores.append(weight * fused_scores)
+
+        if not all_rows:
+            return np.zeros(0, dtype=np.intp), np.zeros(0)
+
+        # Sum the scores of rows returned by more than one recommender
+        unique_rows: NDArray[np.intp]
+        inverse: NDArray[np.intp]
+        unique_rows, inverse = np.unique(np.concatenate(all_rows), return_inverse=True)
+        total_scores: NDArray[np.float64] = np.bincount(inverse, weights=np.concatenate(all_scores))
 
-        return recommended_songs
+        top: NDArray[np.intp] = Recommender.get_top_rows(total_scores, self.top_n if top_n is None else top_n)
+        return unique_rows[top], total_scores[top]
+
+    def _run_recommenders(
+            self: "Aggregator",
+            top_n: int | None = None,
+    ) -> list[tuple[NDArray[np.intp], NDArray[np.floating]] | None]:
+        """
+        Run every recommender in the execution mode. In the pool modes they run concurrently, and
+        each result is waited for until its recommender's deadline, so the total time is bounded by
+        the slowest recommender rather than by the sum of all of them.
+
+        :param top_n: The number of songs each recommender selects, or None for its own number.
+
+        :return: The rows and scores of each recommender's get_top_scores, or, in the pool modes,
+            None for one that failed or ran late.
+        """
+        recommender: Recommender
+        if self.execution_mode == "sequential":
+            return [recommender.get_top_scores(top_n) for recommender in self.recommenders]
+
+        results: list[tuple[NDArray[np.intp], NDArray[np.floating]] | None] = []
+        start: float = time.monotonic()
+        executor: Executor = self._get_executor(self.execution_mode)
+        futures: list[Future] = [
+            executor.submit(recommender.get_top_scores, top_n) for recommender in self.recommenders
+        ]
+
+        future: Future
+        timeout: float | None
+        for recommender, future, timeout in zip(self.recommenders, futures, self.timeouts):
+            try:
+                remaining: float | None = None if timeout is None else max(start + timeout - time.monotonic(), 0)
+                results.append(future.result(timeout=remaining))
+            except FutureTimeoutError:
+                # A running thread can't be stopped; its result is ignored.
+                future.cancel()
+                print(f"\n{type(recommender).__name__} did not finish within {timeout} s and was left out.")
+                results.append(None)
+            except Exception as error:
+                print(f"\n{type(recommender).__name__} failed and was left out: {error!r}")
+                results.append(None)
+        return results
+
+    @classmethod
+    def _get_executor(
+            cls: type["Aggregator"],
+            execution_mode: str,
+    ) -> Executor:
+        """
+        Return the shared pool of an execution mode, creating it on first use.
+        """
+        if execution_mode == "process":
+            if cls._process_pool is None:
+                Aggregator._process_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+            return cls._process_pool
+        if cls._thread_pool is None:
+            Aggregator._thread_pool = ThreadPoolExecutor(thread_name_prefix="recommender")
+        return cls._thread_pool
 
     def get_feedback(self, recommended_songs: list[Song]) -> dict[Song, int]:
         feedback: dict[Song, int] = {}
@@ -94,5 +466,15 @@ class Aggregator:
         :param feedback: The dict of recommended songs and feedback scores.
         """
         for song, score in feedback.items():
+            # Explore less as the user gives feedback; the feedback strategy saves the epsilon
+            if self.explorer is not None and self.user_profile is not None:
+                self.explorer.decay_epsilon(self.user_profile)
+
             # Update the user profile based on the feedback score
             self.feedback_strategy.update_user_profile_based_on_feedback(self.user_profile, self.user_id, song, score)
+
+        # The profile version changed, so the cached results can't be hit
+        # again; drop them from the cache, which is the process's shared
+        # cache even in an aggregator unpickled from a previous request
+        if self.result_cache is not None:
+            self.result_cache.invalidate_user(self.user_id)
@@ -0,0 +1,205 @@
+import numpy as np
+from Data.IVFIndex import IVFIndex
+from Data.Song import Song
+from Data.SongStore import SongStore
+from RecommendationSystem.Algorithms.CosineSimiliarity import CosineSimilarity
+from RecommendationSystem.Algorithms.KNN import KNNRecommender
+from RecommendationSystem.Recommender import Recommender
+from UserProfileSystem.UserProfile import UserProfile
+
+from numpy.typing import NDArray
+
+
+class ANNRecommender(Recommender):
+    """A recommender class that finds approximately the same songs as
+    CosineSimilarity or KNNRecommender, by querying the song store's IVF
+    index instead of scoring every song.
+    """
+
+    # The metrics the recommender can approximate: cosine similarity
+    # over CosineSimilarity's features, or Euclidean distance over
+    # KNNRecommender's.
+    METRICS: list[str] = ["cosine", "euclidean"]
+
+    # The default number of songs to recommend.
+    DEFAULT_TOP_N: int = 10
+
+    # The default number of IVF lists scanned per query.
+    DEFAULT_PROBES: int = 8
+
+    # The user profile containing data used for recommendations.
+    user_profile: UserProfile
+
+    # The song store whose IVF index is used to compute the
+    # recommendations.
+    song_store: SongStore
+
+    # The metric approximated; one of METRICS.
+    metric: str
+
+    # The number of songs to recommend.
+    top_n: int
+
+    # The number of IVF lists scanned per query. More probes find more
+    # of the exact results, in more time.
+    probes: int
+
+    # The number of product quantization subspaces of the index, or 0
+    # to score the candidates on the stored features.
+    pq_subspace_count: int
+
+    def __init__(
+            self: "ANNRecommender",
+            user_profile: UserProfile,
+            song_store: SongStore,
+            metric: str = "cosine",
+            top_n: int = DEFAULT_TOP_N,
+            probes: int = DEFAULT_PROBES,
+            pq_subspace_count: int = 0,
+    ) -> None:
+        """Instantiate and initialize an ANN recommender.
+
+        Parameters:
+            user_profile (UserProfile):
+                The user profile that will be used to compute the
+                recommendations.
+            song_store (SongStore):
+                The song store whose songs will be used to compute the
+                recommendations.
+            metric (str): The metric to approximate; one of METRICS.
+            top_n (int): The number of songs to recommend.
+            probes (int): The number of IVF lists scanned per query.
+            pq_subspace_count (int):
+                The number of product quantization subspaces. With PQ,
+                candidates are ranked by their codes, and only the best
+                are re-scored on the stored features.
+
+        Raises:
+            ValueError: If the metric is not one of METRICS.
+        """
+
+        if metric not in self.METRICS:
+            raise ValueError(f"unknown metric {metric!r}; expected one of {self.METRICS}.")
+
+        self.user_profile = user_profile
+        self.song_store = song_store
+        self.metric = metric
+        self.top_n = top_n
+        self.probes = probes
+        self.pq_subspace_count = pq_subspace_count
+
+    @property
+    def higher_is_better(self: "ANNRecommender") -> bool:
+        """Whether higher scores are better: cosine similarities are,
+        Euclidean distances are not.
+        """
+        return self.metric == "cosine"
+
+    @classmethod
+    def save_indexes(
+            cls: type["ANNRecommender"],
+            song_store: SongStore,
+            pq_subspace_count: int = 0,
+    ) -> None:
+        """Build the IVF index of every metric and save it in the song
+        store's snapshot directory.
+
+        Parameters:
+            song_store (SongStore): A snapshot-backed song store.
+            pq_subspace_count (int): The number of product quantization subspaces.
+        """
+
+        metric: str
+        for metric in cls.METRICS:
+            columns: list[str]
+            unit: bool
+            columns, unit = cls._get_index_key(metric)
+            song_store.save_ann_index(columns, unit, pq_subspace_count)
+
+    @staticmethod
+    def _get_index_key(metric: str) -> tuple[list[str], bool]:
+        """Return the feature columns of a metric, and whether they are
+        indexed as unit vectors.
+        """
+        if metric == "cosine":
+            return CosineSimilarity.FEATURE_COLUMNS, True
+        return KNNRecommender.FEATURE_COLUMNS, False
+
+    def get_index(self: "ANNRecommender") -> IVFIndex:
+        """Return the song store's IVF index for this recommender's metric."""
+        columns: list[str]
+        unit: bool
+        columns, unit = self._get_index_key(self.metric)
+        return self.song_store.get_ann_index(columns, unit, self.pq_subspace_count)
+
+    def get_top_scores(
+            self: "ANNRecommender",
+            top_n: int | None = None,
+    ) -> tuple[NDArray[np.intp], NDArray[np.floating]]:
+        """Find approximately the top_n songs nearest to the user profile.
+
+        Parameters:
+            top_n (int | None): The number of songs to find, or None for self.top_n.
+
+        Returns:
+            The rows of the songs found, best first, and their cosine
+            similarities or Euclidean distances.
+        """
+
+        if top_n is None:
+            top_n = self.top_n
+
+        columns: list[str]
+        unit: bool
+        columns, unit = self._get_index_key(self.metric)
+        user_vector: NDArray[np.floating] = np.array(
+            [getattr(self.user_profile, feature) for feature in columns], dtype=np.float64
+        )
+
+        vectors: NDArray[np.floating]
+        if unit:
+            user_vector = SongStore.get_unit_vectors(user_vector)
+            vectors = self.song_store.get_unit_feature_matrix(columns)
+        else:
+            vectors = self.song_store.get_feature_matrix(columns)
+
+        # Find enough extra songs to replace every seen song.
+        seen: NDArray[np.bool_] | None = self.user_profile.seen_songs.get_mask(self.song_store)
+        search_n: int = top_n + (len(self.user_profile.seen_songs) if seen is not None else 0)
+
+        rows: NDArray[np.intp]
+        squared_distances: NDArray[np.floating]
+        rows, squared_distances = self.get_index().search(user_vector, search_n, self.probes, vectors)
+        if seen is not None:
+            unseen: NDArray[np.bool_] = ~seen[rows]
+            rows, squared_distances = rows[unseen], squared_distances[unseen]
+        rows, squared_distances = rows[:top_n], np.maximum(squared_distances[:top_n], 0)
+
+        if unit:
+            # For unit vectors, |a - b|^2 = 2 - 2 cos(a, b).
+            return rows, 1 - squared_distances / 2
+        return rows, np.sqrt(squared_distances)
+
+    def recommend(self: "ANNRecommender") -> list[Song]:
+        """Recommend the songs found by get_top_scores.
+
+        Returns:
+            A list of Song objects.
+        """
+
+        print(f"\nGetting approximate {self.metric} recommendations for {self.user_profile}...")
+
+        top_rows: NDArray[np.intp]
+        top_rows, _ = self.get_top_scores()
+        recommended_songs: list[Song] = self.song_store.get_songs(top_rows)
+
+        # Print recommended songs.
+        print("Recommended songs from the ANN index: [")
+        i: int = 0
+        song: Song
+        for song in recommended_songs:
+            print(f"    ({i}) {song}")
+            i += 1
+        print("]")
+
+        return recommended_songs
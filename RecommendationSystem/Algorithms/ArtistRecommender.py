@@ -0,0 +1,99 @@
+import numpy as np
+from Data.Song import Song
+from Data.SongStore import SongStore
+from RecommendationSystem.Recommender import Recommender
+from UserProfileSystem.UserProfile import UserProfile
+
+from numpy.typing import NDArray
+
+
+class ArtistRecommender(Recommender):
+    """A recommender class that recommends songs by the artists a user
+    listens to most, using the song store's artist index. Only the songs
+    of those artists are scored and ranked, and nothing the size of the
+    catalog is built, which makes it a cheap candidate generator for
+    CandidatePipeline.
+    """
+
+    # The default number of the user's top artists whose songs are used.
+    DEFAULT_ARTIST_COUNT: int = 10
+
+    # The default number of songs to recommend.
+    DEFAULT_TOP_N: int = 10
+
+    # The user profile containing data used for recommendations.
+    user_profile: UserProfile
+
+    # The song store whose artist index is used to compute the
+    # recommendations.
+    song_store: SongStore
+
+    # The number of the user's top artists whose songs are used.
+    artist_count: int
+
+    # The number of songs to recommend.
+    top_n: int
+
+    def __init__(
+            self: "ArtistRecommender",
+            user_profile: UserProfile,
+            song_store: SongStore,
+            artist_count: int = DEFAULT_ARTIST_COUNT,
+            top_n: int = DEFAULT_TOP_N,
+    ) -> None:
+        """Instantiate and initialize an artist recommender.
+
+        Parameters:
+            user_profile (UserProfile):
+                The user profile whose artist counts are used.
+            song_store (SongStore):
+                The song store whose songs will be recommended.
+            artist_count (int): The number of the user's top artists whose songs are used.
+            top_n (int): The number of songs to recommend.
+        """
+
+        self.user_profile = user_profile
+        self.song_store = song_store
+        self.artist_count = artist_count
+        self.top_n = top_n
+
+    def get_top_scores(
+            self: "ArtistRecommender",
+            top_n: int | None = None,
+    ) -> tuple[NDArray[np.intp], NDArray[np.floating]]:
+        """Score the songs of the user's top artists by how often the
+        user listened to their artists, and select the top_n.
+
+        Parameters:
+            top_n (int | None): The number of songs to select, or None for self.top_n.
+
+        Returns:
+            The top song rows, best first, and their summed artist counts.
+        """
+
+        artist_weights: dict[str, float] = dict(self.user_profile.get_top_artists(self.artist_count))
+        artist_rows: NDArray[np.intp]
+        scores: NDArray[np.float64]
+        artist_rows, scores = self.song_store.get_artist_index().get_affinity_scores(artist_weights)
+        artist_rows = artist_rows.astype(np.intp)
+
+        # Only songs by one of the artists that the user has not seen yet
+        # are candidates; the seen bits are read for those rows only.
+        candidates: NDArray[np.bool_] = (scores > 0) & ~self.user_profile.seen_songs.get_row_mask(
+            self.song_store, artist_rows
+        )
+        artist_rows, scores = artist_rows[candidates], scores[candidates]
+
+        top: NDArray[np.intp] = self.get_top_rows(scores, self.top_n if top_n is None else top_n)
+        return artist_rows[top], scores[top]
+
+    def recommend(self: "ArtistRecommender") -> list[Song]:
+        """Recommend the songs found by get_top_scores.
+
+        Returns:
+            A list of Song objects.
+        """
+
+        top_rows: NDArray[np.intp]
+        top_rows, _ = self.get_top_scores()
+        return self.song_store.get_songs(top_rows)
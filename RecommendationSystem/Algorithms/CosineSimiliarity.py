@@ -1,4 +1,5 @@
 from Data.Song import Song
+from Data.SongStore import SongStore
 from RecommendationSystem.Recommender import Recommender
 from UserProfileSystem import UserProfile
 import numpy as np
@@ -8,18 +9,28 @@ from numpy.typing import NDArray
 class CosineSimilarity(Recommender):
     DEFAULT_TOP_N: int = 5
 
+    # The features compared by this recommender.
+    FEATURE_COLUMNS: list[str] = [
+        "acousticness",
+        "danceability",
+        "energy",
+        "loudness",
+        "tempo",  # FIXME - tempo is not a good feature to weigh heavily
+        "valence",
+    ]
+
     user_profile: UserProfile
-    all_songs: list[Song]
+    song_store: SongStore
     top_n: int
 
     def __init__(
             self: "CosineSimilarity",
             user_profile: UserProfile,
-            all_songs: list[Song],
+            song_store: SongStore,
             top_n: int = DEFAULT_TOP_N,
     ) -> None:
         self.user_profile = user_profile
-        self.all_songs = all_songs
+        self.song_store = song_store
         self.top_n = top_n
 
     def _get_user_vector(
@@ -27,14 +38,10 @@ class CosineSimilarity(Recommender):
     ) -> NDArray[np.float64]:
         """
         Converts the user's profile into a vector for cosine similarity calculation.
+        The features are in the same order as the song feature matrix columns.
         """
-        return np.array([self.user_profile.danceability,
-                         self.user_profile.energy,
-                         self.user_profile.valence,
-                         self.user_profile.acousticness,
-                         self.user_profile.tempo,
-                         self.user_profile.loudness,
-                         ], dtype=np.float64)
+        return np.array([getattr(self.user_profile, feature) for feature in self.FEATURE_COLUMNS],
+                        dtype=np.float64)
 
     def calculate_cosine_similarity(
             self: "CosineSimilarity",
@@ -44,71 +51,103 @@ class CosineSimilarity(Recommender):
         """
         Calculate cosine similarity between two vectors.
         """
-        dot_product: np.floating = np.dot(user_vector, song_vector)
-        magnitude_user: np.floating = np.linalg.norm(user_vector)
-        magnitude_song: np.floating = np.linalg.norm(song_vector)
-
-        # Add small epsilon to avoid division by zero
-        epsilon: float = 1e-10
-        cosine_similarity: np.floating = dot_product / (magnitude_user * magnitude_song + epsilon)
+        cosine_similarity: np.floating = np.dot(
+            SongStore.get_unit_vectors(user_vector), SongStore.get_unit_vectors(song_vector)
+        )
         return cosine_similarity
 
     def _get_all_cosine_similarity(
             self: "CosineSimilarity",
             user_vector: NDArray[np.floating],
-            song_vectors: list[
-                NDArray[np.floating]
-            ],
+            unit_song_matrix: NDArray[np.floating],
     ) -> NDArray[np.floating]:
         """
-        Vectorized computation of cosine similarity for multiple song vectors.
+        Vectorized computation of cosine similarity for every row of the song matrix.
+        The song rows are already unit length, so this is one matrix-vector product.
         """
 
-        # Convert list of vectors to a NumPy matrix
-        song_matrix: NDArray[np.floating] = np.array(song_vectors)
-
-        # Compute dot products
-        dot_products: NDArray[np.floating] = np.dot(song_matrix, user_vector)
+        unit_user_vector: NDArray[np.floating] = SongStore.get_unit_vectors(user_vector)
 
-        user_magnitude: np.floating = np.linalg.norm(user_vector)
-        song_magnitudes: np.floating = np.linalg.norm(song_matrix, axis=1)  # Magnitudes for each song vector
+        return unit_song_matrix @ unit_user_vector.astype(unit_song_matrix.dtype)
 
-        # Compute cosine similarities and avoid division by zero
-        epsilon: float = 1e-10
-        cosine_similarities: NDArray[np.floating] = dot_products / (user_magnitude * song_magnitudes + epsilon)
-
-        return cosine_similarities
-
-    def recommend(self: "CosineSimilarity") -> list[Song]:
+    def get_top_scores(
+            self: "CosineSimilarity",
+            top_n: int | None = None,
+    ) -> tuple[NDArray[np.intp], NDArray[np.floating]]:
         """
-        Recommends songs based on cosine similarity between the user's profile and the songs.
+        Score every song against the user's profile and select the top N.
+
+        :param top_n: The number of songs to select, or None for self.top_n.
+        :return: The top song rows, most similar first, and their cosine similarities.
         """
         user_vector: NDArray[np.floating] = self._get_user_vector()
+        unit_song_matrix: NDArray[np.floating] = self.song_store.get_unit_feature_matrix(self.FEATURE_COLUMNS)
 
-        song_vectors: list[NDArray[np.floating]] = [song.to_vector() for song in self.all_songs]
+        similarities: NDArray[np.floating] = self._get_all_cosine_similarity(user_vector, unit_song_matrix)
+        # Songs the user has already seen are never recommended
+        seen: NDArray[np.bool_] | None = self.user_profile.seen_songs.get_mask(self.song_store)
+        top_rows: NDArray[np.intp] = self.get_top_rows(similarities, self.top_n if top_n is None else top_n, seen)
+        return top_rows, similarities[top_rows]
+
+    def score_rows(
+            self: "CosineSimilarity",
+            rows: NDArray[np.integer],
+    ) -> NDArray[np.floating]:
+        """
+        Score only some songs against the user's profile, such as a candidate shortlist.
 
-        # Using native cosine similarities calculator for cosine similarities
-        similarities: NDArray[np.floating] = (
-            self._get_all_cosine_similarity(user_vector, song_vectors)
+        :param rows: The song rows to score.
+        :return: The cosine similarity of each row; higher is more similar.
+        """
+        unit_song_matrix: NDArray[np.floating] = self.song_store.get_unit_feature_matrix(self.FEATURE_COLUMNS)
+        return self._get_all_cosine_similarity(self._get_user_vector(), unit_song_matrix[rows])
+
+    @classmethod
+    def get_top_scores_batch(
+            cls: type["CosineSimilarity"],
+            user_profiles: list[UserProfile],
+            song_store: SongStore,
+            top_n: int = DEFAULT_TOP_N,
+    ) -> tuple[NDArray[np.intp], NDArray[np.floating]]:
+        """
+        Score many users' profiles against the catalog at once, e.g. for a nightly refresh. Blocks
+        of users are scored against blocks of songs with matrix-matrix products, so the catalog is
+        read once per block of users instead of once per user.
+
+        :param user_profiles: The user profiles to score.
+        :param song_store: The song store whose songs are scored.
+        :param top_n: The number of songs to select per user.
+        :return: The (user count, top N) top song rows of each user, most similar first, and their
+            cosine similarities.
+        """
+        unit_song_matrix: NDArray[np.floating] = song_store.get_unit_feature_matrix(cls.FEATURE_COLUMNS)
+        user_matrix: NDArray[np.float64] = np.array(
+            [[getattr(user_profile, feature) for feature in cls.FEATURE_COLUMNS] for user_profile in user_profiles],
+            dtype=np.float64,
+        ).reshape(len(user_profiles), len(cls.FEATURE_COLUMNS))
+
+        unit_user_matrix: NDArray[np.floating] = (
+            SongStore.get_unit_vectors(user_matrix).astype(unit_song_matrix.dtype)
         )
 
-        # Create a list of tuples (similarity_score, song_vector)
-        similarity: float
-        song: Song
-        similarity_song_pairs: list[
-            tuple[float, Song]
-        ] = [(similarity, song) for similarity, song in zip(similarities, self.all_songs)]
+        def score_block(users: slice, songs: slice) -> NDArray[np.floating]:
+            return unit_user_matrix[users] @ unit_song_matrix[songs].T
 
-        # Sort the list by similarity score (descending order)
-        sorted_similarity_song_pairs: list[tuple[float, Song]] = (
-            sorted(similarity_song_pairs, key=lambda pair: pair[0], reverse=True)
-        )
+        return cls.get_top_rows_batch(score_block, len(user_profiles), len(song_store), top_n)
 
-        # Extract the top N recommended songs based on sorted similarity scores
-        recommended_songs: list[Song] = [pair[1] for pair in sorted_similarity_song_pairs[:self.top_n]]
+    def recommend(self: "CosineSimilarity") -> list[Song]:
+        """
+        Recommends songs based on cosine similarity between the user's profile and the songs.
+        """
+        top_rows: NDArray[np.intp]
+        top_rows, _ = self.get_top_scores()
+
+        # Extract the top N recommended songs based on similarity scores
+        recommended_songs: list[Song] = self.song_store.get_songs(top_rows)
 
         print("Recommended songs from cosine similarity: [")
         i: int = 0
+        song: Song
         for song in recommended_songs:
             print(f"    ({i}) {song}")
             i += 1
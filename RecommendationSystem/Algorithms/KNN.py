@@ -1,5 +1,7 @@
 import numpy as np
+from Data.QuantizedFeatureMatrix import QuantizedFeatureMatrix
 from Data.Song import Song
+from Data.SongStore import SongStore
 from RecommendationSystem.Recommender import Recommender
 from UserProfileSystem.UserProfile import UserProfile
 
@@ -7,7 +9,7 @@ from numpy.typing import NDArray
 
 
 class KNNRecommender(Recommender):
-    """A recommender class that uses a UserProfile and a list of songs
+    """A recommender class that uses a UserProfile and a song store
     to recommend a new list of songs based on an K-nearest neighbors
     machine learning approach.
     """
@@ -18,38 +20,36 @@ class KNNRecommender(Recommender):
     # The default number of songs to recommend.
     DEFAULT_TOP_N: int = 10
 
-    # The features utilized by this recommender.
-    FEATURE_COLUMNS: list[str] = [
-        "acousticness",
-        "danceability",
-        "energy",
-        "key",
-        "instrumentalness",
-        "liveness",
-        "loudness",
-        "mode",
-        "speechiness",
-        "tempo",
-        "valence",
-    ]
+    # The features utilized by this recommender, in the same order as
+    # UserProfile.get_user_vector().
+    FEATURE_COLUMNS: list[str] = SongStore.FEATURE_COLUMNS
 
     # A default value for a "null" feature.
     EMPTY_FEATURE_VALUE: float = 0.0
 
+    # get_top_scores returns distances, so lower scores are better.
+    higher_is_better: bool = False
+
     # The user profile containing data used for recommendations.
     user_profile: UserProfile
 
-    # The songs used to compute the recommendations.
-    all_songs: list[Song]
+    # The song store whose feature matrix is used to compute the
+    # recommendations.
+    song_store: SongStore
 
     # The number of nearest neighbors to explore.
     k: int
 
+    # Whether to find the neighbors with the catalog's KD-tree instead
+    # of scanning every song.
+    use_spatial_index: bool
+
     def __init__(
             self: "KNNRecommender",
             user_profile: UserProfile,
-            all_songs: list[Song],
+            song_store: SongStore,
             k: int = DEFAULT_K,
+            use_spatial_index: bool = False,
     ) -> None:
         """Instantiate and initialize a KNN recommender.
         
@@ -57,16 +57,133 @@ class KNNRecommender(Recommender):
             user_profile (UserProfile):
                 The user profile that will be used to compute the
                 recommendations.
-            all_songs (list[Song]):
-                The songs that will be used to compute the
+            song_store (SongStore):
+                The song store whose songs will be used to compute the
                 recommendations.
             k (int):
                 The number of nearest neighbors to explore.
+            use_spatial_index (bool):
+                Whether to query the song store's KD-tree, which is built
+                once per catalog version, instead of scanning every song.
+                Both give the exact nearest neighbors.
         """
 
         self.user_profile = user_profile
-        self.all_songs = all_songs
+        self.song_store = song_store
         self.k = k
+        self.use_spatial_index = use_spatial_index
+
+    def get_top_scores(
+            self: "KNNRecommender",
+            top_n: int | None = None,
+    ) -> tuple[NDArray[np.intp], NDArray[np.floating]]:
+        """Find the k songs nearest to the user profile vector.
+
+        Parameters:
+            top_n (int | None): The number of songs to find, or None for self.k.
+
+        Returns:
+            The rows of the nearest songs, nearest first, and their
+            Euclidean distances.
+        """
+
+        # Get the user profile vector.
+        user_vector: NDArray[np.floating] = self.user_profile.get_user_vector()
+        k: int = min(self.k if top_n is None else top_n, len(self.song_store))
+        if k <= 0:
+            return np.zeros(0, dtype=np.intp), np.zeros(0)
+
+        # Songs the user has already seen are never recommended.
+        seen: NDArray[np.bool_] | None = self.user_profile.seen_songs.get_mask(self.song_store)
+
+        if self.use_spatial_index:
+            # Query enough extra neighbors to replace every seen song.
+            query_k: int = min(k + (len(self.user_profile.seen_songs) if seen is not None else 0),
+                               len(self.song_store))
+            distances: NDArray[np.floating]
+            nearest_rows: NDArray[np.intp]
+            distances, nearest_rows = self.song_store.get_spatial_index(self.FEATURE_COLUMNS).query(user_vector,
+                                                                                                    k=query_k)
+            nearest_rows, distances = np.atleast_1d(nearest_rows).astype(np.intp), np.atleast_1d(distances)
+            if seen is not None:
+                unseen: NDArray[np.bool_] = ~seen[nearest_rows]
+                nearest_rows, distances = nearest_rows[unseen], distances[unseen]
+            return nearest_rows[:k], distances[:k]
+
+        # Calculate squared distances from the user vector to all songs at
+        # once, and keep the k smallest.
+        song_matrix: NDArray[np.floating] | QuantizedFeatureMatrix = (
+            self.song_store.get_feature_matrix(self.FEATURE_COLUMNS)
+        )
+        squared_distances: NDArray[np.floating] = self._squared_euclidean_distances(
+            user_vector, song_matrix, self.song_store.get_squared_norms(self.FEATURE_COLUMNS)
+        )
+        nearest_rows = self.get_top_rows(-squared_distances, k, seen)
+        return nearest_rows, np.sqrt(squared_distances[nearest_rows])
+
+    def score_rows(
+            self: "KNNRecommender",
+            rows: NDArray[np.integer],
+    ) -> NDArray[np.floating]:
+        """Score only some songs by their distance to the user profile
+        vector, such as a candidate shortlist.
+
+        Parameters:
+            rows (NDArray[np.integer]): The song rows to score.
+
+        Returns:
+            The negative Euclidean distance of each row, so that higher
+            scores are nearer, as for the other recommenders.
+        """
+
+        song_vectors: NDArray[np.floating] = np.asarray(self.song_store.get_feature_matrix(self.FEATURE_COLUMNS)[rows])
+        return -np.linalg.norm(song_vectors - self.user_profile.get_user_vector(), axis=1)
+
+    @classmethod
+    def get_top_scores_batch(
+            cls: type["KNNRecommender"],
+            user_profiles: list[UserProfile],
+            song_store: SongStore,
+            k: int = DEFAULT_K,
+    ) -> tuple[NDArray[np.intp], NDArray[np.floating]]:
+        """Find the k songs nearest to each of many user profiles at
+        once, e.g. for a nightly refresh. Blocks of users are measured
+        against blocks of songs with matrix-matrix products, so the
+        catalog is read once per block of users instead of once per user.
+
+        Parameters:
+            user_profiles (list[UserProfile]): The user profiles to measure from.
+            song_store (SongStore): The song store whose songs are measured.
+            k (int): The number of nearest neighbors to find per user.
+
+        Returns:
+            The (user count, k) rows of each user's nearest songs,
+            nearest first, and their Euclidean distances.
+        """
+
+        song_matrix: NDArray[np.floating] | QuantizedFeatureMatrix = song_store.get_feature_matrix(cls.FEATURE_COLUMNS)
+        squared_norms: NDArray[np.floating] = song_store.get_squared_norms(cls.FEATURE_COLUMNS)
+        user_matrix: NDArray[np.floating] = np.array(
+            [user_profile.get_user_vector() for user_profile in user_profiles], dtype=np.float64
+        ).reshape(len(user_profiles), len(cls.FEATURE_COLUMNS))
+        user_squared_norms: NDArray[np.floating] = np.einsum("ij,ij->i", user_matrix, user_matrix)
+        user_matrix = user_matrix.astype(song_matrix.dtype)
+
+        # Score by negative squared distance, so the nearest songs score
+        # highest. Quantized songs are decoded one block at a time.
+        def score_block(users: slice, songs: slice) -> NDArray[np.floating]:
+            song_block: NDArray[np.floating] = np.asarray(song_matrix[songs], dtype=song_matrix.dtype)
+            scores: NDArray[np.floating] = 2 * (user_matrix[users] @ song_block.T)
+            scores -= squared_norms[songs]
+            scores -= user_squared_norms[users, np.newaxis].astype(scores.dtype)
+            return scores
+
+        nearest_rows: NDArray[np.intp]
+        scores: NDArray[np.floating]
+        nearest_rows, scores = cls.get_top_rows_batch(score_block, len(user_profiles), len(song_store), k)
+
+        # Rounding can make a distance of 0 slightly negative.
+        return nearest_rows, np.sqrt(np.maximum(-scores, 0))
 
     def recommend(
             self: "KNNRecommender",
@@ -85,29 +202,16 @@ class KNNRecommender(Recommender):
 
         print(f"\nGetting KNN recommendations for {self.user_profile}...")
 
-        # Get the user profile vector.
-        user_vector: NDArray[np.floating] = self.user_profile.get_user_vector()
-
-        # Calculate distances from user vector to all songs.
-        distances: list[tuple[Song, np.floating]] = []
-        song: Song
-        for song in self.all_songs:
-            song_vector: NDArray[np.floating] = self._get_song_vector(song)
-            distance: np.floating = self._euclidean_distance(user_vector, song_vector)
-            distances.append((song, distance))
-
-        # Sort by distance (ascending order).
-        distances.sort(key=lambda x: x[1])
-
-        # Select the top k neighbors.
-        nearest_neighbors: list[tuple[Song, np.floating]] = distances[:self.k]
+        nearest_rows: NDArray[np.intp]
+        nearest_rows, _ = self.get_top_scores()
 
         # Aggregate and return top n recommendations based on nearest neighbors.
-        recommended_songs: list[Song] = [song for (song, _) in nearest_neighbors][:top_n]
+        recommended_songs: list[Song] = self.song_store.get_songs(nearest_rows[:top_n])
 
         # Print recommended songs.
         print("Recommended songs from KNN: [")
         i: int = 0
+        song: Song
         for song in recommended_songs:
             print(f"    ({i}) {song}")
             i += 1
@@ -115,62 +219,29 @@ class KNNRecommender(Recommender):
 
         return recommended_songs
 
-    def _get_user_vector(self: "KNNRecommender") -> NDArray[np.floating]:
-        """Create a feature vector by averaging features of the user's 
-        liked songs.
-        
-        Returns:
-            A feature vector.
-        """
-
-        liked_songs: list[tuple[Song, int]] = self.user_profile.get_favorite_tracks()
-        if not liked_songs:
-            return np.zeros(len(self.FEATURE_COLUMNS))  # Handle cold start
-
-        song: Song
-        vectors = [self._get_song_vector(song) for (song, _) in liked_songs]
-
-        return np.mean(vectors, axis=0)
-
-    def _get_song_vector(
-            self: "KNNRecommender",
-            song: Song,
-    ) -> NDArray[np.floating]:
-        """Convert a song's features into a numeric vector.
-        
-        Parameters:
-            song (Song): The song to convert.
-            
-        Returns:
-            A numeric vector of the song's features.
-        """
-
-        feature_name: str
-        return np.array([
-            song.acousticness,
-            song.danceability,
-            song.energy,
-            song.instrumentalness,
-            song.liveness,
-            song.loudness,
-            song.speechiness,
-            song.tempo,
-            song.valence,
-        ])
-
     @staticmethod
-    def _euclidean_distance(
-            vec1: NDArray[np.floating],
-            vec2: NDArray[np.floating],
-    ) -> np.floating:
-        """Compute the Euclidean distance between two vectors.
+    def _squared_euclidean_distances(
+            vector: NDArray[np.floating],
+            matrix: NDArray[np.floating] | QuantizedFeatureMatrix,
+            squared_norms: NDArray[np.floating],
+    ) -> NDArray[np.floating]:
+        """Compute the squared Euclidean distance between a vector and
+        every row of a matrix, using |a - b|^2 = |a|^2 - 2 a.b + |b|^2 so
+        the matrix is only read by one matrix-vector product, in its own
+        precision.
         
         Parameters:
-            vec1 (NDArray[np.floating]): The first vector.
-            vec2 (NDArray[np.floating]): The second vector.
+            vector (NDArray[np.floating]): The vector to measure from.
+            matrix (NDArray[np.floating] | QuantizedFeatureMatrix):
+                The matrix whose rows are measured.
+            squared_norms (NDArray[np.floating]): The squared norm of each row of the matrix.
         
         Returns:
-            The Euclidean distance between the two vectors.
+            The squared Euclidean distance to each row of the matrix.
         """
 
-        return np.sqrt(np.sum((vec1 - vec2) ** 2))
+        squared_distances: NDArray[np.floating] = squared_norms - 2 * (matrix @ vector.astype(matrix.dtype))
+        squared_distances += np.dot(vector, vector)
+
+        # Rounding can make a distance of 0 slightly negative.
+        return np.maximum(squared_distances, 0, out=squared_distances)
@@ -0,0 +1,132 @@
+from typing import Callable
+
+from Data.Song import Song
+from Data.SongStore import SongStore
+from RecommendationSystem.MMRReranker import MMRReranker
+from RecommendationSystem.Recommender import Recommender
+import numpy as np
+from numpy.typing import NDArray
+
+
+class CandidatePipeline(Recommender):
+    """
+    A two-stage recommender. Cheap candidate generators, such as ANNRecommender, ArtistRecommender
+    or CosineSimilarity built with a top_n of a few hundred, each propose their top song rows.
+    Filters then drop unwanted candidates, and weighted scorers re-rank only that shortlist
+    instead of scanning the whole catalog.
+    """
+
+    # The default number of songs to recommend.
+    DEFAULT_TOP_N: int = 5
+
+    song_store: SongStore
+
+    # Recommenders whose get_top_scores rows make up the shortlist.
+    candidate_generators: list[Recommender]
+
+    # Recommenders whose score_rows re-rank the shortlist, higher being
+    # better, and the weight of each.
+    scorers: list[Recommender]
+    weights: list[float]
+
+    # Functions that take the candidate rows and return which to keep.
+    filters: list[Callable[[NDArray[np.intp]], NDArray[np.bool_]]]
+
+    top_n: int
+
+    # The diversity re-ranker of the combined scores, or None to rank by
+    # them alone.
+    reranker: MMRReranker | None
+
+    def __init__(
+            self: "CandidatePipeline",
+            song_store: SongStore,
+            candidate_generators: list[Recommender],
+            scorers: list[Recommender],
+            weights: list[float],
+            filters: list[Callable[[NDArray[np.intp]], NDArray[np.bool_]]] | None = None,
+            top_n: int = DEFAULT_TOP_N,
+            reranker: MMRReranker | None = None,
+    ) -> None:
+        """
+        Initializes the pipeline.
+
+        :param song_store: The SongStore the rows refer to.
+        :param candidate_generators: Recommenders with a get_top_scores method; the number of
+            candidates each proposes is its own top N.
+        :param scorers: Recommenders with a score_rows method, which re-rank the candidates.
+        :param weights: The weight of each scorer.
+        :param filters: Functions mapping the candidate rows to a mask of the rows to keep.
+        :param top_n: Number of songs to recommend.
+        :param reranker: A diversity re-ranker, which picks the top N from every candidate by their
+            combined scores and their similarity to each other.
+        :raises ValueError: If the number of scorers and weights differ.
+        """
+        if len(scorers) != len(weights):
+            raise ValueError("The number of scorers must be equal to the number of weights.")
+
+        self.song_store = song_store
+        self.candidate_generators = candidate_generators
+        self.scorers = scorers
+        self.weights = weights
+        self.filters = [] if filters is None else filters
+        self.top_n = top_n
+        self.reranker = reranker
+
+    def get_candidate_rows(self: "CandidatePipeline") -> NDArray[np.intp]:
+        """
+        Run the candidate generators and filters.
+
+        :return: The ascending, unique rows of the candidates that passed every filter.
+        """
+        candidate_rows: NDArray[np.intp] = np.unique(np.concatenate(
+            [generator.get_top_scores()[0] for generator in self.candidate_generators]
+            or [np.zeros(0, dtype=np.intp)]
+        )).astype(np.intp)
+
+        keep: Callable[[NDArray[np.intp]], NDArray[np.bool_]]
+        for keep in self.filters:
+            candidate_rows = candidate_rows[keep(candidate_rows)]
+        return candidate_rows
+
+    def get_top_scores(
+            self: "CandidatePipeline",
+            top_n: int | None = None,
+    ) -> tuple[NDArray[np.intp], NDArray[np.floating]]:
+        """
+        Re-rank the candidates by the weighted sum of their scores. Each scorer's scores are first
+        rescaled to 0-1 over the candidates, so scorers with different units can be combined.
+
+        :param top_n: The number of songs to select, or None for self.top_n. At most the
+            candidates are returned, however deep the ranking asked for.
+        :return: The top song rows, best first, and their combined scores.
+        """
+        candidate_rows: NDArray[np.intp] = self.get_candidate_rows()
+        combined_scores: NDArray[np.float64] = np.zeros(len(candidate_rows))
+        if len(candidate_rows) == 0:
+            return candidate_rows, combined_scores
+
+        scorer: Recommender
+        weight: float
+        for scorer, weight in zip(self.scorers, self.weights):
+            scores: NDArray[np.float64] = np.asarray(scorer.score_rows(candidate_rows), dtype=np.float64)
+            score_range: float = float(scores.max() - scores.min())
+            if score_range > 0:
+                combined_scores += weight * (scores - scores.min()) / score_range
+
+        if top_n is None:
+            top_n = self.top_n
+        if self.reranker is not None:
+            return self.reranker.rerank(candidate_rows, combined_scores, top_n)
+        top: NDArray[np.intp] = self.get_top_rows(combined_scores, top_n)
+        return candidate_rows[top], combined_scores[top]
+
+    def recommend(self: "CandidatePipeline") -> list[Song]:
+        """
+        Recommends the top N re-ranked candidates.
+
+        :return: List of top N recommended songs.
+        """
+        top_rows: NDArray[np.intp]
+        top_rows, _ = self.get_top_scores()
+        return self.song_store.get_songs(top_rows)
@@ -0,0 +1,87 @@
+import numpy as np
+from numpy.typing import NDArray
+
+
+class AliasTable:
+    """
+    Walker's alias table over the rows of a weight array, which draws a row with probability
+    proportional to its weight at O(1) cost per draw: pick a slot uniformly, then keep the slot's
+    own row with the slot's probability, or take its alias otherwise.
+    """
+
+    # The probability that a draw landing on each slot keeps the slot's
+    # own row rather than its alias.
+    probabilities: NDArray[np.float64]
+
+    # The row drawn instead of each slot's own row.
+    aliases: NDArray[np.intp]
+
+    # Whether each row has a nonzero weight, and can be drawn.
+    nonzero: NDArray[np.bool_]
+
+    # The number of rows with a nonzero weight.
+    nonzero_count: int
+
+    def __init__(
+            self: "AliasTable",
+            weights: NDArray[np.floating],
+    ) -> None:
+        """
+        Builds the table with Vose's method, pairing every under-full slot with an over-full one
+        in vectorized rounds instead of one at a time.
+
+        :param weights: The non-negative weight of every row; they need not sum to 1.
+        :raises ValueError: If no weight is positive.
+        """
+        weights = np.asarray(weights, dtype=np.float64)
+        total: float = float(weights.sum())
+        if not total > 0:
+            raise ValueError("At least one weight must be positive.")
+
+        # Scale the weights so an even share of the mass is 1 per slot
+        self.probabilities = weights * (len(weights) / total)
+        self.aliases = np.arange(len(weights), dtype=np.intp)
+        self.nonzero = weights > 0
+        self.nonzero_count = int(np.count_nonzero(self.nonzero))
+
+        small: NDArray[np.intp] = np.flatnonzero(self.probabilities < 1)
+        large: NDArray[np.intp] = np.flatnonzero(self.probabilities >= 1)
+        while len(small) > 0 and len(large) > 0:
+            # Lay the small slots' deficits and the large slots' excesses
+            # end to end, and alias each small slot to the large slot whose
+            # excess its deficit starts in, as the sequential method would.
+            deficits: NDArray[np.float64] = 1 - self.probabilities[small]
+            deficit_starts: NDArray[np.float64] = np.cumsum(deficits) - deficits
+            excess_ends: NDArray[np.float64] = np.cumsum(self.probabilities[large] - 1)
+            donors: NDArray[np.intp] = np.minimum(
+                np.searchsorted(excess_ends, deficit_starts, side="right"), len(large) - 1
+            )
+            self.aliases[small] = large[donors]
+            self.probabilities[large] -= np.bincount(donors, weights=deficits, minlength=len(large))
+
+            # A large slot that gave away more than its excess needs an
+            # alias itself in the next round.
+            small = large[self.probabilities[large] < 1]
+            large = large[self.probabilities[large] >= 1]
+
+        # Whatever is left is full up to rounding error
+        self.probabilities[small] = 1
+        self.probabilities[large] = 1
+
+    def __len__(self: "AliasTable") -> int:
+        return len(self.probabilities)
+
+    def sample(
+            self: "AliasTable",
+            count: int,
+            rng: np.random.Generator,
+    ) -> NDArray[np.intp]:
+        """
+        Draws rows independently, with replacement.
+
+        :param count: The number of rows to draw.
+        :param rng: The random generator to draw with.
+        :return: The drawn rows.
+        """
+        slots: NDArray[np.intp] = rng.integers(len(self.probabilities), size=count)
+        return np.where(rng.random(count) < self.probabilities[slots], slots, self.aliases[slots])
@@ -1,6 +1,11 @@
 import random
-from Data import Song
+from Data.Song import Song
+from Data.SongStore import SongStore
 from RecommendationSystem.Recommender import Recommender
+import numpy as np
+from numpy.typing import NDArray
+
+from UserProfileSystem.SeenSongs import SeenSongs
 
 
 class RandomSamplingStrategy(Recommender):
@@ -13,27 +18,56 @@ class RandomSamplingStrategy(Recommender):
 
     def __init__(
             self: "RandomSamplingStrategy",
-            all_songs: list[Song],
+            song_store: SongStore,
             top_n: int = DEFAULT_TOP_N,
     ) -> None:
         """
-        Initializes the RandomSamplingStrategy with a list of all songs and the number of recommendations.
+        Initializes the RandomSamplingStrategy with the song store and the number of recommendations.
 
-        :param all_songs: List of all available Song objects.
+        :param song_store: The SongStore holding all available songs.
         :param top_n: Number of random songs to return.
         """
-        self.all_songs = all_songs
+        self.song_store = song_store
         self.top_n = top_n
 
-    def recommend(self: "RandomSamplingStrategy") -> list[Song]:
+    def get_top_scores(
+            self: "RandomSamplingStrategy",
+            top_n: int | None = None,
+            seen_songs: SeenSongs | None = None,
+    ) -> tuple[NDArray[np.intp], NDArray[np.floating]]:
+        """
+        Selects N random rows of the song store, all scored equally.
+
+        :param top_n: The number of rows to select, or None for self.top_n.
+        :param seen_songs: The user's seen songs, which are not selected, or None.
+        :return: The random rows and their scores of 1.
+        """
+
+        # Randomly select top N rows from the song store, with enough
+        # extra rows to replace every seen song
+        if top_n is None:
+            top_n = self.top_n
+        seen_count: int = 0 if seen_songs is None else len(seen_songs)
+        random_rows: NDArray[np.intp] = np.array(
+            random.sample(range(len(self.song_store)), min(top_n + seen_count, len(self.song_store))), dtype=np.intp
+        )
+        if seen_count > 0:
+            random_rows = random_rows[~seen_songs.get_row_mask(self.song_store, random_rows)]
+        random_rows = random_rows[:top_n]
+        return random_rows, np.ones(len(random_rows))
+
+    def recommend(
+            self: "RandomSamplingStrategy",
+            seen_songs: SeenSongs | None = None,
+    ) -> list[Song]:
         """
         Recommends the top N random songs from the dataset for cold start.
 
+        :param seen_songs: The user's seen songs, which are not recommended, or None.
         :return: List of N randomly selected Song objects.
         """
-        
-        # Randomly select top N songs from the list of all songs
-        random_songs: list[Song] = random.sample(self.all_songs, self.top_n)
+        random_rows: NDArray[np.intp]
+        random_rows, _ = self.get_top_scores(seen_songs=seen_songs)
 
         # Return the list of randomly selected songs
-        return random_songs
+        return self.song_store.get_songs(random_rows)
@@ -0,0 +1,191 @@
+import threading
+
+from Data.IVFIndex import IVFIndex
+from Data.SongStore import SongStore
+from RecommendationSystem.Algorithms.CosineSimiliarity import CosineSimilarity
+from RecommendationSystem.ColdStart.AliasTable import AliasTable
+from RecommendationSystem.ColdStart.RandomSamplingStrategy import RandomSamplingStrategy
+import numpy as np
+from numpy.typing import NDArray
+
+from UserProfileSystem.SeenSongs import SeenSongs
+
+
+class WeightedSamplingStrategy(RandomSamplingStrategy):
+    """A cold start strategy that samples songs at random, weighted by
+    signals such as popularity and recency, from an alias table built
+    once per catalog version.
+    """
+
+    # The signals a song's sampling weight can be made of. Each is a
+    # distribution over the songs:
+    # - uniform: every song equally.
+    # - popularity: in proportion to the song's popularity.
+    # - recency: halving every RECENCY_HALF_LIFE_YEARS years older than
+    #   the newest song.
+    # - cluster_balance: every cluster of the cosine IVF index equally,
+    #   however many songs it has, so no one style dominates.
+    SIGNALS: list[str] = ["uniform", "popularity", "recency", "cluster_balance"]
+
+    # The default share of draws from each signal's distribution.
+    DEFAULT_WEIGHTS: dict[str, float] = {"uniform": 0.25, "popularity": 0.5, "recency": 0.25}
+
+    # The years over which the recency weight halves.
+    RECENCY_HALF_LIFE_YEARS: float = 10.0
+
+    # The share of draws from each signal's distribution.
+    weights: dict[str, float]
+
+    # The random generator the songs are drawn with, used under _lock.
+    rng: np.random.Generator
+
+    # The alias table of the song store, and the catalog version it was
+    # built for.
+    _alias_table: AliasTable | None
+    _catalog_version: int
+
+    # Guards the rebuild of the alias table and the draws from rng, since
+    # requests are served from several threads.
+    _lock: threading.Lock
+
+    def __init__(
+            self: "WeightedSamplingStrategy",
+            song_store: SongStore,
+            top_n: int = RandomSamplingStrategy.DEFAULT_TOP_N,
+            weights: dict[str, float] | None = None,
+            seed: int | None = None,
+    ) -> None:
+        """
+        Initializes the WeightedSamplingStrategy with the song store and the signal weights.
+
+        :param song_store: The SongStore holding all available songs.
+        :param top_n: Number of songs to return.
+        :param weights: The share of draws from each signal's distribution, by name in SIGNALS.
+            A signal that is missing for every song, such as popularity in tracks_features.csv,
+            is left out, and the other signals share its draws.
+        :param seed: The seed of the random generator, for repeatable samples.
+        :raises ValueError: If a signal is unknown, or no weight is positive.
+        """
+        super().__init__(song_store=song_store, top_n=top_n)
+        weights = dict(self.DEFAULT_WEIGHTS if weights is None else weights)
+        unknown: list[str] = [signal for signal in weights if signal not in self.SIGNALS]
+        if unknown:
+            raise ValueError(f"Unknown signals {unknown}; expected some of {self.SIGNALS}.")
+        if not any(weight > 0 for weight in weights.values()):
+            raise ValueError("At least one signal weight must be positive.")
+
+        self.weights = weights
+        self.rng = np.random.default_rng(seed)
+        self._alias_table = None
+        self._catalog_version = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self: "WeightedSamplingStrategy") -> dict:
+        # The alias table is rebuilt on demand rather than pickled, e.g.
+        # inside a pickled Aggregator, and a lock can't be pickled.
+        state: dict = dict(self.__dict__)
+        state["_alias_table"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(
+            self: "WeightedSamplingStrategy",
+            state: dict,
+    ) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get_alias_table(self: "WeightedSamplingStrategy") -> AliasTable:
+        """
+        Returns the alias table of the song store, rebuilding it if the catalog version changed.
+
+        :return: The alias table over the song rows.
+        """
+        with self._lock:
+            if self._alias_table is None or self._catalog_version != self.song_store.catalog_version:
+                self._alias_table = AliasTable(self.get_song_weights())
+                self._catalog_version = self.song_store.catalog_version
+            return self._alias_table
+
+    def get_song_weights(self: "WeightedSamplingStrategy") -> NDArray[np.float64]:
+        """
+        Mixes the distributions of the weighted signals into one sampling weight per song.
+
+        :return: The sampling probability of every song row.
+        """
+        song_weights: NDArray[np.float64] = np.zeros(len(self.song_store))
+        signal: str
+        weight: float
+        for signal, weight in self.weights.items():
+            if weight <= 0:
+                continue
+            signal_weights: NDArray[np.float64] = self._get_signal_weights(signal)
+            total: float = float(signal_weights.sum())
+            if total > 0:
+                song_weights += weight * signal_weights / total
+
+        # Every weighted signal was missing; fall back to uniform sampling
+        if not song_weights.any():
+            song_weights[:] = 1
+        return song_weights / song_weights.sum()
+
+    def _get_signal_weights(
+            self: "WeightedSamplingStrategy",
+            signal: str,
+    ) -> NDArray[np.float64]:
+        """
+        :param signal: The signal name, in SIGNALS.
+        :return: The unnormalized weight of every song row under the signal.
+        """
+        if signal == "popularity":
+            popularity: NDArray[np.float64] = np.asarray(self.song_store.get_column("popularity"), dtype=np.float64)
+            return np.nan_to_num(np.maximum(popularity, 0))
+        if signal == "recency":
+            years: NDArray[np.float64] = np.asarray(self.song_store.get_column("year"), dtype=np.float64)
+            return 0.5 ** ((years.max() - years) / self.RECENCY_HALF_LIFE_YEARS)
+        if signal == "cluster_balance":
+            # Each song gets its cluster's equal share, split among its songs
+            ann_index: IVFIndex = self.song_store.get_ann_index(CosineSimilarity.FEATURE_COLUMNS, unit=True)
+            list_sizes: NDArray[np.int64] = np.diff(ann_index.list_offsets)
+            cluster_weights: NDArray[np.float64] = np.zeros(len(self.song_store))
+            cluster_weights[ann_index.list_rows] = np.repeat(1 / np.maximum(list_sizes, 1), list_sizes)
+            return cluster_weights
+        return np.ones(len(self.song_store))
+
+    def get_top_scores(
+            self: "WeightedSamplingStrategy",
+            top_n: int | None = None,
+            seen_songs: SeenSongs | None = None,
+    ) -> tuple[NDArray[np.intp], NDArray[np.floating]]:
+        """
+        Draws N distinct rows from the alias table, all scored equally.
+
+        :param top_n: The number of rows to draw, or None for self.top_n.
+        :param seen_songs: The user's seen songs, which are not drawn, or None.
+        :return: The drawn rows, in the order drawn, and their scores of 1.
+        """
+        alias_table: AliasTable = self.get_alias_table()
+        if top_n is None:
+            top_n = self.top_n
+        drawable_count: int = alias_table.nonzero_count
+        if seen_songs is not None and len(seen_songs) > 0:
+            seen_rows: NDArray[np.intp] = self.song_store.get_rows_by_ids(seen_songs.song_ids)
+            drawable_count -= int(np.count_nonzero(alias_table.nonzero[seen_rows[seen_rows >= 0]]))
+        else:
+            seen_songs = None
+        top_n = min(top_n, drawable_count)
+
+        # Draw with replacement, drop the seen rows, and draw again for the
+        # repeats and the seen rows
+        rows: NDArray[np.intp] = np.zeros(0, dtype=np.intp)
+        while len(rows) < top_n:
+            draws: NDArray[np.intp]
+            with self._lock:
+                draws = alias_table.sample(max(2 * (top_n - len(rows)), 16), self.rng)
+            if seen_songs is not None:
+                draws = draws[~seen_songs.get_row_mask(self.song_store, draws)]
+            draws = np.concatenate([rows, draws])
+            first: NDArray[np.intp]
+            _, first = np.unique(draws, return_index=True)
+            rows = draws[np.sort(first)][:top_n]
+        return rows, np.ones(len(rows))
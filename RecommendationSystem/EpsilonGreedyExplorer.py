@@ -0,0 +1,178 @@
+import threading
+
+from Data.SongStore import SongStore
+from RecommendationSystem.ColdStart.WeightedSamplingStrategy import WeightedSamplingStrategy
+import numpy as np
+from numpy.typing import NDArray
+
+from UserProfileSystem.UserProfile import UserProfile
+
+
+class EpsilonGreedyExplorer:
+    """
+    The epsilon-greedy exploration stage of an Aggregator. Each slot of a user's recommended list
+    is an exploration pick with probability the user's epsilon, and otherwise the next of the
+    ranked rows. Exploration picks are drawn from a WeightedSamplingStrategy's alias table, so a
+    whole batch of users is mixed with a few array operations and no scan of the catalog.
+
+    Epsilon is kept per user in the profile, and saved with it, and decays on each feedback event
+    as the profile learns the user's taste.
+    """
+
+    # The default factor epsilon is multiplied by on each feedback event.
+    DEFAULT_DECAY: float = 0.95
+
+    # The default lowest epsilon decays to, so some exploration remains.
+    DEFAULT_MIN_EPSILON: float = 0.01
+
+    # The sampler of the exploration picks, or None to pick songs uniformly.
+    sampler: WeightedSamplingStrategy | None
+
+    decay: float
+    min_epsilon: float
+
+    # The random generator of the slots and uniform picks.
+    rng: np.random.Generator
+
+    # Guards rng, since requests are served from several threads.
+    _lock: threading.Lock
+
+    def __init__(
+            self: "EpsilonGreedyExplorer",
+            sampler: WeightedSamplingStrategy | None = None,
+            decay: float = DEFAULT_DECAY,
+            min_epsilon: float = DEFAULT_MIN_EPSILON,
+            seed: int | None = None,
+    ) -> None:
+        """
+        Initializes the exploration stage.
+
+        :param sampler: The sampler whose alias table the exploration picks are drawn from, such as
+            the cold start strategy, or None to pick songs uniformly.
+        :param decay: The factor epsilon is multiplied by on each feedback event.
+        :param min_epsilon: The lowest epsilon decays to.
+        :param seed: The seed of the random generator, for repeatable picks.
+        """
+        self.sampler = sampler
+        self.decay = decay
+        self.min_epsilon = min_epsilon
+        self.rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+
+    def __getstate__(self: "EpsilonGreedyExplorer") -> dict:
+        # A lock can't be pickled, e.g. inside a pickled Aggregator.
+        state: dict = dict(self.__dict__)
+        del state["_lock"]
+        return state
+
+    def __setstate__(
+            self: "EpsilonGreedyExplorer",
+            state: dict,
+    ) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def decay_epsilon(
+            self: "EpsilonGreedyExplorer",
+            user_profile: UserProfile,
+    ) -> None:
+        """
+        Decays a user's epsilon after a feedback event, down to min_epsilon. The profile is saved
+        by the feedback strategy.
+
+        :param user_profile: The profile of the user who gave feedback.
+        """
+        # An epsilon already below min_epsilon is left as it is
+        user_profile.epsilon = max(user_profile.epsilon * self.decay, min(self.min_epsilon, user_profile.epsilon))
+
+    def explore(
+            self: "EpsilonGreedyExplorer",
+            user_profile: UserProfile,
+            ranked_rows: NDArray[np.intp],
+            song_store: SongStore,
+            slot_count: int,
+            excluded_rows: NDArray[np.intp] | None = None,
+    ) -> tuple[NDArray[np.intp], int]:
+        """
+        Mixes exploration picks into one user's ranked rows.
+
+        :param user_profile: The user's profile, with their epsilon and seen songs.
+        :param ranked_rows: The user's ranked rows, best first; at least slot_count, if there are.
+        :param song_store: The song store the rows refer to.
+        :param slot_count: The number of rows to return.
+        :param excluded_rows: Other rows that are not picked, such as the rest of the user's ranked
+            buffer, which later lists serve, or None.
+        :return: The mixed rows, and the number of ranked rows they used.
+        """
+        slot_count = min(slot_count, len(ranked_rows))
+        mixed_rows: NDArray[np.intp]
+        exploited_counts: NDArray[np.intp]
+        mixed_rows, exploited_counts = self.explore_batch(
+            [user_profile], ranked_rows[np.newaxis, :slot_count], song_store,
+            None if excluded_rows is None else [excluded_rows]
+        )
+        return mixed_rows[0], int(exploited_counts[0])
+
+    def explore_batch(
+            self: "EpsilonGreedyExplorer",
+            user_profiles: list[UserProfile],
+            ranked_rows: NDArray[np.intp],
+            song_store: SongStore,
+            excluded_rows: list[NDArray[np.intp]] | None = None,
+    ) -> tuple[NDArray[np.intp], NDArray[np.intp]]:
+        """
+        Mixes exploration picks into the ranked rows of a batch of users at once. Every slot is an
+        exploration pick with the probability of its user's epsilon; the other slots take the
+        user's ranked rows in order. A pick that is already in the user's list, that the user has
+        seen, or that is one of the user's excluded rows gives its slot back to the ranked rows.
+
+        :param user_profiles: The users' profiles, with their epsilons and seen songs.
+        :param ranked_rows: The (user count, slot count) ranked rows of each user, best first.
+        :param song_store: The song store the rows refer to.
+        :param excluded_rows: Other rows of each user that are not picked, such as the rest of
+            their ranked buffers, or None.
+        :return: The (user count, slot count) mixed rows, and the number of ranked rows each user's
+            list used.
+        """
+        user_count: int
+        slot_count: int
+        user_count, slot_count = ranked_rows.shape
+        epsilons: NDArray[np.float64] = np.array([user_profile.epsilon for user_profile in user_profiles])
+
+        with self._lock:
+            explored: NDArray[np.bool_] = self.rng.random((user_count, slot_count)) < epsilons[:, np.newaxis]
+            pick_count: int = int(np.count_nonzero(explored))
+            if pick_count == 0:
+                return ranked_rows, np.full(user_count, slot_count, dtype=np.intp)
+            picks: NDArray[np.intp] = (
+                self.sampler.get_alias_table().sample(pick_count, self.rng) if self.sampler is not None
+                else self.rng.integers(len(song_store), size=pick_count)
+            )
+
+        # Drop the picks that repeat a row of their user's list, that their
+        # user has seen, or that are excluded for their user.
+        pick_users: NDArray[np.intp] = np.nonzero(explored)[0]
+        repeated: NDArray[np.bool_] = (ranked_rows[pick_users] == picks[:, np.newaxis]).any(axis=1)
+        order: NDArray[np.intp] = np.lexsort((picks, pick_users))
+        repeated[order[1:]] |= (
+            (pick_users[order[1:]] == pick_users[order[:-1]]) & (picks[order[1:]] == picks[order[:-1]])
+        )
+        user: int
+        for user in np.unique(pick_users):
+            has_excluded_rows: bool = excluded_rows is not None and len(excluded_rows[user]) > 0
+            if len(user_profiles[user].seen_songs) == 0 and not has_excluded_rows:
+                continue
+            user_picks: NDArray[np.bool_] = pick_users == user
+            user_pick_rows: NDArray[np.intp] = picks[user_picks]
+            user_repeated: NDArray[np.bool_] = user_profiles[user].seen_songs.get_row_mask(song_store, user_pick_rows)
+            if has_excluded_rows:
+                user_repeated |= np.isin(user_pick_rows, excluded_rows[user])
+            repeated[user_picks] |= user_repeated
+        explored[explored] = ~repeated
+
+        # The k-th slot that is not explored takes the user's k-th ranked
+        # row.
+        exploited_counts: NDArray[np.intp] = np.cumsum(~explored, axis=1)
+        mixed_rows: NDArray[np.intp] = np.take_along_axis(ranked_rows, np.maximum(exploited_counts - 1, 0), axis=1)
+        mixed_rows[explored] = picks[~repeated]
+        return mixed_rows, exploited_counts[:, -1]
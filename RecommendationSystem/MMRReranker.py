@@ -0,0 +1,184 @@
+from Data.ArtistIndex import ArtistIndex
+from Data.SongStore import SongStore
+from RecommendationSystem.Algorithms.CosineSimiliarity import CosineSimilarity
+import numpy as np
+from numpy.typing import NDArray
+
+
+class MMRReranker:
+    """
+    A maximal marginal relevance re-ranker, which diversifies a shortlist of scored songs. Songs
+    are picked one at a time, each maximizing
+
+        relevance_weight * relevance - (1 - relevance_weight) * (highest similarity to a picked song)
+
+    with relevance rescaled to 0-1 over the shortlist. Songs are compared by the cosine similarity
+    of their features centered on the shortlist's mean, since a shortlist holds alike songs whose
+    plain cosine similarities are all close to 1.
+
+    The pairwise similarities of the shortlist are computed once, as one matrix product, and each
+    pick updates every candidate's highest similarity with one NumPy maximum, so picking N of C
+    candidates costs O(C x N) and never touches the rest of the catalog. Artist caps limit how many
+    songs of one artist the list may have.
+    """
+
+    # The default weight of relevance against diversity, the lambda of MMR.
+    DEFAULT_RELEVANCE_WEIGHT: float = 0.7
+
+    # The default number of candidates per song to pick, which callers
+    # such as Aggregator rank before re-ranking.
+    DEFAULT_SHORTLIST_FACTOR: int = 4
+
+    # The most candidates whose pairwise similarities are computed up
+    # front (32 MB of float64); for more, each pick computes its row.
+    MAX_BLOCK_CANDIDATES: int = 2048
+
+    song_store: SongStore
+
+    # The weight of relevance against diversity: 1 keeps the ranking as
+    # it is, 0 only maximizes diversity.
+    relevance_weight: float
+
+    # The most songs of one artist a list may have, or None for no limit.
+    artist_cap: int | None
+
+    # The number of candidates per song to pick.
+    shortlist_factor: int
+
+    # The feature columns songs are compared on.
+    columns: list[str]
+
+    def __init__(
+            self: "MMRReranker",
+            song_store: SongStore,
+            relevance_weight: float = DEFAULT_RELEVANCE_WEIGHT,
+            artist_cap: int | None = None,
+            shortlist_factor: int = DEFAULT_SHORTLIST_FACTOR,
+            columns: list[str] | None = None,
+    ) -> None:
+        """
+        Initializes the re-ranker.
+
+        :param song_store: The SongStore the rows refer to.
+        :param relevance_weight: The weight of relevance against diversity, from 0 to 1.
+        :param artist_cap: The most songs of one artist a list may have, or None for no limit.
+        :param shortlist_factor: The number of candidates per song to pick.
+        :param columns: The feature columns songs are compared on, or None for CosineSimilarity's.
+        :raises ValueError: If the relevance weight is not from 0 to 1, or the artist cap is not
+            positive.
+        """
+        if not 0 <= relevance_weight <= 1:
+            raise ValueError(f"The relevance weight must be from 0 to 1, not {relevance_weight}.")
+        if artist_cap is not None and artist_cap < 1:
+            raise ValueError(f"The artist cap must be positive, not {artist_cap}.")
+
+        self.song_store = song_store
+        self.relevance_weight = relevance_weight
+        self.artist_cap = artist_cap
+        self.shortlist_factor = shortlist_factor
+        self.columns = CosineSimilarity.FEATURE_COLUMNS if columns is None else columns
+
+    def rerank(
+            self: "MMRReranker",
+            rows: NDArray[np.intp],
+            scores: NDArray[np.floating],
+            top_n: int,
+    ) -> tuple[NDArray[np.intp], NDArray[np.floating]]:
+        """
+        Pick a diverse top N from a shortlist.
+
+        :param rows: The candidate rows.
+        :param scores: The relevance of each candidate; higher is better.
+        :param top_n: The number of rows to pick.
+        :return: The picked rows, in the order picked, and their scores. Fewer than N are picked if
+            the artist caps rule out the other candidates.
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        scores = np.asarray(scores)
+        candidate_count: int = len(rows)
+        top_n = min(top_n, candidate_count)
+        if top_n <= 0:
+            return rows[:0], scores[:0]
+
+        relevance: NDArray[np.float64] = np.asarray(scores, dtype=np.float64)
+        score_range: float = float(relevance.max() - relevance.min())
+        relevance = (relevance - relevance.min()) / score_range if score_range > 0 else np.ones(candidate_count)
+        weighted_relevance: NDArray[np.float64] = self.relevance_weight * relevance
+
+        unit_vectors: NDArray[np.float64] = np.asarray(
+            self.song_store.get_unit_feature_matrix(self.columns)[rows], dtype=np.float64
+        )
+        unit_vectors = SongStore.get_unit_vectors(unit_vectors - unit_vectors.mean(axis=0))
+        similarity_block: NDArray[np.float64] | None = (
+            unit_vectors @ unit_vectors.T if candidate_count <= self.MAX_BLOCK_CANDIDATES else None
+        )
+
+        # The highest similarity of each candidate to a picked one; songs
+        # unlike every pick are not rewarded beyond having none.
+        max_similarities: NDArray[np.float64] = np.zeros(candidate_count)
+        available: NDArray[np.bool_] = np.ones(candidate_count, dtype=np.bool_)
+
+        # The artists of each candidate and the candidates of each artist,
+        # in CSR form, and the number of picks by each artist.
+        candidate_offsets: NDArray[np.int64] = np.zeros(1, dtype=np.int64)
+        candidate_artists: NDArray[np.intp] = np.zeros(0, dtype=np.intp)
+        artist_offsets: NDArray[np.int64] = np.zeros(1, dtype=np.int64)
+        artist_candidates: NDArray[np.intp] = np.zeros(0, dtype=np.intp)
+        if self.artist_cap is not None:
+            candidate_offsets, candidate_artists, artist_offsets, artist_candidates = (
+                self._get_candidate_artists(rows)
+            )
+        artist_pick_counts: NDArray[np.int64] = np.zeros(len(artist_offsets) - 1, dtype=np.int64)
+
+        picks: list[int] = []
+        while len(picks) < top_n:
+            mmr_scores: NDArray[np.float64] = np.where(
+                available, weighted_relevance - (1 - self.relevance_weight) * max_similarities, -np.inf
+            )
+            pick: int = int(np.argmax(mmr_scores))
+            if not available[pick]:
+                break
+            picks.append(pick)
+            available[pick] = False
+            np.maximum(
+                max_similarities,
+                similarity_block[pick] if similarity_block is not None else unit_vectors @ unit_vectors[pick],
+                out=max_similarities,
+            )
+
+            if self.artist_cap is not None:
+                artists: NDArray[np.intp] = candidate_artists[candidate_offsets[pick]:candidate_offsets[pick + 1]]
+                artist_pick_counts[artists] += 1
+                artist: int
+                for artist in artists[artist_pick_counts[artists] >= self.artist_cap]:
+                    available[artist_candidates[artist_offsets[artist]:artist_offsets[artist + 1]]] = False
+
+        picked: NDArray[np.intp] = np.array(picks, dtype=np.intp)
+        return rows[picked], scores[picked]
+
+    def _get_candidate_artists(
+            self: "MMRReranker",
+            rows: NDArray[np.intp],
+    ) -> tuple[NDArray[np.int64], NDArray[np.intp], NDArray[np.int64], NDArray[np.intp]]:
+        """
+        Number the artists of the candidates from 0, from the song store's artist index.
+
+        :param rows: The candidate rows.
+        :return: The CSR candidate -> artist numbers mapping (offsets and numbers), and the CSR
+            artist number -> candidates mapping (offsets and candidates).
+        """
+        artist_index: ArtistIndex = self.song_store.get_artist_index()
+        starts: NDArray[np.int64] = artist_index.song_offsets[rows]
+        counts: NDArray[np.int64] = artist_index.song_offsets[rows + 1] - starts
+        candidate_offsets: NDArray[np.int64] = np.concatenate([[0], np.cumsum(counts)])
+        positions: NDArray[np.int64] = np.arange(candidate_offsets[-1]) - np.repeat(candidate_offsets[:-1], counts)
+        artist_codes: NDArray[np.int32] = artist_index.song_artist_codes[np.repeat(starts, counts) + positions]
+
+        artist_numbers: NDArray[np.intp]
+        _, artist_numbers = np.unique(artist_codes, return_inverse=True)
+        order: NDArray[np.intp] = np.argsort(artist_numbers, kind="stable")
+        artist_offsets: NDArray[np.int64] = np.concatenate([
+            [0], np.cumsum(np.bincount(artist_numbers, minlength=artist_numbers.max(initial=-1) + 1))
+        ])
+        artist_candidates: NDArray[np.intp] = np.repeat(np.arange(len(rows)), counts)[order]
+        return candidate_offsets, artist_numbers, artist_offsets, artist_candidates
@@ -0,0 +1,173 @@
+from collections import OrderedDict
+import threading
+import time
+
+import numpy as np
+from numpy.typing import NDArray
+
+
+class RecommendationCache:
+    """
+    A least-recently-used cache of recommended song rows, keyed by user ID, profile version and
+    catalog version, so a repeat request for an unchanged profile and catalog skips scoring. A
+    changed profile or catalog gets a new key, and entries also expire after a time to live.
+
+    Entries hold rows rather than Songs, so they stay valid while the same catalog version is
+    reopened. Only share a cache between aggregators configured the same way.
+
+    A cache shared by name, from get_shared, pickles as its name and unpickles as the cache of that
+    name in the unpickling process, so an Aggregator pickled between requests invalidates the cache
+    that serves them rather than an empty copy.
+    """
+
+    # The caches shared by name within this process.
+    _shared_caches: dict[str, "RecommendationCache"] = {}
+    _shared_lock: threading.Lock = threading.Lock()
+
+    # The default maximum number of cached results.
+    DEFAULT_MAX_ENTRIES: int = 1024
+
+    # The default seconds a result stays cached, or None for no limit.
+    DEFAULT_TTL: float | None = 300.0
+
+    max_entries: int
+    ttl: float | None
+
+    # The name the cache is shared under, or None for a private cache.
+    name: str | None
+
+    # The cached rows and their expiry times on time.monotonic(), least
+    # recently used first.
+    _entries: OrderedDict[tuple[str, int, int], tuple[float, NDArray[np.intp]]]
+
+    # Guards _entries and the counters, since requests are served from
+    # several threads.
+    _lock: threading.Lock
+
+    # The number of lookups that found a live entry, and that did not.
+    hits: int
+    misses: int
+
+    def __init__(
+            self: "RecommendationCache",
+            max_entries: int = DEFAULT_MAX_ENTRIES,
+            ttl: float | None = DEFAULT_TTL,
+    ) -> None:
+        """
+        Initializes an empty private cache.
+
+        :param max_entries: The maximum number of cached results; the least recently used is
+            evicted first.
+        :param ttl: The seconds a result stays cached, or None for no limit.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.name = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def get_shared(
+            cls: type["RecommendationCache"],
+            name: str,
+            max_entries: int = DEFAULT_MAX_ENTRIES,
+            ttl: float | None = DEFAULT_TTL,
+    ) -> "RecommendationCache":
+        """
+        Returns the cache shared under a name in this process, creating it on first use.
+
+        :param name: The name the cache is shared under.
+        :param max_entries: The maximum number of cached results, if the cache is created.
+        :param ttl: The seconds a result stays cached, or None for no limit, if the cache is created.
+        :return: The shared cache.
+        """
+        with cls._shared_lock:
+            cache: RecommendationCache | None = cls._shared_caches.get(name)
+            if cache is None:
+                cache = cls(max_entries, ttl)
+                cache.name = name
+                cls._shared_caches[name] = cache
+            return cache
+
+    def __reduce__(self: "RecommendationCache") -> tuple:
+        # A shared cache pickles as its name, and a private one as its
+        # settings only, since a lock can't be pickled.
+        if self.name is not None:
+            return RecommendationCache.get_shared, (self.name, self.max_entries, self.ttl)
+        return RecommendationCache, (self.max_entries, self.ttl)
+
+    def __len__(self: "RecommendationCache") -> int:
+        return len(self._entries)
+
+    def get(
+            self: "RecommendationCache",
+            user_id: str,
+            profile_version: int,
+            catalog_version: int,
+    ) -> NDArray[np.intp] | None:
+        """
+        Look up the cached rows of a profile and catalog version, and count a hit or a miss.
+
+        :param user_id: The user ID.
+        :param profile_version: The version of the user's profile.
+        :param catalog_version: The version of the song catalog.
+        :return: The cached rows, or None if there is no live entry.
+        """
+        key: tuple[str, int, int] = (user_id, profile_version, catalog_version)
+        with self._lock:
+            entry: tuple[float, NDArray[np.intp]] | None = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(
+            self: "RecommendationCache",
+            user_id: str,
+            profile_version: int,
+            catalog_version: int,
+            rows: NDArray[np.intp],
+    ) -> None:
+        """
+        Cache the recommended rows of a profile and catalog version.
+
+        :param user_id: The user ID.
+        :param profile_version: The version of the user's profile.
+        :param catalog_version: The version of the song catalog.
+        :param rows: The recommended rows, best first.
+        """
+        expires_at: float = float("inf") if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[(user_id, profile_version, catalog_version)] = (expires_at, rows)
+            self._entries.move_to_end((user_id, profile_version, catalog_version))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(
+            self: "RecommendationCache",
+            user_id: str,
+    ) -> None:
+        """
+        Drop every cached result of a user, e.g. after feedback changed their profile.
+
+        :param user_id: The user ID.
+        """
+        with self._lock:
+            key: tuple[str, int, int]
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+
+    def get_hit_rate(self: "RecommendationCache") -> float:
+        """
+        :return: The fraction of lookups that were hits, or 0 before any lookup.
+        """
+        lookups: int = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
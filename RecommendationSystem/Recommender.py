@@ -1,64 +1,243 @@
 from abc import ABC, abstractmethod
-from Data import Song, SongStore
+from typing import Callable
+from Data.Song import Song
+from Data.SongStore import SongStore
+from UserProfileSystem.UserProfile import UserProfile
 import numpy as np
-import pandas as pd
+from numpy.typing import NDArray
 
 
 class Recommender:
+    # The number of users and songs scored together by the batch scorers.
+    # A block of scores is 64 x 4,096 floats (2 MB at most), which stays
+    # in cache and bounds memory whatever the number of users and songs.
+    BATCH_USER_BLOCK_ROWS: int = 64
+    BATCH_SONG_BLOCK_ROWS: int = 4096
+
+    # Whether higher scores from get_top_scores are better; False for
+    # recommenders that return distances.
+    higher_is_better: bool = True
+
     @abstractmethod
     def recommend(self) -> list[Song]:
         ...
 
+    @abstractmethod
+    def get_top_scores(self, top_n: int | None = None) -> tuple[NDArray[np.intp], NDArray[np.floating]]:
+        """
+        Select the recommended songs without building Song objects, so callers can combine the
+        results of several recommenders and only materialize the final songs.
+
+        :param top_n: The number of songs to select, or None for the recommender's own number, so
+            callers can ask for a deeper ranking without building another recommender.
+        :return: Parallel arrays of the recommended catalog rows, best first, and their scores.
+        """
+        ...
+
+    @staticmethod
+    def get_top_rows(
+            scores: NDArray[np.floating],
+            top_n: int,
+            excluded: NDArray[np.bool_] | None = None,
+    ) -> NDArray[np.intp]:
+        """
+        Select the rows with the highest scores with a partial selection, which is O(n) instead
+        of sorting every score.
+
+        :param scores: The score of every song row.
+        :param top_n: The number of rows to select.
+        :param excluded: A mask of rows that must not be selected, such as SeenSongs.get_mask.
+            Excluded rows don't count towards the N, so N rows are still returned if there are.
+        :return: The top rows, best first. Equal scores are ordered by row, as in a stable sort.
+        """
+        if excluded is not None:
+            scores = np.where(excluded, -np.inf, scores)
+            top_n = min(top_n, len(scores) - int(np.count_nonzero(excluded)))
+        top_n = min(top_n, len(scores))
+        if top_n <= 0:
+            return np.zeros(0, dtype=np.intp)
+
+        # Every score above the N-th highest is kept, and ties with it are
+        # broken by row, so the result matches a full stable sort.
+        threshold: np.floating = -np.partition(-scores, top_n - 1)[top_n - 1]
+        better_rows: NDArray[np.intp] = np.flatnonzero(scores > threshold)
+        tied_rows: NDArray[np.intp] = np.flatnonzero(scores == threshold)[:top_n - len(better_rows)]
+        top_rows: NDArray[np.intp] = np.concatenate([better_rows, tied_rows])
+        return top_rows[np.lexsort((top_rows, -scores[top_rows]))]
+
+    @classmethod
+    def get_top_rows_batch(
+            cls,
+            score_block: Callable[[slice, slice], NDArray[np.floating]],
+            user_count: int,
+            song_count: int,
+            top_n: int,
+    ) -> tuple[NDArray[np.intp], NDArray[np.floating]]:
+        """
+        Select the top rows of many users, scoring one block of users and songs at a time. Each
+        user block keeps its running top N, and only the scores of later song blocks that reach a
+        user's running N-th best are merged into it, so memory use depends on the block sizes and
+        not on users x songs.
+
+        :param score_block: Returns the (user block, song block) scores for a slice of users and a
+            slice of song rows. Higher scores are better.
+        :param user_count: The number of users.
+        :param song_count: The number of songs.
+        :param top_n: The number of rows to select per user.
+        :return: The (user count, top N) top rows of each user, best first, and their scores. Equal
+            scores are ordered by row, as in get_top_rows.
+        """
+        top_n = max(min(top_n, song_count), 0)
+        top_rows: NDArray[np.intp] = np.zeros((user_count, top_n), dtype=np.intp)
+        top_scores: NDArray[np.floating] = np.zeros((user_count, top_n))
+        if top_n == 0:
+            return top_rows, top_scores
+
+        # The first song block is never smaller than N, so every user has a
+        # full top N after it.
+        first_block_rows: int = max(cls.BATCH_SONG_BLOCK_ROWS, top_n)
+
+        user_start: int
+        for user_start in range(0, user_count, cls.BATCH_USER_BLOCK_ROWS):
+            users: slice = slice(user_start, min(user_start + cls.BATCH_USER_BLOCK_ROWS, user_count))
+            block_user_count: int = users.stop - users.start
+
+            scores: NDArray[np.floating] = score_block(users, slice(0, first_block_rows))
+            best_rows: NDArray[np.intp] = np.array(
+                [cls.get_top_rows(user_scores, top_n) for user_scores in scores], dtype=np.intp
+            ).reshape(block_user_count, top_n)
+            best_scores: NDArray[np.floating] = np.take_along_axis(scores, best_rows, axis=1)
+
+            song_start: int
+            for song_start in range(first_block_rows, song_count, cls.BATCH_SONG_BLOCK_ROWS):
+                songs: slice = slice(song_start, min(song_start + cls.BATCH_SONG_BLOCK_ROWS, song_count))
+                scores = score_block(users, songs)
+
+                # Most songs score below every user's running N-th best, so
+                # only the few that reach it are merged, best first and then
+                # by row. A row maximum finds the users that have any.
+                merging_users: NDArray[np.intp] = np.flatnonzero(scores.max(axis=1) >= best_scores[:, -1])
+                if len(merging_users) == 0:
+                    continue
+                candidate_users: NDArray[np.intp]
+                candidate_columns: NDArray[np.intp]
+                candidate_users, candidate_columns = np.nonzero(
+                    scores[merging_users] >= best_scores[merging_users, -1:]
+                )
+                candidate_users = merging_users[candidate_users]
+
+                merged_users: NDArray[np.intp] = np.concatenate(
+                    [np.repeat(np.arange(block_user_count), top_n), candidate_users]
+                )
+                merged_rows: NDArray[np.intp] = np.concatenate([best_rows.ravel(), songs.start + candidate_columns])
+                merged_scores: NDArray[np.floating] = np.concatenate(
+                    [best_scores.ravel(), scores[candidate_users, candidate_columns]]
+                )
+                order: NDArray[np.intp] = np.lexsort((merged_rows, -merged_scores, merged_users))
+
+                # Keep the first N of each user; each user has at least N.
+                user_counts: NDArray[np.intp] = np.bincount(merged_users, minlength=block_user_count)
+                ranks: NDArray[np.intp] = np.arange(len(order)) - np.repeat(np.cumsum(user_counts) - user_counts,
+                                                                            user_counts)
+                kept: NDArray[np.intp] = order[ranks < top_n]
+                best_rows = merged_rows[kept].reshape(block_user_count, top_n)
+                best_scores = merged_scores[kept].reshape(block_user_count, top_n)
+
+            top_rows[users] = best_rows
+            if user_start == 0:
+                top_scores = np.empty((user_count, top_n), dtype=best_scores.dtype)
+            top_scores[users] = best_scores
+
+        return top_rows, top_scores
+
 
 class FeaturePrioritizationRecommender(Recommender):
-    def __init__(self, user_data, song_store: SongStore):
+    # The default number of songs to recommend.
+    DEFAULT_TOP_N: int = 10
+
+    def __init__(
+            self,
+            user_data,
+            song_store: SongStore,
+            top_n: int = DEFAULT_TOP_N,
+            user_profile: UserProfile | None = None,
+    ):
         """
         :param user_data: DataFrame containing user's listening history.
         :param song_store: Instance of SongStore to access song features.
+        :param top_n: The number of songs to recommend.
+        :param user_profile: The user's profile, whose seen songs are not recommended, or None.
         """
         self.user_data = user_data
         self.song_store = song_store
+        self.top_n = top_n
+        self.user_profile = user_profile
+
+    def get_feature_weights(self) -> NDArray[np.float64]:
+        """
+        Calculate the importance of each feature for a user from the standard deviation of the
+        features of the songs in their listening history. Without enough history to measure a
+        spread, every feature is weighted equally.
+
+        :return: The weight of each feature, in the order of SongStore.FEATURE_COLUMNS, summing to 1.
+        """
+        # Collect the feature rows of the songs in the user's listening history
+        rows: NDArray[np.intp] = self.song_store.get_rows_by_ids(self.user_data["song_id"])
+        rows = rows[rows >= 0]
+        feature_count: int = len(SongStore.FEATURE_COLUMNS)
+        if len(rows) < 2:
+            return np.full(feature_count, 1 / feature_count)
+
+        # Calculate the sample standard deviation of each feature, as pandas does
+        feature_std: NDArray[np.float64] = np.std(
+            np.asarray(self.song_store.feature_matrix[rows], dtype=np.float64), axis=0, ddof=1
+        )
+        if feature_std.sum() == 0:
+            return np.full(feature_count, 1 / feature_count)
+
+        # Normalize weights
+        return feature_std / feature_std.sum()
 
-    def prioritize_features(self):
+    def prioritize_features(self) -> dict[str, float]:
         """
         Calculate the importance of each feature for a user based on standard deviation.
         :return: A dictionary with feature names and their calculated weights.
         """
-        # Collect song features from the user's listening history
-        songs = self.user_data["song_id"].map(self.song_store.get_song_by_id)
-        feature_df = pd.DataFrame([song.to_dict() for song in songs])
+        return dict(zip(SongStore.FEATURE_COLUMNS, self.get_feature_weights().tolist()))
 
-        # Calculate standard deviation of features
-        feature_std = feature_df.std()
+    def score_rows(self, rows: NDArray[np.integer]) -> NDArray[np.floating]:
+        """
+        Score only some songs with the feature weights, such as a candidate shortlist.
+
+        :param rows: The song rows to score.
+        :return: The weighted score of each row; higher is better.
+        """
+        return np.asarray(self.song_store.feature_matrix[rows], dtype=np.float64) @ self.get_feature_weights()
+
+    def get_top_scores(self, top_n: int | None = None) -> tuple[NDArray[np.intp], NDArray[np.floating]]:
+        """
+        Score every song with one product of the feature matrix and the feature weights, and
+        select the top N.
 
-        # Normalize weights (optional)
-        weights = feature_std / feature_std.sum()
+        :param top_n: The number of songs to select, or None for self.top_n.
+        :return: The top song rows, best first, and their weighted scores.
+        """
+        # Calculate weighted scores for every song at once, in the precision the features are stored in
+        song_matrix = self.song_store.get_feature_matrix()
+        scores: NDArray[np.floating] = song_matrix @ self.get_feature_weights().astype(song_matrix.dtype)
 
-        return weights.to_dict()
+        # Songs the user has already seen are never recommended
+        seen: NDArray[np.bool_] | None = (
+            None if self.user_profile is None else self.user_profile.seen_songs.get_mask(self.song_store)
+        )
+        top_rows: NDArray[np.intp] = self.get_top_rows(scores, self.top_n if top_n is None else top_n, seen)
+        return top_rows, scores[top_rows]
 
     def recommend(self) -> list[Song]:
         """
         Generate recommendations by prioritizing features based on user data.
         :return: A list of recommended songs.
         """
-        # Prioritize features
-        feature_weights = self.prioritize_features()
-
-        # Retrieve all songs from the store
-        all_songs = self.song_store.get_all_songs()
-
-        # Calculate weighted scores for each song
-        recommendations = []
-        for song in all_songs:
-            score = sum(
-                song.features[feature] * weight
-                for feature, weight in feature_weights.items()
-                if feature in song.features
-            )
-            recommendations.append((song, score))
-
-        # Sort by score in descending order
-        recommendations = sorted(recommendations, key=lambda x: x[1], reverse=True)
-
-        # Return the top recommendations
-        return [rec[0] for rec in recommendations[:10]]  # Top 10 recommendations
+        top_rows: NDArray[np.intp]
+        top_rows, _ = self.get_top_scores()
+        return self.song_store.get_songs(top_rows)
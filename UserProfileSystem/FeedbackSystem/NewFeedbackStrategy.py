@@ -47,7 +47,9 @@ class NewFeedbackStrategy:
         profiles = self.load_profiles_from_json()
 
         # Check if the user's profile already exists
-        user_profile_data = user_profile.__dict__
+        user_profile_data = dict(user_profile.__dict__)
+        if "seen_songs" in user_profile_data:
+            user_profile_data["seen_songs"] = user_profile.seen_songs.to_json()
         for idx, profile in enumerate(profiles):
             if profile["user_id"] == user_id:
                 # Update the existing profile
@@ -116,6 +118,13 @@ class NewFeedbackStrategy:
             # Update the user's profile with the adjusted feature value
             setattr(user_profile, feature, new_feature_value)
 
+        # A rated song is not recommended again
+        if hasattr(user_profile, "seen_songs"):
+            user_profile.seen_songs.add(song.id)
+
+        # Mark the profile as changed, so cached recommendations for it are not reused
+        user_profile.version = getattr(user_profile, "version", 0) + 1
+
         # Save or update the user profile in the JSON file
         self.save_user_profile(user_id, user_profile)
 
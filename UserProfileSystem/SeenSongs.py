@@ -0,0 +1,145 @@
+import numpy as np
+from numpy.typing import NDArray
+
+from Data.SongStore import SongStore
+
+
+class SeenSongs:
+    """The songs a user has already rated or been shown, which the
+    recommenders exclude from their results.
+
+    The songs are kept as track IDs, which is what is saved with the
+    profile, since catalog deltas move songs between rows. For scoring,
+    they are also kept as a bitset over the rows of one song store and
+    catalog version, built on first use and updated in O(1) by add.
+    """
+
+    # The track IDs of the seen songs, in the order they were added.
+    song_ids: dict[str, None]
+
+    # The song store and catalog version the bitset was built for, and
+    # the bitset: bit (row % 8) of byte (row // 8) is set for seen rows.
+    _song_store: SongStore | None
+    _catalog_version: int
+    _bits: NDArray[np.uint8] | None
+
+    def __init__(
+            self: "SeenSongs",
+            song_ids: list[str] | None = None,
+    ) -> None:
+        """Initialize the seen songs.
+
+        Parameters:
+            song_ids (list[str] | None): The track IDs of the seen songs, e.g. as saved by to_json.
+        """
+
+        self.song_ids = dict.fromkeys(song_ids or [])
+        self._song_store = None
+        self._catalog_version = 0
+        self._bits = None
+
+    def __len__(self: "SeenSongs") -> int:
+        return len(self.song_ids)
+
+    def __contains__(self: "SeenSongs", song_id: str) -> bool:
+        return song_id in self.song_ids
+
+    def __getstate__(self: "SeenSongs") -> dict:
+        # The bitset is rebuilt on demand rather than pickled with the
+        # song store it refers to.
+        return {"song_ids": list(self.song_ids)}
+
+    def __setstate__(
+            self: "SeenSongs",
+            state: dict,
+    ) -> None:
+        self.__init__(state["song_ids"])
+
+    def to_json(self: "SeenSongs") -> list[str]:
+        """Return the track IDs of the seen songs, to save with the profile."""
+        return list(self.song_ids)
+
+    def add(
+            self: "SeenSongs",
+            song_id: str | None,
+    ) -> None:
+        """Mark a song as seen. If a bitset has been built, its bit is
+        set in place.
+
+        Parameters:
+            song_id (str | None): The track ID; None, for songs outside the catalog, is ignored.
+        """
+
+        if song_id is None or song_id in self.song_ids:
+            return
+        self.song_ids[song_id] = None
+
+        if self._bits is not None:
+            row: int | None = self._song_store.get_row_by_id(song_id)
+            if row is not None:
+                self._bits[row >> 3] |= np.uint8(1 << (row & 7))
+
+    def get_bits(
+            self: "SeenSongs",
+            song_store: SongStore,
+    ) -> NDArray[np.uint8]:
+        """Return the bitset of seen rows of a song store, rebuilding it
+        from the track IDs if the store or its catalog version changed.
+
+        Parameters:
+            song_store (SongStore): The song store whose rows the bits refer to.
+
+        Returns:
+            The (song count + 7) // 8 bytes of the bitset, least significant bit first.
+        """
+
+        if (self._bits is None or self._song_store is not song_store
+                or self._catalog_version != song_store.catalog_version):
+            rows: NDArray[np.intp] = song_store.get_rows_by_ids(self.song_ids)
+            mask: NDArray[np.bool_] = np.zeros(len(song_store), dtype=np.bool_)
+            mask[rows[rows >= 0]] = True
+            self._bits = np.packbits(mask, bitorder="little")
+            self._song_store = song_store
+            self._catalog_version = song_store.catalog_version
+        return self._bits
+
+    def get_mask(
+            self: "SeenSongs",
+            song_store: SongStore,
+    ) -> NDArray[np.bool_] | None:
+        """Return which rows of a song store have been seen, as a mask for
+        Recommender.get_top_rows.
+
+        Parameters:
+            song_store (SongStore): The song store whose rows are masked.
+
+        Returns:
+            The seen flag of every row, or None if no song has been seen.
+        """
+
+        if not self.song_ids:
+            return None
+        return np.unpackbits(self.get_bits(song_store), count=len(song_store), bitorder="little").view(np.bool_)
+
+    def get_row_mask(
+            self: "SeenSongs",
+            song_store: SongStore,
+            rows: NDArray[np.integer],
+    ) -> NDArray[np.bool_]:
+        """Return which of some rows of a song store have been seen,
+        reading only their bits, e.g. to filter sampled or candidate rows
+        without a mask of the whole catalog.
+
+        Parameters:
+            song_store (SongStore): The song store whose rows are checked.
+            rows (NDArray[np.integer]): The rows to check.
+
+        Returns:
+            The seen flag of each row.
+        """
+
+        rows = np.asarray(rows, dtype=np.intp)
+        if not self.song_ids:
+            return np.zeros(len(rows), dtype=np.bool_)
+        bits: NDArray[np.uint8] = self.get_bits(song_store)
+        return ((bits[rows >> 3] >> (rows & 7)) & 1).astype(np.bool_)
@@ -7,6 +7,7 @@ from typing import List, Optional
 from numpy._typing import NDArray
 
 from Data.Song import Song
+from UserProfileSystem.SeenSongs import SeenSongs
 import numpy as np
 import os
 import Data.constants as c
@@ -14,6 +15,9 @@ import Data.constants as c
 class UserProfile:
     DEFAULT_TOP_N: int = 5
 
+    # The exploration probability of a new profile.
+    DEFAULT_EPSILON: float = 0.1
+
     user_id: str
 
     acousticness: float
@@ -43,6 +47,18 @@ class UserProfile:
 
     song_count: int
 
+    # The songs the user has rated or been shown, which are not
+    # recommended again.
+    seen_songs: SeenSongs
+
+    # Incremented on every change to the profile, and saved with it, so
+    # results computed for an older version can be told apart.
+    version: int
+
+    # The probability that each recommended slot is an exploration pick
+    # rather than a ranked song (see EpsilonGreedyExplorer).
+    epsilon: float
+
     def __init__(
             self: "UserProfile",
             user_id: str,
@@ -72,6 +88,10 @@ class UserProfile:
         # Count total songs processed for averaging
         self.song_count = 0
 
+        self.seen_songs = SeenSongs()
+        self.version = 0
+        self.epsilon = self.DEFAULT_EPSILON
+
     def __repr__(self: "UserProfile") -> str:
         return (f"UserProfile(danceability={self.danceability:.2f}, energy={self.energy:.2f}, "
                 f"valence={self.valence:.2f}, acousticness={self.acousticness:.2f}, "
@@ -129,6 +149,9 @@ class UserProfile:
                         user_profile.artists = Counter(user_data.get('artists', {}))
                         user_profile.popular_tracks = Counter(user_data.get('popular_tracks', {}))
                         user_profile.song_count = user_data.get('song_count', 0)
+                        user_profile.seen_songs = SeenSongs(user_data.get('seen_songs', []))
+                        user_profile.version = user_data.get('version', 0)
+                        user_profile.epsilon = user_data.get('epsilon', UserProfile.DEFAULT_EPSILON)
                         return user_profile
 
         raise FileNotFoundError(f"Cannot find JSON file '{os.path.realpath(user_profiles_json)}'")
@@ -232,6 +255,7 @@ class UserProfile:
 
         # Increment song count
         self.song_count += 1
+        self.version += 1
 
     def update_profile_with_songs(
             self: "UserProfile",
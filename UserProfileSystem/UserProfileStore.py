@@ -6,6 +6,7 @@ from typing import Optional, TextIO
 from UserProfileSystem.UserProfile import UserProfile  # <-- Make sure this import is present
 
 from UserProfileSystem.UserProfile import UserProfile
+from UserProfileSystem.SeenSongs import SeenSongs
 
 import Data.constants as c
 
@@ -102,6 +103,9 @@ class UserProfileStore:
                     user_profile.artists = Counter(user_data['artists'])
                     # user_profile.popular_tracks = Counter(user_data['popular_tracks'])
                     user_profile.song_count = user_data['song_count']
+                    user_profile.seen_songs = SeenSongs(user_data.get('seen_songs', []))
+                    user_profile.version = user_data.get('version', 0)
+                    user_profile.epsilon = user_data.get('epsilon', UserProfile.DEFAULT_EPSILON)
                     return user_profile
                 else:
                     print(f"user_id {user_id} not found in user_profiles: {user_profiles}")
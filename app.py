@@ -5,9 +5,16 @@ from requests import get_recommendations, feedback_system
 # create the Flask app
 app = Flask(__name__)
 
+# Pass the next_cursor of a response as the cursor query string to get
+# the next page of recommendations
 @app.route('/recommendations')
 def get_recommendation():
-    data = get_recommendations('1')
+    cursor = request.args.get('cursor')
+    page_size = request.args.get('page_size', type=int)
+    try:
+        data = get_recommendations('1', cursor=cursor, page_size=page_size)
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
     return jsonify(data)
 
 # Add query string for getting feedback
@@ -1,23 +1,29 @@
-import json
-from Data.Song import Song
+import os
+import sys
+
 from Data.SongStore import SongStore
-from RecommendationSystem.Aggregator import Aggregator
-from RecommendationSystem.Algorithms.CosineSimiliarity import CosineSimilarity
-from RecommendationSystem.Algorithms.KNN import KNNRecommender
-from RecommendationSystem.ColdStart.RandomSamplingStrategy import RandomSamplingStrategy
-from UserProfileSystem.FeedbackSystem.LikeDislikeFeedbackStrategy import LikeDislikeFeedbackStrategy
-from UserProfileSystem.UserProfile import UserProfile
-from UserProfileSystem.UserProfileStore import UserProfileStore
-from RecommendationSystem.Recommender import FeaturePrioritizationRecommender
-import pickle
+from RecommendationSystem.Algorithms.ANNRecommender import ANNRecommender
+
+SONG_DATABASE_CSV: str = "tracks_features.csv"
+SNAPSHOT_DIRNAME: str = "static_song_store"
+
+# The loader starts worker processes, which re-import this module, so
+# the work must only run from the main process.
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # Apply a delta file from the Data directory to the existing
+        # snapshot instead of rebuilding it, e.g.
+        # python create_static_song.py tracks_delta.csv
+        song_store = SongStore.from_snapshot(SNAPSHOT_DIRNAME)
+        song_store.apply_delta(sys.argv[1])
+    else:
+        song_store = SongStore(SONG_DATABASE_CSV, workers=os.cpu_count() or 1)
 
-song_store = SongStore("tracks_features.csv")
-# Data to be written
-config_data = song_store.get_all_songs()
-config_filename = "static_song_store.pkl"
+    # Write the catalog as a memory-mappable snapshot for the server to open
+    song_store.save_snapshot(SNAPSHOT_DIRNAME)
 
-# Writing the dictionary to a file in JSON format
-with open(config_filename, 'wb') as config_file:
-    pickle.dump(config_data, config_file)
+    # Build the approximate nearest-neighbour indexes next to it, so the
+    # server does not build them on its first request
+    ANNRecommender.save_indexes(SongStore.from_snapshot(SNAPSHOT_DIRNAME))
 
-print(f"Data successfully written to {config_filename}")
\ No newline at end of file
+    print(f"Data successfully written to {SNAPSHOT_DIRNAME}")
@@ -7,7 +7,8 @@ from Data.SongStore import SongStore
 from RecommendationSystem.Aggregator import Aggregator
 from RecommendationSystem.Algorithms.CosineSimiliarity import CosineSimilarity
 from RecommendationSystem.Algorithms.KNN import KNNRecommender
-from RecommendationSystem.ColdStart.RandomSamplingStrategy import RandomSamplingStrategy
+from RecommendationSystem.ColdStart.WeightedSamplingStrategy import WeightedSamplingStrategy
+from RecommendationSystem.EpsilonGreedyExplorer import EpsilonGreedyExplorer
 from UserProfileSystem.FeedbackSystem.NewFeedbackStrategy import NewFeedbackStrategy
 from UserProfileSystem.UserProfile import UserProfile
 from UserProfileSystem.UserProfileStore import UserProfileStore
@@ -33,11 +34,9 @@ def main() -> None:
     # Load the dataset into memory.
     print(f"\nLoading song data into memory from '{SONG_DATABASE_CSV}'...")
 
-    song_store: SongStore = SongStore(file_name=SONG_DATABASE_CSV)
-
-    # Get list of all songs from data.
-    print("\nGetting all songs...")
-    all_songs: list[Song] = song_store.get_all_songs()
+    # Only the features are needed for scoring; song names, albums and
+    # artists are read from the file for the recommended songs.
+    song_store: SongStore = SongStore(file_name=SONG_DATABASE_CSV, workers=os.cpu_count() or 1, features_only=True)
 
     # Load user profile database from file.
     # TODO: are we using csv or json user database?
@@ -56,14 +55,17 @@ def main() -> None:
     print(f"\nUser profile ID#{user_profile.user_id}:\n{user_profile}")
 
     # cold start strategy
-    random_sampling_strategy: RandomSamplingStrategy = RandomSamplingStrategy(all_songs=all_songs)
+    weighted_sampling_strategy: WeightedSamplingStrategy = WeightedSamplingStrategy(song_store=song_store)
+
+    # exploration stage, drawing from the cold start strategy's alias table
+    explorer: EpsilonGreedyExplorer = EpsilonGreedyExplorer(sampler=weighted_sampling_strategy)
 
     # feedback strategy
     feedback_strategy: NewFeedbackStrategy = NewFeedbackStrategy()
 
     # recommendation algorithms
-    cosine_similarity: CosineSimilarity = CosineSimilarity(user_profile=user_profile, all_songs=all_songs)
-    knn: KNNRecommender = KNNRecommender(user_profile=user_profile, all_songs=all_songs)
+    cosine_similarity: CosineSimilarity = CosineSimilarity(user_profile=user_profile, song_store=song_store)
+    knn: KNNRecommender = KNNRecommender(user_profile=user_profile, song_store=song_store)
 
     # recommender
     recommender_aggregator: Aggregator = Aggregator(
@@ -71,8 +73,10 @@ def main() -> None:
         recommenders=[cosine_similarity, knn],
         weights=[COSINE_SIMILARITY_WEIGHT, KNN_WEIGHT],
         user_profile_store=user_profile_store,
-        cold_start_strategy=random_sampling_strategy,
+        cold_start_strategy=weighted_sampling_strategy,
         feedback_strategy=feedback_strategy,  # Pass feedback strategy to aggregator
+        execution_mode="thread",
+        explorer=explorer,
     )
 
     # Get the top 3 popular songs for cold start
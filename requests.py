@@ -1,10 +1,14 @@
 from Data.Song import Song
 import Data.constants as c
 from Data.SongStore import SongStore
+from Data.SongSnapshot import SongSnapshotReader
 from RecommendationSystem.Aggregator import Aggregator
 from RecommendationSystem.Algorithms.CosineSimiliarity import CosineSimilarity
 from RecommendationSystem.Algorithms.KNN import KNNRecommender
-from RecommendationSystem.ColdStart.RandomSamplingStrategy import RandomSamplingStrategy
+from RecommendationSystem.ColdStart.WeightedSamplingStrategy import WeightedSamplingStrategy
+from RecommendationSystem.EpsilonGreedyExplorer import EpsilonGreedyExplorer
+from RecommendationSystem.MMRReranker import MMRReranker
+from RecommendationSystem.RecommendationCache import RecommendationCache
 from UserProfileSystem.FeedbackSystem.FeedbackStrategy import FeedbackStrategy
 from UserProfileSystem.FeedbackSystem.LikeDislikeFeedbackStrategy import LikeDislikeFeedbackStrategy
 from UserProfileSystem.FeedbackSystem.NewFeedbackStrategy import NewFeedbackStrategy
@@ -14,7 +18,7 @@ from RecommendationSystem.Recommender import FeaturePrioritizationRecommender
 import pickle
 import os
 
-config_filename = "static_song_store.pkl"
+snapshot_dirname = "static_song_store"
 recommender_file = "static_recommender.pkl"
 userstore_file = "static_userstore.pkl"
 
@@ -27,15 +31,56 @@ USERS_DATABASE_JSON = 'user_profiles.json'
 COSINE_SIMILARITY_WEIGHT: float = 0.5
 KNN_WEIGHT: float = 0.5
 
-def get_recommendations(user_id: str):
+# The weight of relevance against diversity when the fused songs are
+# re-ranked, and the most songs of one artist a list may have.
+DIVERSITY_RELEVANCE_WEIGHT: float = 0.7
+ARTIST_CAP: int = 2
+
+# The seconds each recommender has to answer a request; a late one is
+# left out of that response.
+RECOMMENDER_TIMEOUT: float = 10.0
+
+# Recommended rows by user, profile version and catalog version, shared
+# by the requests of this process and the aggregators they unpickle.
+_recommendation_cache: RecommendationCache = RecommendationCache.get_shared("recommendations")
+
+# The song catalog, opened once per process from the snapshot, and
+# reopened when a delta has been applied to the snapshot.
+_song_store: SongStore | None = None
+
+# The cold start strategy of the open song catalog, whose alias table is
+# built once per catalog version.
+_cold_start_strategy: WeightedSamplingStrategy | None = None
+
+
+def get_song_store() -> SongStore:
+    global _song_store
+    if _song_store is None:
+        _song_store = SongStore.from_snapshot(snapshot_dirname)
+    else:
+        try:
+            catalog_version = SongSnapshotReader.read_manifest(snapshot_dirname).get("catalog_version", 0)
+            if catalog_version != _song_store.catalog_version:
+                _song_store = SongStore.from_snapshot(snapshot_dirname)
+        except Exception as error:
+            # The snapshot is missing, being swapped or unreadable; keep
+            # serving the open one and retry on the next request.
+            print(f"\nCannot reopen song snapshot '{os.path.realpath(snapshot_dirname)}': {error}")
+    return _song_store
+
+def get_cold_start_strategy(song_store: SongStore) -> WeightedSamplingStrategy:
+    global _cold_start_strategy
+    if _cold_start_strategy is None or _cold_start_strategy.song_store is not song_store:
+        _cold_start_strategy = WeightedSamplingStrategy(song_store=song_store)
+    return _cold_start_strategy
+
+def get_recommendations(user_id: str, cursor: str | None = None, page_size: int | None = None):
     print("Current Working Directory:", os.getcwd())
 
     print(f"\nWelcome to SoundSage!")
 
     # Load existing song and user data
-    print(f"\nLoading song data from {os.path.realpath(config_filename)}")
-    with open(config_filename, 'rb') as config_file:
-        all_songs = pickle.load(config_file)
+    song_store: SongStore = get_song_store()
     # Load user profile database from file.
     # TODO: are we using csv or json user database?
     print(
@@ -55,14 +100,22 @@ def get_recommendations(user_id: str):
     print(f"\nUser profile ID#{user_profile.user_id}:\n{user_profile}")
 
     # cold start strategy
-    random_sampling_strategy: RandomSamplingStrategy = RandomSamplingStrategy(all_songs=all_songs)
+    weighted_sampling_strategy: WeightedSamplingStrategy = get_cold_start_strategy(song_store)
+
+    # exploration stage, drawing from the cold start strategy's alias table
+    explorer: EpsilonGreedyExplorer = EpsilonGreedyExplorer(sampler=weighted_sampling_strategy)
+
+    # diversity re-ranker
+    reranker: MMRReranker = MMRReranker(
+        song_store, relevance_weight=DIVERSITY_RELEVANCE_WEIGHT, artist_cap=ARTIST_CAP
+    )
 
     # feedback strategy
     feedback_strategy: NewFeedbackStrategy = NewFeedbackStrategy()
 
     # recommendation algorithms
-    cosine_similarity: CosineSimilarity = CosineSimilarity(user_profile=user_profile, all_songs=all_songs)
-    knn: KNNRecommender = KNNRecommender(user_profile=user_profile, all_songs=all_songs)
+    cosine_similarity: CosineSimilarity = CosineSimilarity(user_profile=user_profile, song_store=song_store)
+    knn: KNNRecommender = KNNRecommender(user_profile=user_profile, song_store=song_store, use_spatial_index=True)
 
     # recommender
     recommender_aggregator: Aggregator = Aggregator(
@@ -70,14 +123,28 @@ def get_recommendations(user_id: str):
         recommenders=[cosine_similarity, knn],
         weights=[COSINE_SIMILARITY_WEIGHT, KNN_WEIGHT],
         user_profile_store=user_profile_store,
-        cold_start_strategy=random_sampling_strategy,
+        cold_start_strategy=weighted_sampling_strategy,
         feedback_strategy=feedback_strategy,  # Pass feedback strategy to aggregator
+        execution_mode="thread",
+        timeouts=[RECOMMENDER_TIMEOUT, RECOMMENDER_TIMEOUT],
+        result_cache=_recommendation_cache,
+        explorer=explorer,
+        reranker=reranker,
     )
+    # Get the next page of the user's ranked songs that they have not
+    # seen; a buffer of ranked songs is kept in the recommendation cache
+    # per profile version
+    print("\nGetting recommended songs...")
+    recommended_songs: list[Song]
+    next_cursor: str | None
+    recommended_songs, next_cursor = recommender_aggregator.get_page(cursor, page_size)
+    print(f"Recommendation cache: {_recommendation_cache.hits} hits, {_recommendation_cache.misses} misses.")
+
+    # Save the served songs as seen, so the next ranking leaves them out
+    if recommender_aggregator.user_profile is not None:
+        feedback_strategy.save_user_profile(user_id, recommender_aggregator.user_profile)
     create_static_data(recommender_file, "wb", recommender_aggregator)
     create_static_data(userstore_file, "wb", user_profile_store)
-    # Get the top 3 popular songs for cold start
-    print("\nGetting recommended songs...")
-    recommended_songs: list[Song] = recommender_aggregator.recommend()
 
     # Convert recommendations into a JSON-compatible format
     # response = {
@@ -96,6 +163,7 @@ def get_recommendations(user_id: str):
     response = {
         "recommendations": [
             {
+                "id": song.id,
                 "name": song.name,
                 "artists": song.artists,
                 "acousticness": song.acousticness,
@@ -110,7 +178,8 @@ def get_recommendations(user_id: str):
                 "user_id": user_id,
             }
             for song in recommended_songs
-        ]
+        ],
+        "next_cursor": next_cursor,
     }   
     return response
 
@@ -126,11 +195,13 @@ def feedback_system(song_info: dict, rating: int, user_id: str):
     user_profile_store = load_static_data(userstore_file, "rb")
     # Collect feedback from the user for each recommended song
     print("\nProviding feedback...")
-    # Build the song object
-    feedback_song = Song(id=None, album=None, album_id=None, artist_ids=None, track_number=0, disc_number=0, explicit=False, key=c.KEY_MIN, mode=c.MODE_MINOR, duration_ms=0, time_signature=c.TIME_SIG_MIN, year=2000, release_date=2000, popularity=None, name=song_info["name"], artists=song_info["artists"], acousticness=song_info["acousticness"], 
-                            danceability=song_info["danceability"], energy=song_info["energy"], instrumentalness=song_info["instrumentalness"], 
-                            liveness=song_info["liveness"], loudness=song_info["loudness"], speechiness=song_info["speechiness"], tempo=song_info["tempo"], valence=song_info["valence"], 
-                            )
+    # Look up the rated song in the catalog, or build it from the request
+    feedback_song = get_song_store().get_song_by_id(song_info["id"]) if "id" in song_info else None
+    if feedback_song is None:
+        feedback_song = Song(id=None, album=None, album_id=None, artist_ids=None, track_number=0, disc_number=0, explicit=False, key=c.KEY_MIN, mode=c.MODE_MINOR, duration_ms=0, time_signature=c.TIME_SIG_MIN, year=2000, release_date=2000, popularity=None, name=song_info["name"], artists=song_info["artists"], acousticness=song_info["acousticness"], 
+                                danceability=song_info["danceability"], energy=song_info["energy"], instrumentalness=song_info["instrumentalness"], 
+                                liveness=song_info["liveness"], loudness=song_info["loudness"], speechiness=song_info["speechiness"], tempo=song_info["tempo"], valence=song_info["valence"], 
+                                )
     feedback = {feedback_song: rating}
     recommender_aggregator.apply_feedback_to_profile(feedback)
 
@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+from Data.SongStore import SongStore
+from RecommendationSystem.Algorithms.ANNRecommender import ANNRecommender
+from RecommendationSystem.Algorithms.CosineSimiliarity import CosineSimilarity
+from RecommendationSystem.Algorithms.KNN import KNNRecommender
+from UserProfileSystem.UserProfile import UserProfile
+from verify_feature_storage import SONG_DATABASE_CSV, TOP_N, get_probe_user_profiles
+
+# The probe counts compared.
+PROBE_COUNTS: list[int] = [1, 2, 4, 8, 16, 32]
+
+# The numbers of product quantization subspaces compared; 0 is no PQ.
+PQ_SUBSPACE_COUNTS: list[int] = [0, 3]
+
+
+def get_exact_rows(song_store: SongStore, user_profiles: list[UserProfile], metric: str) -> list[set[int]]:
+    """
+    Return the exact top-N rows of every user for a metric, from CosineSimilarity or KNNRecommender.
+    """
+    exact_rows: list[set[int]] = []
+    for user_profile in user_profiles:
+        if metric == "cosine":
+            rows, _ = CosineSimilarity(user_profile=user_profile, song_store=song_store, top_n=TOP_N).get_top_scores()
+        else:
+            rows, _ = KNNRecommender(user_profile=user_profile, song_store=song_store, k=TOP_N).get_top_scores()
+        exact_rows.append(set(rows.tolist()))
+    return exact_rows
+
+
+def main() -> None:
+    """
+    Report the recall@N of the IVF index against the exact cosine similarity and KNN results, and
+    its query time, for a range of probe counts with and without product quantization.
+    """
+    song_database_csv: str = sys.argv[1] if len(sys.argv) > 1 else SONG_DATABASE_CSV
+    song_store: SongStore = SongStore(song_database_csv, workers=os.cpu_count() or 1, features_only=True)
+    user_profiles: list[UserProfile] = get_probe_user_profiles(song_store)
+
+    for metric in ANNRecommender.METRICS:
+        start: float = time.perf_counter()
+        exact_rows: list[set[int]] = get_exact_rows(song_store, user_profiles, metric)
+        exact_ms: float = (time.perf_counter() - start) * 1000 / len(user_profiles)
+
+        print(f"\nRecall@{TOP_N} against exact {metric} ({exact_ms:.2f} ms per query):")
+        print(f"    {'pq subspaces':>12} {'probes':>6} {'mean recall':>12} {'min recall':>11} {'ms per query':>13}")
+        for pq_subspace_count in PQ_SUBSPACE_COUNTS:
+            # Build the index before timing the queries.
+            ANNRecommender(user_profiles[0], song_store, metric, TOP_N, pq_subspace_count=pq_subspace_count).get_index()
+
+            for probes in PROBE_COUNTS:
+                recalls: list[float] = []
+                start = time.perf_counter()
+                for user_profile, exact in zip(user_profiles, exact_rows):
+                    rows, _ = ANNRecommender(user_profile, song_store, metric, TOP_N, probes,
+                                             pq_subspace_count).get_top_scores()
+                    recalls.append(len(exact & set(rows.tolist())) / max(len(exact), 1))
+                query_ms: float = (time.perf_counter() - start) * 1000 / len(user_profiles)
+                print(f"    {pq_subspace_count:>12} {probes:>6} {np.mean(recalls):>12.1%} {np.min(recalls):>11.1%} "
+                      f"{query_ms:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import contextlib
+import copy
+import io
+import os
+import random
+import sys
+
+import numpy as np
+
+from Data.SongStore import SongStore
+from RecommendationSystem.Algorithms.CosineSimiliarity import CosineSimilarity
+from RecommendationSystem.Algorithms.KNN import KNNRecommender
+from UserProfileSystem.UserProfile import UserProfile
+
+SONG_DATABASE_CSV: str = "tracks_features.csv"
+
+# The number of simulated users, and the number of random songs each
+# of their profiles is built from.
+PROBE_USER_COUNT: int = 50
+PROBE_SONG_COUNT: int = 10
+
+# The number of recommendations compared per user.
+TOP_N: int = 10
+
+RANDOM_SEED: int = 0
+
+
+def get_probe_user_profiles(song_store: SongStore) -> list[UserProfile]:
+    """
+    Simulate users whose features average those of random songs of the catalog.
+    """
+    rng: random.Random = random.Random(RANDOM_SEED)
+    user_profiles: list[UserProfile] = []
+    for user_id in range(PROBE_USER_COUNT):
+        rows: list[int] = rng.sample(range(len(song_store)), min(PROBE_SONG_COUNT, len(song_store)))
+        user_profile: UserProfile = UserProfile(user_id=f"probe-{user_id}")
+        for feature, value in zip(SongStore.FEATURE_COLUMNS, song_store.feature_matrix[rows].mean(axis=0)):
+            setattr(user_profile, feature, float(value))
+        user_profile.song_count = len(rows)
+        user_profiles.append(user_profile)
+    return user_profiles
+
+
+def get_recommended_ids(song_store: SongStore, user_profiles: list[UserProfile]) -> dict[str, list[set[str]]]:
+    """
+    Run the cosine similarity and KNN recommenders for every user and return the recommended track IDs.
+    """
+    recommended_ids: dict[str, list[set[str]]] = {"cosine similarity": [], "knn": []}
+    for user_profile in user_profiles:
+        # The recommenders print every recommendation; keep the report readable.
+        with contextlib.redirect_stdout(io.StringIO()):
+            cosine_songs = CosineSimilarity(user_profile=user_profile, song_store=song_store, top_n=TOP_N).recommend()
+            knn_songs = KNNRecommender(user_profile=user_profile, song_store=song_store, k=TOP_N).recommend(TOP_N)
+        recommended_ids["cosine similarity"].append({song.id for song in cosine_songs})
+        recommended_ids["knn"].append({song.id for song in knn_songs})
+    return recommended_ids
+
+
+def main() -> None:
+    """
+    Compare recommendations on compact feature storage against full precision, and report the
+    top-N overlap and the feature matrix memory of each storage type.
+    """
+    song_database_csv: str = sys.argv[1] if len(sys.argv) > 1 else SONG_DATABASE_CSV
+    song_store: SongStore = SongStore(song_database_csv, workers=os.cpu_count() or 1, features_only=True)
+
+    user_profiles: list[UserProfile] = get_probe_user_profiles(song_store)
+
+    print(f"\nScoring {PROBE_USER_COUNT} simulated users at full precision...")
+    reference_ids: dict[str, list[set[str]]] = get_recommended_ids(song_store, user_profiles)
+
+    print(f"\nTop-{TOP_N} overlap with full precision:")
+    print(f"    {'storage':<10} {'matrix bytes':>14} {'max feature error':>18}   "
+          + "   ".join(f"{name:>22}" for name in reference_ids))
+    for feature_storage in SongStore.FEATURE_STORAGE_TYPES:
+        compact_store: SongStore = copy.copy(song_store)
+        compact_store.set_feature_storage(feature_storage)
+        compact_ids: dict[str, list[set[str]]] = get_recommended_ids(compact_store, user_profiles)
+        feature_error: float = float(np.max(np.abs(compact_store.feature_matrix[:] - song_store.feature_matrix),
+                                            initial=0.0))
+
+        overlaps: list[str] = []
+        for name, reference in reference_ids.items():
+            overlap: list[float] = [len(a & b) / max(len(a), 1) for a, b in zip(reference, compact_ids[name])]
+            overlaps.append(f"mean {np.mean(overlap):6.1%} min {np.min(overlap):6.1%}")
+        print(f"    {feature_storage:<10} {compact_store.feature_matrix.nbytes:>14,} {feature_error:>18.6g}   "
+              + "   ".join(f"{overlap:>22}" for overlap in overlaps))
+
+
+if __name__ == "__main__":
+    main()
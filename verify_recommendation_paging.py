@@ -0,0 +1,168 @@
+import contextlib
+import copy
+import io
+import os
+import pickle
+import sys
+import tempfile
+
+from Data.SongStore import SongStore
+from RecommendationSystem.Aggregator import Aggregator
+from RecommendationSystem.Algorithms.CosineSimiliarity import CosineSimilarity
+from RecommendationSystem.Algorithms.KNN import KNNRecommender
+from RecommendationSystem.ColdStart.RandomSamplingStrategy import RandomSamplingStrategy
+from RecommendationSystem.RecommendationCache import RecommendationCache
+from UserProfileSystem.FeedbackSystem.NewFeedbackStrategy import NewFeedbackStrategy
+from UserProfileSystem.UserProfile import UserProfile
+from verify_feature_storage import SONG_DATABASE_CSV, get_probe_user_profiles
+
+# The number of pages served per user, and the songs per page.
+PAGE_COUNT: int = 4
+PAGE_SIZE: int = 5
+
+# The number of simulated users paged through.
+PAGED_USER_COUNT: int = 10
+
+
+class ProbeProfileStore:
+    """
+    Serves one simulated user profile to an Aggregator, as UserProfileStore serves a saved one.
+    """
+
+    def __init__(self, user_profile: UserProfile) -> None:
+        self.user_profile = user_profile
+
+    def get_user_profile(self, user_id: str) -> UserProfile | None:
+        return self.user_profile if user_id == self.user_profile.user_id else None
+
+
+def get_aggregator(
+        song_store: SongStore,
+        user_profile: UserProfile,
+        recommender_names: list[str],
+        result_cache: RecommendationCache,
+        feedback_strategy: NewFeedbackStrategy,
+) -> Aggregator:
+    """
+    Build the aggregator of one request, as requests.get_recommendations does.
+    """
+    recommenders: list = []
+    for name in recommender_names:
+        if name == "cosine similarity":
+            recommenders.append(CosineSimilarity(user_profile=user_profile, song_store=song_store))
+        else:
+            recommenders.append(KNNRecommender(user_profile=user_profile, song_store=song_store, use_spatial_index=True))
+    return Aggregator(
+        user_id=user_profile.user_id,
+        recommenders=recommenders,
+        weights=[1.0] * len(recommenders),
+        user_profile_store=ProbeProfileStore(user_profile),
+        cold_start_strategy=RandomSamplingStrategy(song_store=song_store),
+        feedback_strategy=feedback_strategy,
+        result_cache=result_cache,
+    )
+
+
+def get_paged_ids(
+        song_store: SongStore,
+        user_profile: UserProfile,
+        recommender_names: list[str],
+        feedback_strategy: NewFeedbackStrategy,
+        shared_cache: bool,
+) -> list[str]:
+    """
+    Page through a user's recommendations with one request per page, and return the served track
+    IDs. Every request starts from a copy of the profile saved by the one before, and either shares
+    one recommendation cache with the other requests or gets an empty one, as after the cache
+    expired or in another worker process.
+    """
+    saved_profile: UserProfile = copy.deepcopy(user_profile)
+    result_cache: RecommendationCache = RecommendationCache()
+    served_ids: list[str] = []
+    cursor: str | None = None
+    for _ in range(PAGE_COUNT):
+        request_profile: UserProfile = copy.deepcopy(saved_profile)
+        aggregator: Aggregator = get_aggregator(
+            song_store, request_profile, recommender_names,
+            result_cache if shared_cache else RecommendationCache(), feedback_strategy
+        )
+        with contextlib.redirect_stdout(io.StringIO()):
+            page, cursor = aggregator.get_page(cursor, PAGE_SIZE)
+        served_ids.extend(song.id for song in page)
+        saved_profile = request_profile
+    return served_ids
+
+
+def verify_cache_invalidation(
+        song_store: SongStore,
+        user_profile: UserProfile,
+        feedback_strategy: NewFeedbackStrategy,
+) -> bool:
+    """
+    Pickle and unpickle an aggregator whose cache is shared by name, as requests.py does between
+    the recommendation and feedback requests, and check that feedback through the unpickled
+    aggregator drops the user's entries from the cache that served the recommendations.
+    """
+    result_cache: RecommendationCache = RecommendationCache.get_shared("verify_recommendation_paging")
+    aggregator: Aggregator = get_aggregator(
+        song_store, copy.deepcopy(user_profile), ["cosine similarity"], result_cache, feedback_strategy
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        page, _ = aggregator.get_page(None, PAGE_SIZE)
+        cached_count: int = len(result_cache)
+        unpickled: Aggregator = pickle.loads(pickle.dumps(aggregator))
+        unpickled.apply_feedback_to_profile({page[0]: 5})
+    shared: bool = unpickled.result_cache is result_cache
+    print(f"\nUnpickled aggregator shares the cache: {shared}; "
+          f"cached entries before feedback {cached_count}, after {len(result_cache)}")
+    return shared and cached_count > 0 and len(result_cache) == 0
+
+
+def main() -> None:
+    """
+    Page through the recommendations of simulated users with the recommendation cache shared by
+    every request and with it cleared between requests, and report whether any song was served
+    twice or skipped. Then check that feedback invalidates the shared cache across a pickle round
+    trip of the aggregator.
+    """
+    song_database_csv: str = sys.argv[1] if len(sys.argv) > 1 else SONG_DATABASE_CSV
+    song_store: SongStore = SongStore(song_database_csv, workers=os.cpu_count() or 1)
+    user_profiles: list[UserProfile] = get_probe_user_profiles(song_store)[:PAGED_USER_COUNT]
+    failures: int = 0
+
+    with tempfile.TemporaryDirectory() as temp_dirname:
+        feedback_strategy: NewFeedbackStrategy = NewFeedbackStrategy(
+            profile_file=os.path.join(temp_dirname, "user_profiles.json")
+        )
+
+        print(f"\nPaging through {PAGE_COUNT} pages of {PAGE_SIZE} for {len(user_profiles)} simulated users:")
+        print(f"    {'recommenders':<30} {'repeated songs':>15} {'skipped songs':>14}")
+        recommender_names: list[str]
+        for recommender_names in [["cosine similarity"], ["cosine similarity", "knn"]]:
+            repeated_count: int = 0
+            skipped_count: int = 0
+            for user_profile in user_profiles:
+                shared_ids: list[str] = get_paged_ids(
+                    song_store, user_profile, recommender_names, feedback_strategy, shared_cache=True
+                )
+                cleared_ids: list[str] = get_paged_ids(
+                    song_store, user_profile, recommender_names, feedback_strategy, shared_cache=False
+                )
+                repeated_count += len(cleared_ids) - len(set(cleared_ids))
+                # A single recommender ranks the unseen songs in the same
+                # order however often it is rebuilt; fused rankings may
+                # reorder them, so only repeats are counted for those.
+                if len(recommender_names) == 1:
+                    skipped_count += len(set(shared_ids) - set(cleared_ids))
+            failures += repeated_count + skipped_count
+            print(f"    {' + '.join(recommender_names):<30} {repeated_count:>15} {skipped_count:>14}")
+
+        if not verify_cache_invalidation(song_store, user_profiles[0], feedback_strategy):
+            failures += 1
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()